@@ -0,0 +1,436 @@
+"""
+This file contains a single-pass parser for Oryx loss articles.
+
+parse_oryx used to build a full BeautifulSoup tree of the whole article, then re-run
+uncompiled regexes on every <li>, scan all of global_vars.manufacturer_dict for every
+flag and look up production years through df.loc one row at a time.
+This engine instead walks the raw HTML once with a compiled tokenizer, uses the
+compiled patterns in parser_helpers, caches flag lookups by image link and reads
+production years from a plain dict. It yields its output as a generator.
+
+The vehicle type of every entry is read from the <h3> heading its section starts with
+("Tanks (3617, of which destroyed: ...)") and mapped onto the repo's type names through
+global_vars.section_heading_types, instead of changing only when a name from the
+hand-made global_vars "first entry" dicts comes up, which broke silently whenever Oryx
+reordered its entries. So the types can differ from the BeautifulSoup version of
+parse_oryx; everything else it yields is the same. That was only checked on synthetic
+articles rebuilt from the CSVs (benchmarks/bench_article_parser.py), not on a saved
+Oryx page. Sections before the first heading, and sections whose heading is not in
+global_vars.section_heading_types (which is printed), still fall back on the dicts.
+
+Every section is a self-contained unit (see split_sections), so iter_entries can parse
+the sections of a long article on a process pool and merge them in order.
+"""
+
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from html import unescape
+from itertools import repeat
+
+import pandas as pd
+import global_vars
+from parser_helpers import name_parsing, status_parsing, postimg_link_processing
+from metrics import get_default_metrics, PARSE_BUCKETS
+
+# Finds the name of the vehicle at the start of an entry ("409 T-80BV").
+VEHICLE_NAME_PATTERN = re.compile(r"\S[\w\s\(\)\-\"\'\,\.\/]*")
+
+# Splits a page into comments, doctypes and tags; everything between two tokens is text.
+TOKEN_PATTERN = re.compile(r"""<!--.*?-->|<![^>]*>|<\?[^>]*>
+                               |<(?P<end>/?)(?P<tag>[a-zA-Z][^\s/>]*)
+                                (?P<attrs>(?:"[^"]*"|'[^']*'|[^'">])*)>""", re.DOTALL | re.VERBOSE)
+# Splits the inside of a tag into attribute names and values.
+ATTR_PATTERN = re.compile(r"""([^\s/=>]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]*))?""")
+
+# Heading tag that starts every vehicle category of an Oryx article.
+SECTION_HEADING = "h3"
+# Finds the start and end of the article, and every section heading inside it.
+ARTICLE_START_PATTERN = re.compile(r"<article(?:\s[^>]*)?>", re.IGNORECASE)
+ARTICLE_END_PATTERN = re.compile(r"</article\s*>", re.IGNORECASE)
+HEADING_PATTERN = re.compile(f"<{SECTION_HEADING}(?:\\s[^>]*)?>(.*?)</{SECTION_HEADING}\\s*>",
+                             re.IGNORECASE | re.DOTALL)
+# Any tag, removed from the text of a heading.
+ANY_TAG_PATTERN = re.compile(r"<[^>]*>")
+# The loss counts after a category name; names can hold parentheses too ("(MRAP) Vehicles").
+HEADING_COUNTS_PATTERN = re.compile(r"\s*\(\d[^()]*\)\s*$")
+# The heading over the whole page ("Russia - 15361, of which: destroyed: 11512, ..."), which names no category.
+SUMMARY_HEADING_PATTERN = re.compile(r"^[A-Z][\w ]* - \d[\d,]*,? of which")
+
+# Tags whose content is plain text rather than markup, and the pattern that ends each.
+RAW_TEXT_TAGS = {tag: re.compile(f"</{tag}\\s*>", re.IGNORECASE) for tag in ("script", "style")}
+# Tags that never hold content, so they never go on the stack of open tags.
+VOID_TAGS = {"area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame",
+             "hr", "image", "img", "input", "isindex", "keygen", "link", "menuitem",
+             "meta", "nextid", "param", "source", "spacer", "track", "wbr"}
+
+# With workers=None, articles smaller than this are parsed in one process; starting a pool
+# and sending the sections over costs more than it saves (see benchmarks/bench_section_parser.py).
+PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+YEAR_MADE_FILES = {"Russia": "reference_data/ru_unique_vehicles_years.csv",
+                   "Ukraine": "reference_data/ua_unique_vehicles.csv"}
+"""
+Files of known vehicle names and their years of first production, per user.
+"""
+
+LinkEntry = namedtuple("LinkEntry", ["name", "type", "status", "status_count",
+                                     "manufacturer", "manufacturer_abbr", "proof", "href"])
+"""
+One (number, status) link of an Oryx entry, such as (5,6,7,8, captured).
+status_count is how many losses the link stands for; proof is the processed link
+and href the link exactly as it appears in the article.
+"""
+
+RawEntry = namedtuple("RawEntry", ["text", "flag_src", "links"])
+"""
+One <li> of the article: its full text, the src of its first flag image (or None)
+and a list of (href, text) for every link inside it.
+"""
+
+Section = namedtuple("Section", ["category", "html", "start_type"], defaults=[""])
+"""
+One part of an article: the vehicle category named by the heading it starts with
+(None for the part before the first heading, or after an unknown heading), its raw HTML,
+heading included, and for sections without a category, the type its entries get until
+a name of the first-entry dicts comes up (the type of the section before it).
+"""
+
+_heading_types = {heading.casefold(): vehicle_type
+                  for heading, vehicle_type in global_vars.section_heading_types.items()}
+"""
+global_vars.section_heading_types keyed by lower case heading.
+"""
+
+_flag_lookup = {}
+"""
+A dict of {flag image src: (country, abbr)}, filled the first time each flag is seen.
+"""
+
+def flag_country(src: str) -> tuple[str, str]:
+    """
+    Returns the manufacturer name and abbreviation shown by a flag image,
+    or ("NONE", "NONE") if the flag is not in global_vars.manufacturer_dict.
+
+    Example input: https://upload.wikimedia.org/.../23px-Flag_of_the_Soviet_Union.svg.png
+    Example output: ("Soviet Union", "USSR")
+    """
+    if src not in _flag_lookup:
+        found = ("NONE", "NONE")
+        for country_name, abbr in global_vars.manufacturer_dict.items():
+            if country_name in src:
+                found = (country_name.replace("_", " "), abbr)
+                break
+        _flag_lookup[src] = found
+    return _flag_lookup[src]
+
+def load_year_first_produced(user: str) -> dict:
+    """
+    Returns a dict of {vehicle name: year of first production} for RU or UA vehicles.
+
+    ## Parameters
+    user: Russia or Ukraine
+    """
+    df_year_made = pd.read_csv(YEAR_MADE_FILES.get(user, YEAR_MADE_FILES["Ukraine"]), index_col="name")
+    return df_year_made["year_first_produced"].to_dict()
+
+class _ArticleScanner:
+    """
+    Collects every <li> inside the first <article>, grouped by the <ul> lists that
+    contain them, following the same nesting rules as the BeautifulSoup html.parser
+    tree (an end tag closes every tag opened after its matching start tag; an end
+    tag with no matching start tag is ignored).
+    """
+    def __init__(self):
+        self.stack = [] # names of the open tags inside the article
+        self.article_state = 0 # 0: before, 1: inside, 2: after the article
+        self.ul_lists = [] # one list of <li> records per <ul>, in document order
+        self.open_uls = [] # (stack depth, list index) of the open <ul> tags
+        self.open_lis = [] # (stack depth, record) of the open <li> tags
+        self.open_links = [] # (stack depth, [href, text]) of the open <a> tags
+
+    def feed(self, html: str):
+        """
+        Tokenizes the whole page in one pass and handles every tag and text run.
+        """
+        position = 0
+        while True:
+            token = TOKEN_PATTERN.search(html, position)
+            if token is None:
+                break
+            if token.start() > position:
+                self.handle_data(html[position:token.start()])
+            position = token.end()
+            tag = token.group("tag")
+            if tag is None: # comment, doctype or processing instruction
+                continue
+            tag = tag.lower()
+            if token.group("end"):
+                self.handle_endtag(tag)
+                continue
+            attrs = token.group("attrs")
+            self.handle_starttag(tag, attrs)
+            if attrs.endswith("/"):
+                self.handle_startendtag(tag)
+            elif tag in RAW_TEXT_TAGS:
+                # script and style hold no markup, and BeautifulSoup leaves
+                # them out of .text, so skip straight to their end tag
+                closing = RAW_TEXT_TAGS[tag].search(html, position)
+                if closing is None:
+                    return
+                self.handle_endtag(tag)
+                position = closing.end()
+        if position < len(html):
+            self.handle_data(html[position:])
+
+    def handle_starttag(self, tag: str, attr_text: str):
+        if self.article_state != 1:
+            if tag == "article" and self.article_state == 0:
+                self.article_state = 1
+                self.stack.append(tag)
+            return
+        if tag == "img":
+            for depth, record in self.open_lis:
+                if record["flag_src"] is None:
+                    attrs = _parse_attrs(attr_text)
+                    if "thumbborder" in (attrs.get("class") or "").split():
+                        record["flag_src"] = attrs.get("src") or ""
+        if tag in VOID_TAGS:
+            return
+        self.stack.append(tag)
+        depth = len(self.stack)
+        if tag == "ul":
+            self.ul_lists.append([])
+            self.open_uls.append((depth, len(self.ul_lists) - 1))
+        elif tag == "li":
+            record = {"text": [], "flag_src": None, "links": []}
+            for _, index in self.open_uls:
+                self.ul_lists[index].append(record)
+            self.open_lis.append((depth, record))
+        elif tag == "a":
+            link = [_parse_attrs(attr_text).get("href"), []]
+            for _, record in self.open_lis:
+                record["links"].append(link)
+            self.open_links.append((depth, link))
+
+    def handle_startendtag(self, tag: str):
+        if tag not in VOID_TAGS and self.article_state == 1 and self.stack and self.stack[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag: str):
+        if self.article_state != 1 or tag not in self.stack:
+            return
+        # close everything up to and including the most recent matching tag
+        while self.stack:
+            depth = len(self.stack)
+            closed = self.stack.pop()
+            for open_tags in (self.open_uls, self.open_lis, self.open_links):
+                if open_tags and open_tags[-1][0] == depth:
+                    open_tags.pop()
+            if closed == tag:
+                break
+        if not self.stack:
+            self.article_state = 2
+
+    def handle_data(self, data: str):
+        if self.article_state != 1 or not self.open_lis:
+            return
+        data = unescape(data)
+        for _, record in self.open_lis:
+            record["text"].append(data)
+        for _, link in self.open_links:
+            link[1].append(data)
+
+def _parse_attrs(attr_text: str) -> dict:
+    """
+    Turns the inside of a tag (' class="thumbborder" src="..."') into a dict.
+    Later duplicates win, as in BeautifulSoup.
+    """
+    attrs = {}
+    for name, value in ATTR_PATTERN.findall(attr_text):
+        if value[:1] in ("'", '"'):
+            value = value[1:-1]
+        attrs[name.lower()] = unescape(value)
+    return attrs
+
+def iter_raw_entries(html: bytes | str):
+    """
+    Yields a RawEntry for every <li> of every <ul> inside the article, in the same
+    order as article.find_all('ul') followed by ul.find_all('li').
+
+    ## Parameters
+    html: the raw HTML of an Oryx page.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    scanner = _ArticleScanner()
+    with get_default_metrics().timer("article_scan_seconds"):
+        scanner.feed(html)
+    for ul_list in scanner.ul_lists:
+        for record in ul_list:
+            yield RawEntry("".join(record["text"]), record["flag_src"],
+                           [(href, "".join(text)) for href, text in record["links"]])
+
+def heading_category(heading: str) -> str | None:
+    """
+    Returns the vehicle type named by the inside of a section heading, as listed
+    in global_vars.section_heading_types, or None for the summary heading of the page.
+    Any other heading is printed and gives None too, so that its entries fall back on
+    the first-entry dicts instead of stopping the scrape.
+
+    Example input: <span class="mw-headline">Armoured Fighting Vehicles (714, of which destroyed: 443)</span>
+    Example output: Armored Fighting Vehicles
+    """
+    text = " ".join(unescape(ANY_TAG_PATTERN.sub("", heading)).split())
+    text = HEADING_COUNTS_PATTERN.sub("", text)
+    if SUMMARY_HEADING_PATTERN.match(text):
+        return None
+    if text.casefold() not in _heading_types:
+        print(f"Unknown Oryx section heading {text!r}; add it to global_vars.section_heading_types")
+        get_default_metrics().inc("unknown_headings")
+        return None
+    return _heading_types[text.casefold()]
+
+def article_html(html: bytes | str) -> str:
+    """
+    Returns the HTML between the <article> tags of a page, or "" if it has none.
+
+    ## Parameters
+    html: the raw HTML of an Oryx page.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    start = ARTICLE_START_PATTERN.search(html)
+    if start is None:
+        return ""
+    end = ARTICLE_END_PATTERN.search(html, start.end())
+    return html[start.end():end.start() if end is not None else len(html)]
+
+def split_sections(html: bytes | str) -> list[Section]:
+    """
+    Cuts the article of an Oryx page into one Section per heading, in order,
+    plus one for anything before the first heading. Each section holds whole <ul>
+    lists, so it can be parsed on its own (see parse_section).
+
+    ## Parameters
+    html: the raw HTML of an Oryx page.
+    """
+    article = article_html(html)
+    if not article:
+        return []
+    sections = []
+    position, category, start_type = 0, None, ""
+    for heading in HEADING_PATTERN.finditer(article):
+        if heading.start() > position or sections:
+            sections.append(Section(category, article[position:heading.start()], start_type))
+            start_type = category or start_type
+        position, category = heading.start(), heading_category(heading.group(1))
+    sections.append(Section(category, article[position:], start_type))
+    return sections
+
+def parse_section(section: Section, vehicle_types: dict) -> list[LinkEntry]:
+    """
+    Returns a LinkEntry for every (number, status) link of one section.
+    Runs in a worker process when iter_entries is given workers.
+    """
+    html = "<article>" + section.html + "</article>"
+    return list(_link_entries(iter_raw_entries(html), vehicle_types, section.category, section.start_type))
+
+def _start_section_worker():
+    # a forked worker starts with a copy of the parent's metrics, which must not be sent back
+    get_default_metrics().reset()
+
+def _parse_section_job(section: Section, vehicle_types: dict) -> tuple[list[LinkEntry], tuple]:
+    """
+    parse_section in a worker process. Also returns what the worker recorded into its
+    metrics (see Metrics.take), which iter_entries merges into the parent's.
+    """
+    return parse_section(section, vehicle_types), get_default_metrics().take()
+
+def iter_entries(html: bytes | str, vehicle_types: dict, workers: int | None = None):
+    """
+    Yields a LinkEntry for every (number, status) link of an Oryx loss article.
+    Metrics recorded in worker processes are merged into get_default_metrics().
+
+    ## Parameters
+    html: the raw HTML of an Oryx page.
+    vehicle_types: a dictionary of the first entries of vehicle names \
+    and their corresponding types in the page, used for sections without a known heading.
+    workers: if above 1, the sections are parsed on a pool of this many processes.
+    None uses one process per CPU for articles of PARALLEL_MIN_BYTES or more, and
+    parses smaller ones (or any article on a single CPU) in this process.
+    """
+    sections = split_sections(html)
+    if workers is None:
+        large = sum(len(section.html) for section in sections) >= PARALLEL_MIN_BYTES
+        workers = (os.cpu_count() or 1) if large else 1
+    if workers <= 1 or len(sections) <= 1:
+        for section in sections:
+            yield from parse_section(section, vehicle_types)
+        return
+    metrics = get_default_metrics()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_start_section_worker) as pool:
+        for entries, worker_metrics in pool.map(_parse_section_job, sections, repeat(vehicle_types)):
+            metrics.merge(worker_metrics)
+            yield from entries
+
+def _link_entries(raw_entries, vehicle_types: dict, category: str | None = None, start_type: str = ""):
+    """
+    Turns the RawEntry of one section into LinkEntry. Every entry gets the
+    section's category; without one, the type starts as start_type and changes
+    whenever a name of vehicle_types comes up.
+    """
+    metrics = get_default_metrics()
+    vehicle_type = category or start_type # Type of the vehicle ("Tanks")
+    for raw in raw_entries:
+        start_time = time.perf_counter()
+        vehicle_name = VEHICLE_NAME_PATTERN.search(raw.text)
+        if vehicle_name is None: # an empty <li>; nothing to record
+            continue
+        vehicle_name = name_parsing(vehicle_name.group(0)) # Name of the vehicle ("T-72B3")
+        if category is None and vehicle_name in vehicle_types:
+            vehicle_type = vehicle_types[vehicle_name]
+
+        manufacturer, manufacturer_abbr = None, None
+        if raw.flag_src is not None:
+            manufacturer, manufacturer_abbr = flag_country(raw.flag_src)
+
+        entries = []
+        for href, text in raw.links:
+            if href is None:
+                continue
+            status, status_count = status_parsing(text)
+            entries.append(LinkEntry(vehicle_name, vehicle_type, status, status_count,
+                                     manufacturer, manufacturer_abbr, postimg_link_processing(href), href))
+        # timed before yielding, so the caller's work is not counted
+        metrics.observe("entry_parse_seconds", time.perf_counter() - start_time, PARSE_BUCKETS)
+        yield from entries
+
+def iter_rows(html: bytes | str, user: str, vehicle_types: dict,
+              year_first_produced: dict | None = None, workers: int | None = None):
+    """
+    Yields one row per loss, laid out as global_vars.df_colnames, with the
+    id, day, month and year left empty. A link standing for several losses
+    ((5,6,7,8, captured)) yields one row for each. The ids depend on the
+    whole table, so they are filled in by record_store.stable_ids once the
+    rows are in a DataFrame.
+
+    ## Parameters
+    html: the raw HTML of an Oryx page.
+    user: Russia or Ukraine
+    vehicle_types: a dictionary of the first entries of vehicle names \
+    and their corresponding types in the page.
+    year_first_produced: a dict of {name: year}; defaults to load_year_first_produced(user).
+    workers: passed on to iter_entries.
+    """
+    if year_first_produced is None:
+        year_first_produced = load_year_first_produced(user)
+    user_abbr = global_vars.manufacturer_dict[user]
+    for entry in iter_entries(html, vehicle_types, workers):
+        year_made = year_first_produced.get(entry.name)
+        for i in range(entry.status_count):
+            yield [None, entry.name, entry.type, entry.status, None, None, None,
+                   entry.manufacturer, entry.manufacturer_abbr, user, user_abbr,
+                   entry.proof, year_made]
@@ -0,0 +1,133 @@
+"""
+This file contains a fetch engine that resolves the dates of many
+postimg links concurrently, instead of one blocking request at a time.
+
+parse_oryx_concurrent in oryx_parser.py first walks the Oryx article and
+collects every unique proof link, then hands those links to resolve_dates.
+The requests are made on a thread pool through the shared HTTP client, which
+also limits how fast each host is hit (see http_client.HOST_RATE).
+Progress is kept in a CrawlJournal, so an interrupted crawl resumes where it
+stopped, and drain_failed retries the links that failed with exponential backoff.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from crawl_journal import CrawlJournal, get_default_journal, DONE, FAILED, MAX_ATTEMPTS
+from parser_helpers import title_date_parsing
+from http_client import FetchClient
+from response_cache import ResponseCache, fetch_page_info
+from proof_index import canonical_proof
+
+# Maximum number of requests allowed to be waiting on the network at once.
+MAX_IN_FLIGHT = 32
+# Seconds drain_failed waits before its first retry round; doubled every round.
+BASE_RETRY_DELAY = 2.0
+MAX_RETRY_DELAY = 120.0
+
+def fetch_title(link: str, cache: ResponseCache | None = None,
+                client: FetchClient | None = None) -> str | None:
+    """
+    Returns the text of a page's <title> tag, or None.
+    Only pages missing from the response cache are downloaded.
+    Runs inside a worker thread; network errors are left to the caller.
+    """
+    return fetch_page_info(link, cache, client).title
+
+def _resolve_one(link: str, journal: CrawlJournal, fetch=fetch_title):
+    """
+    Resolves a single link into a (day, month, year) tuple and records the outcome.
+    """
+    try:
+        date = title_date_parsing(fetch(link))
+    except Exception as e: # any failure is recorded and left to drain_failed
+        print(f"Failed to parse {link}: {e.__class__.__name__}")
+        journal.record_failed(link, e)
+        return link, (None, None, None)
+    journal.record_done(link, date)
+    return link, date
+
+def resolve_dates(links, max_in_flight: int = MAX_IN_FLIGHT,
+                  journal: CrawlJournal | None = None,
+                  max_attempts: int = MAX_ATTEMPTS,
+                  cache: ResponseCache | None = None,
+                  client: FetchClient | None = None) -> dict:
+    """
+    Resolves the dates of every link in `links` concurrently.
+    Returns a dict of {link: (day, month, year)}; links with no
+    parsable date (or that failed to download) map to (None, None, None).
+
+    Links the journal already has as done are not fetched again.
+    Failed links are retried until they reach max_attempts.
+
+    ## Parameters
+    links: an iterable of postimg links. Duplicates are only fetched once.
+    max_in_flight: the maximum number of requests waiting on the network at once.
+    journal: the journal to record progress in; defaults to get_default_journal().
+    max_attempts: failed links attempted this many times are not fetched again.
+    cache: the response cache to use; defaults to get_default_cache().
+    client: the HTTP client to use; defaults to get_default_client().
+    Its host_rate is the only per-host limit.
+    """
+    start_time = time.perf_counter()
+    journal = journal or get_default_journal()
+    links = list(dict.fromkeys(links))
+    journal.add_links(links)
+    results = {}
+    to_fetch = []
+    for link in links:
+        state, attempts = journal.state(link)
+        if state == DONE:
+            results[link] = journal.result(link)
+        elif state == FAILED and attempts >= max_attempts:
+            results[link] = (None, None, None)
+        else:
+            to_fetch.append(link)
+
+    fetch = partial(fetch_title, cache=cache, client=client)
+    try:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            results.update(executor.map(partial(_resolve_one, journal=journal, fetch=fetch), to_fetch))
+    finally:
+        # keep whatever was resolved even if the run is interrupted
+        journal.checkpoint()
+    end_time = time.perf_counter()
+    print(f"Resolved {len(results)} links in {end_time - start_time} seconds")
+    return results
+
+def drain_failed(journal: CrawlJournal | None = None, links=None,
+                 max_attempts: int = MAX_ATTEMPTS, base_delay: float = BASE_RETRY_DELAY,
+                 max_in_flight: int = MAX_IN_FLIGHT) -> dict:
+    """
+    Retry worker: keeps retrying failed links, waiting twice as long before every round,
+    until none are left or every one of them reached max_attempts.
+    Returns a dict of {link: (day, month, year)} for the links it resolved.
+
+    ## Parameters
+    journal: the journal to drain; defaults to get_default_journal().
+    links: if given, only failed links among these are retried.
+    max_attempts: links attempted this many times are given up on.
+    base_delay: seconds to wait before the first round.
+    """
+    journal = journal or get_default_journal()
+    wanted = None if links is None else {canonical_proof(link): link for link in links}
+    results = {}
+    round_number = 0
+    while True:
+        failed = journal.links_in_state(FAILED, max_attempts)
+        if wanted is not None:
+            failed = [wanted[link] for link in failed if link in wanted]
+        if not failed:
+            break
+        delay = min(base_delay * 2 ** round_number, MAX_RETRY_DELAY)
+        print(f"Retrying {len(failed)} failed links in {delay} seconds")
+        time.sleep(delay)
+        results.update(resolve_dates(failed, max_in_flight=max_in_flight,
+                                     journal=journal, max_attempts=max_attempts))
+        round_number += 1
+    print(f"Journal now holds {journal.counts()}")
+    return results
+
+if __name__ == "__main__":
+    drain_failed()
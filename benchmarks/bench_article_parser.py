@@ -0,0 +1,97 @@
+"""
+Benchmark of article_parser against the old BeautifulSoup walk of parse_oryx.
+Also checks that both produce exactly the same rows, and that every row has the type
+of the CSV the article was built from, although the headings are spelled like the live page
+(see benchmarks.fixtures.LIVE_HEADINGS).
+
+The BeautifulSoup walk here reads types from the headings too, unlike the old
+parse_oryx, which took them from the first-entry dicts. Both parsers only ever see the
+synthetic articles of benchmarks.fixtures, rebuilt from the CSVs; their equivalence on a
+saved live Oryx page has not been shown, since none is in the repository.
+
+Run from the repository root:
+python -m benchmarks.bench_article_parser
+"""
+
+import re
+import time
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+import global_vars
+from article_parser import iter_rows, load_year_first_produced
+from record_store import stable_ids
+from parser_helpers import name_parsing, status_parsing, postimg_link_processing
+from benchmarks.fixtures import build_oryx_article
+
+HEADING_TYPES = {heading.casefold(): vehicle_type for heading, vehicle_type in global_vars.section_heading_types.items()}
+
+def bs4_rows(html: str, user: str, vehicle_types: dict) -> list:
+    """
+    The BeautifulSoup walk parse_oryx used before article_parser, without the date lookups,
+    with the type read from the <h3> before each list like article_parser does.
+    """
+    df_year_made = pd.read_csv("reference_data/ru_unique_vehicles_years.csv" if user == "Russia"
+                               else "reference_data/ua_unique_vehicles.csv", index_col="name")
+    user_abbr = global_vars.manufacturer_dict[user]
+    rows = []
+    vehicle_type = ""
+    article = BeautifulSoup(html, 'html.parser').find('article')
+    for vehicle_name_group in article.find_all('ul'):
+        heading = vehicle_name_group.find_previous('h3')
+        if heading is not None:
+            text = re.sub(r"\s*\(\d[^()]*\)\s*$", "", " ".join(heading.get_text().split()))
+            vehicle_type = HEADING_TYPES[text.casefold()]
+        for vehicle in vehicle_name_group.find_all('li'):
+            vehicle_name = re.search(r"\S[\w\s\(\)\-\"\'\,\.\/]*", vehicle.text).group(0)
+            vehicle_name = name_parsing(vehicle_name)
+            if heading is None and vehicle_name in vehicle_types:
+                vehicle_type = vehicle_types[vehicle_name]
+            flag = vehicle.find('img', class_='thumbborder')
+            flag_country, flag_country_abbr = None, None
+            if flag is not None:
+                flag_country, flag_country_abbr = "NONE", "NONE"
+                for country_name, abbr in global_vars.manufacturer_dict.items():
+                    if country_name in flag.get('src'):
+                        flag_country, flag_country_abbr = country_name.replace("_", " "), abbr
+                        break
+            for raw_link in vehicle.find_all('a'):
+                status, status_count = status_parsing(raw_link.text)
+                proof = postimg_link_processing(raw_link.get('href'))
+                year_made = None
+                if vehicle_name in df_year_made.index:
+                    year_made = df_year_made.loc[vehicle_name, "year_first_produced"]
+                for i in range(status_count):
+                    rows.append([None, vehicle_name, vehicle_type, status, None, None, None,
+                                 flag_country, flag_country_abbr, user, user_abbr, proof, year_made])
+    return rows
+
+def main():
+    for csv_path, user, vehicle_types in [("data/ru_losses.csv", "Russia", global_vars.ru_vehicle_types),
+                                          ("data/ua_losses.csv", "Ukraine", global_vars.ua_vehicle_types)]:
+        df = pd.read_csv(csv_path)
+        html = build_oryx_article(df)
+
+        start_time = time.perf_counter()
+        old_rows = bs4_rows(html, user, vehicle_types)
+        bs4_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        new_rows = list(iter_rows(html, user, vehicle_types, load_year_first_produced(user)))
+        engine_time = time.perf_counter() - start_time
+
+        old_df = pd.DataFrame(old_rows, columns=global_vars.df_colnames)
+        new_df = pd.DataFrame(new_rows, columns=global_vars.df_colnames)
+        old_df["id"], new_df["id"] = stable_ids(old_df), stable_ids(new_df)
+        pd.testing.assert_frame_equal(old_df, new_df)
+        # the CSV types are names the repo already uses, so they map onto themselves
+        expected_types = df["type"].map(global_vars.section_heading_types)
+        assert expected_types.notna().all()
+        assert set(zip(df["name"], expected_types)) == set(zip(new_df["name"], new_df["type"]))
+        print(f"{csv_path}: {len(new_rows)} rows, {len(html)} bytes, output identical")
+        print(f"  BeautifulSoup:  {bs4_time * 1000:.0f} ms")
+        print(f"  article_parser: {engine_time * 1000:.0f} ms ({bs4_time / engine_time:.1f}x)")
+
+if __name__ == "__main__":
+    main()
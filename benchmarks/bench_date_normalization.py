@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of date_normalization against the old row-wise
+swap_ddmmyy and make_datetime apply calls.
+Also checks that dates in the current year are normalized like the earlier ones.
+
+Run from the repository root:
+python -m benchmarks.bench_date_normalization
+"""
+
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from date_normalization import normalize_dates, add_date_lost, HEURISTICS
+
+def swap_ddmmyy(row):
+    """
+    The row-wise fix oryx_parser used before date_normalization.
+    """
+    day, month, year = row["day"], row["month"], row["year"]
+    if year == 2022 or year == 2023: # datetime stored in year month day format
+        return pd.Series([month, day, year - 2000])
+    return pd.Series([day, month, year])
+
+def make_datetime(row):
+    """
+    The row-wise date_lost builder df_cleaner used before date_normalization.
+    """
+    if pd.isna(row["year"]): return None
+    dt_string = "" + str(int(row["year"] + 2000)) + "-" + str(int(row["month"])) + "-" + str(int(row["day"]))
+    return pd.to_datetime(dt_string)
+
+def load_dates() -> pd.DataFrame:
+    """
+    Loads the RU and UA date columns and writes a tenth of the dated rows back
+    the way "08 05 2023" titles come out of the scraper.
+    """
+    df = pd.concat([pd.read_csv("data/ru_losses.csv"), pd.read_csv("data/ua_losses.csv")],
+                   ignore_index=True)[["day", "month", "year"]]
+    # keep only real dates so the old make_datetime does not raise
+    valid = pd.to_datetime(pd.DataFrame({"year": df["year"] + 2000, "month": df["month"], "day": df["day"]}),
+                           errors="coerce").notna() | df["year"].isna()
+    df = df[valid & (df["year"].isna() | df["year"].isin([22, 23]))].reset_index(drop=True)
+    rng = np.random.default_rng(0)
+    raw = df["year"].notna() & (rng.random(len(df.index)) < 0.1)
+    df.loc[raw, ["day", "month", "year"]] = np.column_stack(
+        [df.loc[raw, "month"], df.loc[raw, "day"], df.loc[raw, "year"] + 2000])
+    return df
+
+def check_current_year():
+    """
+    Runs "08 05 <this year>", "<yy> 08 05" and "05 08 <yy>" titles of the current year
+    through normalize_dates (with every heuristic) and add_date_lost.
+    Also checks that "22 08 2022" is counted under one heuristic only.
+    """
+    year = datetime.now().year
+    df = pd.DataFrame({"day": [8, year % 100, 5], "month": [5, 8, 8], "year": [year, 5, year % 100]})
+    changed = {}
+    assert normalize_dates(df, heuristics=HEURISTICS, changed=changed) == \
+        {"four_digit_year": 1, "year_first": 1, "month_over_12": 0}
+    assert [list(rows) for rows in changed.values()] == [[0], [1], []], changed
+    assert add_date_lost(df) == 0
+    assert (df["date_lost"] == pd.Timestamp(year, 8, 5)).all(), df
+    df = pd.DataFrame({"day": [22], "month": [8], "year": [2022]})
+    assert sum(normalize_dates(df, heuristics=HEURISTICS).values()) == 1
+    print(f"Dates in {year} normalized")
+
+def main():
+    check_current_year()
+    df = load_dates()
+    print(f"{len(df.index)} rows")
+
+    old = df.copy()
+    start_time = time.perf_counter()
+    old[["day", "month", "year"]] = old[["day", "month", "year"]].apply(swap_ddmmyy, axis=1)
+    old["date_lost"] = old[["day", "month", "year"]].apply(make_datetime, axis=1)
+    old_time = time.perf_counter() - start_time
+
+    new = df.copy()
+    start_time = time.perf_counter()
+    counts = normalize_dates(new)
+    bad_dates = add_date_lost(new)
+    new_time = time.perf_counter() - start_time
+
+    assert (pd.to_datetime(old["date_lost"]).fillna(pd.Timestamp(0)) ==
+            new["date_lost"].fillna(pd.Timestamp(0))).all()
+    print(f"Rows fixed per heuristic: {counts}; {bad_dates} invalid dates")
+    print(f"Row-wise apply: {old_time * 1000:.0f} ms")
+    print(f"Vectorized:     {new_time * 1000:.1f} ms ({old_time / new_time:.0f}x)")
+
+if __name__ == "__main__":
+    main()
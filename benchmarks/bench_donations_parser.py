@@ -0,0 +1,91 @@
+"""
+Benchmark of donations_parser against the parse_oryx_donations that used to live in
+oryx_parser.py, on a donations article rebuilt from data_legacy/donated_vehicles.csv
+and scaled up. Also checks that both find the same donations, apart from what the
+new parser changes on purpose: proofs in canonical form and "Ringtausch" left out.
+Then times diff_donations against the legacy dataset.
+
+Run from the repository root:
+python -m benchmarks.bench_donations_parser
+"""
+
+import re
+import time
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+import global_vars
+from donations_parser import parse_oryx_donations, diff_donations, EXCLUDED_NAMES
+from proof_index import canonical_proofs
+from benchmarks.fixtures import build_donations_article
+
+# Times the legacy donations are repeated in the timed article.
+COPIES = 50
+# Columns both parsers fill in the same way.
+COMPARED = ["vehicle_name", "vehicle_type", "supplier", "supplier_abbr", "count", "is_delivered", "proof"]
+
+def old_rows(page: str) -> pd.DataFrame:
+    """
+    The parse_oryx_donations walk before donations_parser, without writing a file.
+    """
+    df_list = []
+    article = BeautifulSoup(page, 'html.parser').find('article')
+    vehicle_type = ""
+    for vehicle_name_group in article.find_all('ul'):
+        for vehicle in vehicle_name_group.find_all('li'):
+            vehicle_str = "".join(char if char.isascii() else " " for char in str(vehicle))
+            vehicle_name_counts = re.findall(r"[0-9\s+]*<a href=[a-zA-Z0-9/\:\"\.\-]+>[a-zA-Z0-9\-\s/\'\(\)\*]+</a>",
+                                             vehicle_str)
+            flag = vehicle.find('img')
+            flag_country, flag_country_abbr = None, None
+            if flag is not None:
+                flag_country, flag_country_abbr = "NONE", "NONE"
+                for target, abbr in global_vars.manufacturer_dict.items():
+                    if target in flag.get('src'):
+                        flag_country, flag_country_abbr = target.replace("_", " "), abbr
+                        break
+            for vehicle_name_count in vehicle_name_counts:
+                count = re.search(r"[0-9]+[+]*\s", vehicle_name_count)
+                count = 0 if count is None else int(count.group(0).strip(" +"))
+                name = re.search(r">[a-zA-Z0-9\-\s/\'\(\)\*]+<", vehicle_name_count).group(0)[1:-1]
+                if name[-1] == 's':
+                    name = name[:-1]
+                name = name.lstrip(" ")
+                proof = re.search(r"href=\"[a-zA-Z0-9/\:\"\.]+", vehicle_name_count).group(0)[6:].rstrip("\"")
+                if name in global_vars.donated_vehicle_types:
+                    vehicle_type = global_vars.donated_vehicle_types[name]
+                is_delivered = not ("[to be delivered]" in vehicle.text or "pledged" in vehicle.text)
+                df_list.append([len(df_list), name, vehicle_type, flag_country, flag_country_abbr,
+                                "Ukraine", "UA", count, is_delivered, False, proof])
+    return pd.DataFrame(df_list, columns=global_vars.df_donations_colnames)
+
+def main():
+    legacy = pd.read_csv("data_legacy/donated_vehicles.csv")
+    page = build_donations_article(legacy)
+    old = old_rows(page)
+    new = parse_oryx_donations(page.encode(), "Ukraine", global_vars.donated_vehicle_types)
+    old = old[~old["vehicle_name"].isin(EXCLUDED_NAMES)].assign(proof=lambda df: canonical_proofs(df["proof"]))
+    pd.testing.assert_frame_equal(old[COMPARED].reset_index(drop=True), new[COMPARED].reset_index(drop=True),
+                                  check_dtype=False)
+    print(f"{len(new.index)} donations, same as the old parser; "
+          f"{int(new['is_soviet'].sum())} is_soviet, {int(new['year_first_produced'].notna().sum())} with a year")
+
+    page = build_donations_article(pd.concat([legacy] * COPIES, ignore_index=True))
+    start_time = time.perf_counter()
+    old_rows(page)
+    old_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    new = parse_oryx_donations(page.encode(), "Ukraine", global_vars.donated_vehicle_types)
+    new_time = time.perf_counter() - start_time
+    print(f"{len(new.index)} donations, {len(page)} bytes")
+    print(f"  old parser:        {old_time * 1000:.0f} ms")
+    print(f"  donations_parser:  {new_time * 1000:.0f} ms ({old_time / new_time:.1f}x)")
+
+    start_time = time.perf_counter()
+    changes = diff_donations(new, legacy)
+    print(f"  diff_donations:    {(time.perf_counter() - start_time) * 1000:.0f} ms, "
+          f"{changes['change'].value_counts().to_dict()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark of head_extractor against the old BeautifulSoup path
+for reading the <title> and og:image of postimg pages.
+
+Run from the repository root:
+python -m benchmarks.bench_head_extractor
+"""
+
+import time
+
+from bs4 import BeautifulSoup
+from head_extractor import parse_head
+
+# Number of pages parsed by each method.
+PAGES = 200
+
+def make_postimg_page(index: int) -> bytes:
+    """
+    Builds a page shaped like a postimg post: a short <head> with the title and
+    Open Graph tags, followed by a long <body> full of navigation and scripts.
+    """
+    head = ("<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">"
+            f"<title>{index} t72b3 dest 05 08 23 &mdash; Postimages</title>"
+            "<link rel=\"stylesheet\" href=\"https://postimg.cc/css/main.css\">"
+            f"<meta property=\"og:title\" content=\"{index} t72b3 dest 05 08 23\">"
+            f"<meta property=\"og:image\" content=\"https://i.postimg.cc/abc{index}/{index}-t72b3-dest-05-08-23.jpg\">"
+            "<script>window.dataLayer = window.dataLayer || [];</script></head>")
+    body = "<body>" + "".join(f"<div class=\"nav\"><a href=\"/page{i}\">Link {i}</a></div>"
+                              for i in range(600)) + "</body></html>"
+    return (head + body).encode()
+
+def bs4_path(page: bytes):
+    soup = BeautifulSoup(page, 'html.parser')
+    title = soup.find("title")
+    og_image = soup.find(property='og:image')
+    return title.text, og_image["content"]
+
+def head_extractor_path(page: bytes):
+    # the network delivers pages in chunks, so feed them the same way
+    title, og = parse_head(page[i:i + 4096] for i in range(0, len(page), 4096))
+    return title, og["og:image"]
+
+def time_method(method, pages: list) -> float:
+    start_time = time.perf_counter()
+    for page in pages:
+        method(page)
+    return time.perf_counter() - start_time
+
+def main():
+    pages = [make_postimg_page(i) for i in range(PAGES)]
+    assert bs4_path(pages[0]) == head_extractor_path(pages[0])
+    print(f"{PAGES} pages of {len(pages[0])} bytes each")
+    bs4_time = time_method(bs4_path, pages)
+    head_time = time_method(head_extractor_path, pages)
+    print(f"BeautifulSoup:  {bs4_time:.3f} s ({PAGES / bs4_time:.0f} pages/s)")
+    print(f"head_extractor: {head_time:.3f} s ({PAGES / head_time:.0f} pages/s)")
+    print(f"Speedup: {bs4_time / head_time:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-benchmark of insert_dates_into_df.merge_ocr_dates against the old
+dict + row-wise apply merge of OCR dates.
+
+Also checks insert_dates_into_df.convert_to_datetime against the committed
+data_legacy/total_losses_with_processed_dates.csv, starting from the raw dates:
+inside the WAR_START - LAST_COLLECTION_DAY window the only new dates may be
+2020 reads moved to 2022.
+
+Run from the repository root:
+python -m benchmarks.bench_ocr_date_merge
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from insert_dates_into_df import convert_to_datetime, merge_ocr_dates, WAR_START, LAST_COLLECTION_DAY
+
+def old_merge(losses: pd.DataFrame, dates_df: pd.DataFrame):
+    """
+    The merge main4 used before merge_ocr_dates: a dict filled row by row,
+    then one pd.Series built for every loss.
+    """
+    dates_df = dates_df.drop_duplicates().dropna()
+    dates_df = dates_df[dates_df["datetime"] > WAR_START]
+    dates_df = dates_df[dates_df["datetime"] < LAST_COLLECTION_DAY]
+    link_dates_dict = {}
+    def put_dates_into_dict(row):
+        link_dates_dict[row["proof"]] = row["datetime"]
+    def pick_dates_from_list(row):
+        if pd.notna(row["date_lost"]):
+            return pd.Series([row["proof"], row["date_lost"]])
+        elif row["proof"] in link_dates_dict:
+            return pd.Series([row["proof"], link_dates_dict[row["proof"]]])
+        return pd.Series([row["proof"], row["date_lost"]])
+    dates_df[["proof", "datetime"]].apply(put_dates_into_dict, axis=1)
+    losses[["proof", "date_lost"]] = losses[["proof", "date_lost"]].apply(pick_dates_from_list, axis=1)
+
+def load_inputs() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Loads the legacy RU and UA losses with two thirds of their dates blanked out,
+    and the legacy OCR dates.
+    """
+    losses = pd.concat([pd.read_csv("data_legacy/ru_losses.csv"), pd.read_csv("data_legacy/ua_losses.csv")],
+                       ignore_index=True)[["proof", "date_lost"]]
+    losses["date_lost"] = pd.to_datetime(losses["date_lost"], errors="coerce")
+    rng = np.random.default_rng(0)
+    losses.loc[rng.random(len(losses.index)) < 2 / 3, "date_lost"] = pd.NaT
+    dates_df = pd.read_csv("data_legacy/total_losses_with_processed_dates.csv")
+    dates_df["datetime"] = pd.to_datetime(dates_df["datetime"], errors="coerce")
+    return losses, dates_df
+
+def check_raw_dates():
+    """
+    Converts the legacy raw OCR dates again and compares the dates that
+    merge_ocr_dates would keep with the committed processed dates.
+    """
+    raw = pd.read_csv("data_legacy/total_losses_with_raw_dates.csv")
+    committed = pd.read_csv("data_legacy/total_losses_with_processed_dates.csv")
+    converted = convert_to_datetime(raw["rearranged_date"])
+    committed = pd.to_datetime(committed["datetime"], errors="coerce")
+    def in_window(dates: pd.Series) -> pd.Series:
+        return dates.where((dates > WAR_START) & (dates < LAST_COLLECTION_DAY))
+    different = in_window(converted).fillna(pd.Timestamp(0)) != in_window(committed).fillna(pd.Timestamp(0))
+    read_as_2020 = raw["rearranged_date"].str.contains(r"/(?:20)?20$", na=False)
+    assert not (different & ~read_as_2020).any(), \
+        raw.loc[different & ~read_as_2020, "rearranged_date"].head().tolist()
+    print(f"{len(raw.index)} raw OCR dates: {int(different.sum())} in the window that the "
+          f"committed file dropped, all read as 2020")
+
+def main():
+    check_raw_dates()
+    losses, dates_df = load_inputs()
+    print(f"{len(losses.index)} losses, {len(dates_df.index)} OCR dates")
+
+    old = losses.copy()
+    start_time = time.perf_counter()
+    old_merge(old, dates_df)
+    old_time = time.perf_counter() - start_time
+
+    new = losses.copy()
+    start_time = time.perf_counter()
+    counts = merge_ocr_dates(new, dates_df)
+    new_time = time.perf_counter() - start_time
+
+    assert (pd.to_datetime(old["date_lost"]).fillna(pd.Timestamp(0)) ==
+            new["date_lost"].fillna(pd.Timestamp(0))).all()
+    print(f"Date sources: {counts}")
+    print(f"Dict + row-wise apply: {old_time * 1000:.0f} ms")
+    print(f"Left join:             {new_time * 1000:.1f} ms ({old_time / new_time:.0f}x)")
+
+if __name__ == "__main__":
+    main()
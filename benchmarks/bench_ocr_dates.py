@@ -0,0 +1,91 @@
+"""
+End-to-end run of the OCR stage with the stub backend: select_undated_proofs on a small
+losses table, run_ocr on a pre-filled image store, and the rows appended to the output.
+
+One image holds b"corrupt", which makes the backend fail on its whole batch. The run must
+still write the other images of the batch, count that proof as failed and leave it out of
+the output, so that a second run reads only it again (pages without an image
+are looked up again too, but straight from the store).
+
+Nothing is downloaded: every proof is already in a temporary image store.
+
+Run from the repository root:
+python -m benchmarks.bench_ocr_dates
+"""
+
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+import ocr_dates
+from image_store import ImageStore
+from ocr_dates import StubBackend, run_ocr, select_undated_proofs
+
+# (image of the proof, raw date the stub backend should read off it)
+IMAGES = [
+    (b"T-72B3 destroyed 05.08.2023", "05.08.2023"),
+    (b"BMP-2 captured 14-03 22", "14-03 22"),
+    (b"no date on this one", None),
+    (b"corrupt", None),
+    (None, None), # a postimg page without an image
+]
+# Images per batch, so that the corrupt image shares its batch with good ones.
+BATCH_SIZE = 4
+
+class FailingBackend(StubBackend):
+    """
+    The stub backend, except that a batch holding b"corrupt" raises like an unreadable image.
+    Registered in ocr_dates.BACKENDS before the worker processes are forked.
+    """
+    def read_batch(self, images: list[bytes]) -> list[str]:
+        if b"corrupt" in images:
+            raise OSError("cannot identify image file")
+        return super().read_batch(images)
+
+def write_losses(path: str) -> list[str]:
+    """
+    Writes a losses table with one undated row per image, a dated row and a
+    non-postimg row, and returns the proofs of the undated rows.
+    """
+    proofs = [f"https://postimg.cc/bench{i:04d}" for i in range(len(IMAGES))]
+    rows = [{"proof": proof, "day": None, "month": None, "year": None} for proof in proofs]
+    rows.append({"proof": "https://postimg.cc/dated0000", "day": 5.0, "month": 8.0, "year": 23.0})
+    rows.append({"proof": "https://twitter.com/i/status/1", "day": None, "month": None, "year": None})
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return proofs
+
+def main():
+    ocr_dates.BACKENDS["failing stub"] = FailingBackend
+    with tempfile.TemporaryDirectory() as folder:
+        losses_path = os.path.join(folder, "losses.csv")
+        output = os.path.join(folder, "ocr_raw_dates.csv")
+        proofs = write_losses(losses_path)
+        selected = select_undated_proofs([losses_path])
+        assert selected == proofs, selected
+
+        store = ImageStore(os.path.join(folder, "images"))
+        for i, (proof, (image, _)) in enumerate(zip(proofs, IMAGES)):
+            store.put(proof, None if image is None else f"https://i.postimg.cc/bench{i:04d}/image.jpg", image)
+
+        start_time = time.perf_counter()
+        counts = run_ocr(selected, output=output, backend="failing stub", workers=1,
+                         batch_size=BATCH_SIZE, crop_box=None, store=store)
+        seconds = time.perf_counter() - start_time
+        assert counts == {"skipped": 0, "images": 4, "dated": 2, "no image": 1, "failed": 1}, counts
+
+        written = pd.read_csv(output, keep_default_na=False)
+        expected = {proof: raw_date or "" for proof, (image, raw_date) in zip(proofs, IMAGES)
+                    if image not in (None, b"corrupt")}
+        assert dict(zip(written["proof"], written["raw_date"])) == expected, written
+
+        counts = run_ocr(selected, output=output, backend="failing stub", workers=1,
+                         batch_size=BATCH_SIZE, crop_box=None, store=store)
+        assert counts == {"skipped": 3, "images": 1, "dated": 0, "no image": 1, "failed": 1}, counts
+        assert len(pd.read_csv(output).index) == len(expected)
+    print(f"OCR stage with the stub backend: {len(selected)} proofs in {seconds:.2f} s, "
+          f"the corrupt image failed alone and was retried on the next run")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark of parsing the sections of an Oryx article on a process pool
+(article_parser.iter_entries with workers) against parsing them one after another.
+Also checks that every worker count produces exactly the same entries.
+
+The article is the RU losses scaled to ENTRIES entries, or a saved page given as argument.
+With a saved page, it also lists the types read and fails if any section heading of the
+live page is missing from global_vars.section_heading_types.
+
+The pool only pays off with several CPUs. On a single CPU machine, the synthetic
+6.7 MB article took 1.7 to 1.9 s in one process and 2.5 to 4.1 s with 2, 4 or 8 workers
+(0.4 to 0.8x), which is why workers=None parses in one process there.
+
+Run from the repository root:
+python -m benchmarks.bench_section_parser [saved article]
+"""
+
+import os
+import sys
+import time
+
+import pandas as pd
+
+import global_vars
+from article_parser import iter_entries, split_sections
+from metrics import get_default_metrics
+from snapshot_store import read_article
+from benchmarks.fixtures import build_oryx_article, scale_losses
+
+# Entries in the scaled article.
+ENTRIES = 100_000
+# Worker processes tried; 1 parses the sections in this process and None lets iter_entries choose.
+WORKERS = (1, None, 2, 4, 8)
+
+def main(source: str | None = None):
+    if source is not None:
+        html = read_article(source)
+    else:
+        html = build_oryx_article(scale_losses(pd.read_csv("data/ru_losses.csv"), ENTRIES))
+    sections = split_sections(html)
+    print(f"{len(html)} bytes, {len(sections)} sections, {os.cpu_count()} CPUs")
+    if source is not None:
+        print(f"Types: {[section.category for section in sections if section.category is not None]}")
+        assert get_default_metrics().counter("unknown_headings") == 0, "unknown section headings"
+
+    baseline, baseline_time = None, None
+    for workers in WORKERS:
+        start_time = time.perf_counter()
+        entries = list(iter_entries(html, global_vars.ru_vehicle_types, workers))
+        seconds = time.perf_counter() - start_time
+        if baseline is None:
+            baseline, baseline_time = entries, seconds
+        assert entries == baseline, f"{workers} workers parsed different entries"
+        print(f"  {'auto' if workers is None else workers} workers: {len(entries)} entries in {seconds * 1000:.0f} ms "
+              f"({baseline_time / seconds:.1f}x)")
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
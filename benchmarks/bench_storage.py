@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of storage.load_losses/save_losses against plain read_csv/to_csv.
+
+Run from the repository root (needs pyarrow for the Parquet timings):
+python -m benchmarks.bench_storage
+"""
+
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+import storage
+from benchmarks.fixtures import scale_losses
+from date_normalization import add_date_lost
+
+# Rows in the table that is saved and loaded.
+ENTRIES = 100_000
+
+def timed(function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+def main():
+    df = pd.concat([pd.read_csv("data/ru_losses.csv"), pd.read_csv("data/ua_losses.csv")],
+                   ignore_index=True)
+    df = scale_losses(df, ENTRIES)
+    add_date_lost(df)
+    print(f"{len(df.index)} rows; pyarrow {'found' if storage.pyarrow else 'not installed'}")
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "losses.csv")
+        _, csv_save = timed(df.to_csv, path, index=False)
+        csv_df, csv_load = timed(pd.read_csv, path)
+        typed = storage.save_losses(df, path)
+        if storage.pyarrow is not None:
+            _, parquet_save = timed(storage.save_losses, typed, path, csv=False)
+        loaded, typed_load = timed(storage.load_losses, path)
+        sizes = (os.path.getsize(path), os.path.getsize(storage.parquet_path(path))
+                 if storage.pyarrow is not None else None)
+
+    print(f"Plain CSV:  save {csv_save * 1000:.0f} ms, load {csv_load * 1000:.0f} ms, "
+          f"{csv_df.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory, {sizes[0] / 1e6:.1f} MB on disk")
+    if storage.pyarrow is not None:
+        print(f"Parquet:    save {parquet_save * 1000:.0f} ms, load {typed_load * 1000:.0f} ms, "
+              f"{loaded.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory, {sizes[1] / 1e6:.1f} MB on disk")
+        print(f"Load {csv_load / typed_load:.1f}x faster, save {csv_save / parquet_save:.1f}x faster")
+    else:
+        print(f"Typed CSV:  load {typed_load * 1000:.0f} ms, "
+              f"{loaded.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Builders for the HTML fixtures used by the benchmarks.
+
+Oryx articles are rebuilt from an existing losses CSV, so the fixtures have the same
+shape as the live page (one <ul> per vehicle type, one <li> per vehicle with a flag
+and one link per proof) without touching the network. Postimg pages carry titles in
+the date orders Oryx actually uses, plus titles without a usable date.
+"""
+
+import html
+
+import pandas as pd
+
+FLAG_SRC = "https://upload.wikimedia.org/wikipedia/commons/thumb/x/xx/Flag_of_{0}.svg/23px-Flag_of_{0}.svg.png"
+
+POSTIMG_TITLES = ["{0} t72b3 dest 05 08 23",  # day month year
+                  "{0} bmp2 capt 08 05 2023", # month day four digit year
+                  "{0} t80bv dam 23 08 05",   # year month day
+                  "{0} 2s19 abnd 17 11 22",
+                  "{0} t90m dest 5 8 23",     # single digits, no date found
+                  "{0} kamaz dest",           # no date at all
+                  "{0} bmd4m capt 31 12"]     # day and month only
+"""
+Title formats given to postimg fixture pages in turn; {0} is the page number.
+"""
+
+LIVE_HEADINGS = {"Armored Fighting Vehicles": "Armoured Fighting Vehicles",
+                 "Command Posts and Communications Stations": "Command Posts And Communications Stations",
+                 "Engineering Vehicles and Equipment": "Engineering Vehicles And Equipment",
+                 "Artillery Support Vehicles and Equipment": "Artillery Support Vehicles And Equipment",
+                 "Self Propelled Artillery": "Self-Propelled Artillery",
+                 "Rocket and Missile Artillery": "Multiple Rocket Launchers",
+                 "Jammers and Deception Systems": "Jammers And Deception Systems",
+                 "Trucks, Vehicles, and Jeeps": "Trucks, Vehicles and Jeeps"}
+"""
+Section headings as the live pages spell them, for the types of the CSVs that the
+pages spell differently. Other types are written as they are.
+"""
+
+def build_oryx_article(df: pd.DataFrame) -> str:
+    """
+    Builds an Oryx-style loss article from rows laid out as global_vars.df_colnames.
+    Like the live page, it opens with a heading totalling the losses, and every type
+    gets an <h3> heading spelled as in LIVE_HEADINGS.
+    Consecutive rows with the same name share one <li>; consecutive rows with the
+    same proof and status share one link, such as (5, 6, 7, captured).
+
+    ## Parameters
+    df: a losses DataFrame, such as data/ru_losses.csv.
+    """
+    out = ["<html><head><title>Attack On Europe: Documenting Equipment Losses</title></head>",
+           "<body><article>",
+           f"<h3><span style=\"color: red;\">{html.escape(str(df['user'].iloc[0]))} - {len(df.index)}, "
+           f"of which: destroyed: {len(df.index)}</span></h3>"]
+    rows = df.to_dict("records")
+    groups = [] # [name, [rows]] for every run of rows with the same name
+    for row in rows:
+        if groups and groups[-1][0] == row["name"]:
+            groups[-1][1].append(row)
+        else:
+            groups.append([row["name"], [row]])
+
+    current_type = None
+    number = 1
+    for name, group in groups:
+        vehicle_type = group[0]["type"]
+        if vehicle_type != current_type:
+            if current_type is not None:
+                out.append("</ul>")
+            heading = LIVE_HEADINGS.get(vehicle_type, str(vehicle_type))
+            out.append(f"<h3><span class=\"mw-headline\">{html.escape(heading)}"
+                       f" ({len(group)}, of which destroyed: {len(group)})</span></h3><ul>")
+            current_type = vehicle_type
+        flag = FLAG_SRC.format(str(group[0]["manufacturer"]).replace(" ", "_"))
+        entry = f"<li><img class=\"thumbborder\" src=\"{flag}\" width=\"23\"> {len(group)} {html.escape(str(name))}:"
+        start = 0
+        while start < len(group):
+            end = start
+            while (end + 1 < len(group) and group[end + 1]["proof"] == group[start]["proof"]
+                   and group[end + 1]["status"] == group[start]["status"]):
+                end += 1
+            numbers = ", ".join(str(n) for n in range(number, number + end - start + 1))
+            number += end - start + 1
+            entry += f" <a href=\"{html.escape(group[start]['proof'])}\">({numbers}, {group[start]['status']})</a>"
+            start = end + 1
+        out.append(entry + "</li>")
+    out.append("</ul></article></body></html>")
+    return "\n".join(out)
+
+def build_donations_article(df: pd.DataFrame) -> str:
+    """
+    Builds an Oryx-style donations article from rows laid out as
+    global_vars.df_donations_colnames: one <ul> per vehicle type and one <li> per
+    donation, with the supplier's flag, the count and a link named after the vehicle.
+    Pledged donations are marked "[to be delivered]", and every name has a
+    non-breaking space in front of it, as on the live page.
+
+    ## Parameters
+    df: a donations DataFrame, such as data_legacy/donated_vehicles.csv.
+    """
+    out = ["<html><head><title>Answering The Call: Heavy Weaponry Supplied To Ukraine</title></head>",
+           "<body><article>"]
+    current_type = None
+    for row in df.to_dict("records"):
+        if row["vehicle_type"] != current_type:
+            if current_type is not None:
+                out.append("</ul>")
+            out.append(f"<h3>{html.escape(str(row['vehicle_type']))}</h3><ul>")
+            current_type = row["vehicle_type"]
+        flag = FLAG_SRC.format(str(row["supplier"]).replace(" ", "_"))
+        pledged = "" if row["is_delivered"] else " [to be delivered]"
+        out.append(f"<li><img class=\"thumbborder\" src=\"{flag}\" width=\"23\"> {row['count']} "
+                   f"<a href=\"{html.escape(row['proof'])}\">\u00a0{html.escape(row['vehicle_name'], quote=False)}s</a>"
+                   f"{pledged}</li>")
+    out.append("</ul></article></body></html>")
+    return "\n".join(out)
+
+def scale_losses(df: pd.DataFrame, entries: int) -> pd.DataFrame:
+    """
+    Repeats the rows of a losses DataFrame until it holds `entries` rows,
+    giving each copy its own proof links so that they stay unique.
+    """
+    copies = []
+    total = 0
+    copy_number = 0
+    while total < entries:
+        copy = df.head(entries - total).copy()
+        if copy_number > 0:
+            copy["proof"] = copy["proof"] + f"{copy_number}"
+        copies.append(copy)
+        total += len(copy.index)
+        copy_number += 1
+    return pd.concat(copies, ignore_index=True)
+
+def build_postimg_page(index: int) -> bytes:
+    """
+    Builds a page shaped like a postimg post: a short <head> with the title and
+    Open Graph tags, followed by a long <body> full of navigation and scripts.
+    The title is the entry of POSTIMG_TITLES picked by index.
+    """
+    title = POSTIMG_TITLES[index % len(POSTIMG_TITLES)].format(index)
+    filename = title.replace(" ", "-")
+    head = ("<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\">"
+            f"<title>{title} &mdash; Postimages</title>"
+            "<link rel=\"stylesheet\" href=\"https://postimg.cc/css/main.css\">"
+            f"<meta property=\"og:title\" content=\"{title}\">"
+            f"<meta property=\"og:image\" content=\"https://i.postimg.cc/abc{index}/{filename}.jpg\">"
+            "<script>window.dataLayer = window.dataLayer || [];</script></head>")
+    body = "<body>" + "".join(f"<div class=\"nav\"><a href=\"/page{i}\">Link {i}</a></div>"
+                              for i in range(600)) + "</body></html>"
+    return (head + body).encode()
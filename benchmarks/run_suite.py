@@ -0,0 +1,196 @@
+"""
+Benchmark suite of the scraping pipeline, run against fixtures served by a local stub server.
+
+Measures:
+parse: parse_oryx on Oryx articles scaled to each of SIZES entries.
+resolve: resolve_dates on postimg pages with every title format of fixtures.POSTIMG_TITLES,
+at each of CONCURRENCY requests in flight, with every response delayed by LATENCY seconds.
+clean: normalize_dates, add_date_lost, merge_ocr_dates and a save_losses/load_losses
+round trip on the largest parsed table.
+
+The results are saved to benchmarks/results/<commit>.json and compared with the
+results of another commit (by default the most recently saved one), so a regression
+shows up as soon as it is committed.
+
+Run from the repository root:
+python -m benchmarks.run_suite [commit to compare with]
+"""
+
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import global_vars
+from async_fetcher import resolve_dates
+from crawl_journal import CrawlJournal
+from date_normalization import normalize_dates, add_date_lost, HEURISTICS
+from http_client import FetchClient
+from insert_dates_into_df import merge_ocr_dates
+from oryx_parser import parse_oryx
+from response_cache import ResponseCache, fetch_article
+from storage import save_losses, load_losses
+from benchmarks.fixtures import build_oryx_article, scale_losses
+from benchmarks.stub_server import StubServer
+
+RESULTS_DIR = "benchmarks/results"
+# Entries in the scaled Oryx articles.
+SIZES = (10_000, 50_000, 100_000)
+# Postimg pages resolved in every date resolution run.
+LINKS = 400
+# Requests in flight tried for date resolution.
+CONCURRENCY = (4, 16, 64)
+# Seconds the stub server waits before every response.
+LATENCY = 0.05
+# Change (as a fraction of the old time) above which a benchmark is reported as slower.
+TOLERANCE = 0.10
+
+def git_commit() -> str:
+    """
+    Returns the short hash of HEAD, with -dirty appended if the tree has uncommitted changes.
+    """
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                            text=True).stdout.strip() or "unknown"
+    status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                            capture_output=True, text=True).stdout.strip()
+    return commit + "-dirty" if status else commit
+
+def timed(function, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+def bench_parse(server: StubServer, folder: str) -> tuple[dict, pd.DataFrame]:
+    """
+    Serves a scaled RU article for every size, downloads it through fetch_article
+    and times parse_oryx (without date lookups) plus the export to a DataFrame.
+    Returns the results and the table parsed from the largest article.
+    """
+    page = global_vars.oryx_pages[0]
+    df = pd.read_csv(page["output"])
+    cache = ResponseCache(os.path.join(folder, "parse_cache.sqlite3"))
+    client = FetchClient(host_rate=None)
+    results = {}
+    parsed = None
+    for size in SIZES:
+        url = server.add_page(f"/oryx_{size}", build_oryx_article(scale_losses(df, size)).encode())
+        html, download_seconds = timed(fetch_article, url, cache=cache, client=client)
+        start_time = time.perf_counter()
+        records, _, _ = parse_oryx(html, page["user"], page["vehicle_types"], fetch_dates=False)
+        parsed = records.to_dataframe()
+        seconds = time.perf_counter() - start_time
+        results[f"parse_{size}"] = {"seconds": seconds, "items": len(parsed.index),
+                                    "unit": "rows"}
+        results[f"download_{size}"] = {"seconds": download_seconds, "items": len(html),
+                                       "unit": "bytes"}
+    cache.close()
+    client.close()
+    return results, parsed
+
+def bench_resolve(server: StubServer, folder: str) -> dict:
+    """
+    Times resolve_dates over LINKS postimg pages at every CONCURRENCY, each run with
+    an empty cache and journal so that every page is downloaded.
+    """
+    results = {}
+    for max_in_flight in CONCURRENCY:
+        # new paths for every run; the server answers any page number
+        links = [server.url(f"/p/{max_in_flight * LINKS + i}") for i in range(LINKS)]
+        cache = ResponseCache(os.path.join(folder, f"resolve_cache_{max_in_flight}.sqlite3"))
+        journal = CrawlJournal(os.path.join(folder, f"journal_{max_in_flight}.sqlite3"))
+        client = FetchClient(pool_size=max_in_flight, host_rate=None)
+        dates, seconds = timed(resolve_dates, links, max_in_flight=max_in_flight,
+                               journal=journal, cache=cache, client=client)
+        dated = sum(1 for date in dates.values() if date[0] is not None)
+        results[f"resolve_{max_in_flight}_in_flight"] = {"seconds": seconds, "items": len(dates),
+                                                         "unit": "links", "dated": dated}
+        for closable in (cache, journal, client):
+            closable.close()
+    return results
+
+def bench_clean(df: pd.DataFrame, folder: str) -> dict:
+    """
+    Times the cleaning and merging stages on a parsed table with made-up dates.
+    """
+    rows = len(df.index)
+    # dates in every order normalize_dates has to fix
+    df = df.assign(day=[(5, 8, 23, 31)[i % 4] for i in range(rows)],
+                   month=[(8, 5, 8, 12)[i % 4] for i in range(rows)],
+                   year=[(23, 2023, 5, 22)[i % 4] for i in range(rows)])
+    ocr_dates = pd.read_csv("data_legacy/total_losses_with_processed_dates.csv")
+    results = {}
+    _, seconds = timed(normalize_dates, df, heuristics=HEURISTICS)
+    results["normalize_dates"] = {"seconds": seconds, "items": rows, "unit": "rows"}
+    _, seconds = timed(add_date_lost, df)
+    results["add_date_lost"] = {"seconds": seconds, "items": rows, "unit": "rows"}
+    _, seconds = timed(merge_ocr_dates, df, ocr_dates)
+    results["merge_ocr_dates"] = {"seconds": seconds, "items": rows, "unit": "rows"}
+    path = os.path.join(folder, "losses.csv")
+    _, seconds = timed(save_losses, df, path)
+    results["save_losses"] = {"seconds": seconds, "items": rows, "unit": "rows"}
+    _, seconds = timed(load_losses, path)
+    results["load_losses"] = {"seconds": seconds, "items": rows, "unit": "rows"}
+    return results
+
+def compare(old: dict, new: dict) -> list[str]:
+    """
+    Returns one line per benchmark found in both result sets, with the change in time.
+    """
+    lines = []
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        old_seconds = old["results"][name]["seconds"]
+        change = (result["seconds"] - old_seconds) / old_seconds if old_seconds else 0.0
+        flag = "  SLOWER" if change > TOLERANCE else ""
+        lines.append(f"  {name:<28} {old_seconds:9.3f} s -> {result['seconds']:9.3f} s ({change:+.0%}){flag}")
+    return lines
+
+def load_results(commit: str | None = None, exclude: str | None = None) -> dict | None:
+    """
+    Returns the saved results of a commit, or the most recently saved results
+    other than those of `exclude` if commit is None.
+    """
+    if commit is not None:
+        path = os.path.join(RESULTS_DIR, f"{commit}.json")
+        paths = [path] if os.path.exists(path) else []
+    else:
+        paths = sorted((path for path in glob.glob(os.path.join(RESULTS_DIR, "*.json"))
+                        if os.path.basename(path) != f"{exclude}.json"), key=os.path.getmtime)
+    if not paths:
+        return None
+    with open(paths[-1]) as f:
+        return json.load(f)
+
+def main(compare_with: str | None = None) -> dict:
+    commit = git_commit()
+    results = {}
+    with tempfile.TemporaryDirectory() as folder, StubServer(latency=LATENCY) as server:
+        parse_results, parsed = bench_parse(server, folder)
+        results.update(parse_results)
+        results.update(bench_resolve(server, folder))
+        results.update(bench_clean(parsed, folder))
+
+    run = {"commit": commit, "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+           "python": platform.python_version(), "pandas": pd.__version__,
+           "latency": LATENCY, "results": results}
+    for name, result in results.items():
+        print(f"{name:<30} {result['seconds']:9.3f} s  {result['items'] / result['seconds']:14,.0f} {result['unit']}/s")
+
+    previous = load_results(compare_with, exclude=commit)
+    if previous is not None:
+        print(f"Compared with {previous['commit']} ({previous['time']}):")
+        print("\n".join(compare(previous, run)))
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, f"{commit}.json"), "w") as f:
+        json.dump(run, f, indent=1)
+    return run
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,110 @@
+"""
+A local HTTP stand-in for Oryx and postimg, used by the benchmarks.
+
+The server runs in a background thread on 127.0.0.1 and answers every request after
+a configurable delay, so fetch code can be timed against a steady, known latency
+instead of the live sites.
+Pages registered with add_page are served as they are (such as a fixture Oryx article),
+and /p/<number> serves benchmarks.fixtures.build_postimg_page(number).
+
+Example use:
+with StubServer(latency=0.05) as server:
+    server.add_page("/ru", build_oryx_article(df).encode())
+    links = [server.url(f"/p/{i}") for i in range(100)]
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fixtures import build_postimg_page
+
+# Seconds every response is delayed by, roughly a postimg round trip.
+LATENCY = 0.05
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        body = server.pages.get(self.path)
+        if body is None and self.path.startswith("/p/") and self.path[3:].isdigit():
+            body = build_postimg_page(int(self.path[3:]))
+        with server.lock:
+            server.requests += 1
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # keep the benchmark output readable
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256 # benchmarks open many connections at once
+
+class StubServer:
+    """
+    Serves fixture pages on a free local port until stopped.
+
+    ## Parameters
+    latency: seconds every response is delayed by; can be changed while running.
+    """
+    def __init__(self, latency: float = LATENCY):
+        self.server = _Server(("127.0.0.1", 0), _Handler)
+        self.server.latency = latency
+        self.server.pages = {}
+        self.server.lock = threading.Lock()
+        self.server.requests = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def latency(self) -> float:
+        return self.server.latency
+
+    @latency.setter
+    def latency(self, seconds: float):
+        self.server.latency = seconds
+
+    @property
+    def requests(self) -> int:
+        """
+        Number of requests answered so far.
+        """
+        with self.server.lock:
+            return self.server.requests
+
+    def url(self, path: str) -> str:
+        """
+        Returns the full URL of a path on the server.
+
+        Example input: /p/12
+        Example output: http://127.0.0.1:41235/p/12
+        """
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{path}"
+
+    def add_page(self, path: str, body: bytes) -> str:
+        """
+        Serves body at path and returns the page's full URL.
+        """
+        self.server.pages[path] = body
+        return self.url(path)
+
+    def start(self) -> "StubServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
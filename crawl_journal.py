@@ -0,0 +1,151 @@
+"""
+This file contains a durable journal of the postimg links a crawl has to resolve.
+
+Every link is recorded as pending, done (with its date) or failed (with the number
+of attempts and the class of the last error). Results are committed to disk every
+CHECKPOINT_EVERY links, so a crashed or interrupted run picks up where it stopped
+instead of starting over. It replaces the old unscanned_links.txt append log.
+See drain_failed in async_fetcher.py for the retry worker.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from proof_index import canonical_proof
+
+JOURNAL_PATH = "cache/crawl_journal.sqlite3"
+# Number of recorded results between two commits to disk.
+CHECKPOINT_EVERY = 100
+# A link that failed this many times is left for manual review.
+MAX_ATTEMPTS = 5
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+class CrawlJournal:
+    """
+    SQLite-backed record of the state of each link in a crawl.
+
+    ## Parameters
+    path: location of the SQLite file. Its folder is created if needed.
+    checkpoint_every: number of recorded results between two commits.
+    """
+    def __init__(self, path: str = JOURNAL_PATH, checkpoint_every: int = CHECKPOINT_EVERY):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.uncommitted = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                link TEXT PRIMARY KEY,
+                                state TEXT NOT NULL,
+                                attempts INTEGER NOT NULL DEFAULT 0,
+                                error TEXT,
+                                day INTEGER,
+                                month INTEGER,
+                                year INTEGER,
+                                updated_at REAL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)")
+        self.conn.commit()
+
+    def add_links(self, links):
+        """
+        Records links as pending. Links already in the journal keep their state.
+        """
+        now = time.time()
+        with self.lock:
+            self.conn.executemany("INSERT OR IGNORE INTO jobs (link, state, updated_at) VALUES (?, ?, ?)",
+                                  [(canonical_proof(link), PENDING, now) for link in links])
+            self.conn.commit()
+
+    def state(self, link: str) -> tuple[str, int] | None:
+        """
+        Returns the (state, attempts) of a link, or None if it was never added.
+        """
+        with self.lock:
+            return self.conn.execute("SELECT state, attempts FROM jobs WHERE link = ?",
+                                     (canonical_proof(link),)).fetchone()
+
+    def result(self, link: str) -> tuple[int, int, int] | tuple[None, None, None]:
+        """
+        Returns the day, month, year recorded for a link, or None values.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT day, month, year FROM jobs WHERE link = ? AND state = ?",
+                                    (canonical_proof(link), DONE)).fetchone()
+        return row if row is not None else (None, None, None)
+
+    def links_in_state(self, state: str, max_attempts: int | None = None) -> list:
+        """
+        Returns every link in the given state, optionally only those
+        that were attempted fewer than max_attempts times.
+        """
+        query = "SELECT link FROM jobs WHERE state = ?"
+        params = [state]
+        if max_attempts is not None:
+            query += " AND attempts < ?"
+            params.append(max_attempts)
+        with self.lock:
+            return [row[0] for row in self.conn.execute(query, params)]
+
+    def record_done(self, link: str, date: tuple):
+        """
+        Records a link as resolved. date is a (day, month, year) tuple that may hold None values.
+        """
+        self._record("""UPDATE jobs SET state = ?, attempts = attempts + 1, error = NULL,
+                        day = ?, month = ?, year = ?, updated_at = ? WHERE link = ?""",
+                     (DONE, *date, time.time(), canonical_proof(link)))
+
+    def record_failed(self, link: str, error: BaseException):
+        """
+        Records a failed attempt at a link along with the class of the error raised.
+        """
+        self._record("""UPDATE jobs SET state = ?, attempts = attempts + 1, error = ?,
+                        updated_at = ? WHERE link = ?""",
+                     (FAILED, error.__class__.__name__, time.time(), canonical_proof(link)))
+
+    def _record(self, query: str, params: tuple):
+        with self.lock:
+            self.conn.execute(query, params)
+            self.uncommitted += 1
+            if self.uncommitted >= self.checkpoint_every:
+                self.conn.commit()
+                self.uncommitted = 0
+
+    def checkpoint(self):
+        """
+        Commits every result recorded so far to disk.
+        """
+        with self.lock:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def counts(self) -> dict:
+        """
+        Returns a dict of {state: number of links}.
+        """
+        with self.lock:
+            return dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def close(self):
+        self.checkpoint()
+        with self.lock:
+            self.conn.close()
+
+_default_journal = None
+_default_journal_lock = threading.Lock()
+
+def get_default_journal() -> CrawlJournal:
+    """
+    Returns the journal shared by every crawl, opening it on first use.
+    """
+    global _default_journal
+    with _default_journal_lock:
+        if _default_journal is None:
+            _default_journal = CrawlJournal()
+        return _default_journal
@@ -0,0 +1,97 @@
+"""
+This file contains vectorized clean up of the day, month, year columns and the
+construction of the date_lost column.
+
+The dates come from postimg titles, which Oryx writes in several orders
+("05 08 23", "08 05 2023", "23 08 05"). Each heuristic below picks out the rows in
+one of those orders with a NumPy mask and fixes all of them at once, instead of
+building a pd.Series for every row. normalize_dates reports how many rows each
+heuristic fixed.
+
+Only four_digit_year, the fix oryx_parser always applied (swap_ddmmyy), runs by
+default. year_first and month_over_12 change dates the scraper used to keep as they
+were, so they only run when asked for, and the rows they change can be collected
+for review.
+"""
+
+import numpy as np
+import pandas as pd
+from parser_helpers import FIRST_YR, current_yr
+
+DATE_COLS = ["day", "month", "year"]
+# Every heuristic of normalize_dates, in the order they are applied.
+HEURISTICS = ("four_digit_year", "year_first", "month_over_12")
+# The heuristics applied when none are named: those of the old swap_ddmmyy.
+DEFAULT_HEURISTICS = ("four_digit_year",)
+
+def _column(df: pd.DataFrame, col: str) -> np.ndarray:
+    return pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float, copy=True)
+
+def normalize_dates(df: pd.DataFrame, rows=None, heuristics=DEFAULT_HEURISTICS,
+                    changed: dict | None = None) -> dict:
+    """
+    Fixes the day, month, year columns of df in place and returns a dict of
+    {heuristic: number of rows it fixed}. Years end up as two digits (23, not 2023).
+    A row is fixed by at most one heuristic: the later ones skip the rows an earlier
+    one changed, so "22 08 2022" is not swapped by four_digit_year and back again
+    by month_over_12.
+
+    Heuristics (see HEURISTICS), applied in this order:
+    four_digit_year: "08 05 2023" titles are month first; swap day and month
+    and drop the century.
+    year_first: "23 08 05" titles (year < 22 but day a war year) are year first;
+    swap day and year.
+    month_over_12: a month above 12 with a day of 12 or below is really the day;
+    swap day and month.
+
+    ## Parameters
+    df: a losses DataFrame with day, month, year columns.
+    rows: an optional boolean mask; only those rows are looked at.
+    heuristics: names of the heuristics to apply; defaults to DEFAULT_HEURISTICS.
+    changed: if given, filled with {heuristic: index labels of the rows it changed}.
+    """
+    unknown = set(heuristics) - set(HEURISTICS)
+    if unknown:
+        raise KeyError(f"No date heuristics named {sorted(unknown)}; pick from {list(HEURISTICS)}")
+    day, month, year = (_column(df, col) for col in DATE_COLS)
+    selected = np.ones(len(day), dtype=bool) if rows is None else np.asarray(rows, dtype=bool)
+    counts = {}
+    last_yr = current_yr()
+
+    if "four_digit_year" in heuristics:
+        mask = selected & (year >= 2000 + FIRST_YR) & (year <= 2000 + last_yr)
+        day[mask], month[mask], year[mask] = month[mask], day[mask], year[mask] - 2000
+        counts["four_digit_year"] = int(mask.sum())
+        selected = selected & ~mask
+        if changed is not None:
+            changed["four_digit_year"] = df.index[mask]
+
+    if "year_first" in heuristics:
+        mask = selected & (year < FIRST_YR) & (day >= FIRST_YR) & (day <= last_yr)
+        day[mask], year[mask] = year[mask], day[mask]
+        counts["year_first"] = int(mask.sum())
+        selected = selected & ~mask
+        if changed is not None:
+            changed["year_first"] = df.index[mask]
+
+    if "month_over_12" in heuristics:
+        mask = selected & (month > 12) & (day <= 12)
+        day[mask], month[mask] = month[mask], day[mask]
+        counts["month_over_12"] = int(mask.sum())
+        if changed is not None:
+            changed["month_over_12"] = df.index[mask]
+
+    df["day"], df["month"], df["year"] = day, month, year
+    return counts
+
+def add_date_lost(df: pd.DataFrame) -> int:
+    """
+    Builds the date_lost column from day, month and two-digit year in a single
+    pd.to_datetime call. Returns how many rows had all three numbers but no
+    real date (such as 31 02 23); those get NaT, like rows without a date.
+    """
+    day, month, year = (_column(df, col) for col in DATE_COLS)
+    components = pd.DataFrame({"year": year + 2000, "month": month, "day": day})
+    df["date_lost"] = pd.to_datetime(components, errors="coerce")
+    has_numbers = ~(np.isnan(day) | np.isnan(month) | np.isnan(year))
+    return int((has_numbers & df["date_lost"].isna().to_numpy()).sum())
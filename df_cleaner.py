@@ -5,23 +5,12 @@ and process them to deal with missing and bad values.
 
 import pandas as pd
 import numpy as np
-import re
-from bs4 import BeautifulSoup
-import requests
-
-#direct_links_found = 0
+from image_store import get_default_image_store
+from proof_index import ProofIndex, canonical_proofs, twitter_dates, POSTIMG, TWITTER
+from date_normalization import add_date_lost
+from storage import load_losses, save_losses
 
 openai_key = "lmao no"
-# reference: https://stackoverflow.com/questions/47969756/pandas-apply-function-that-returns-two-new-columns
-def swap_ddmmyy(row):
-    #print(row)
-    day = row["day"]
-    month = row["month"]
-    year = row["year"]
-    if year == 2022 or year == 2023: # datetime stored in year month day format
-        return pd.Series([month, day, year - 2000])
-    else: return pd.Series([day, month, year])
-
 def unmix_ddmmyy(row):
     day = row["day"]
     month = row["month"]
@@ -53,7 +42,8 @@ def merge_donation_years():
     """
     Merges first made years for RU and UA donated equipment.
     """
-    donated_vehicles = pd.read_csv("donated_vehicles.csv")
+    # donations_parser already fills in the years; merge them afresh
+    donated_vehicles = pd.read_csv("donated_vehicles.csv").drop(columns="year_first_produced", errors="ignore")
     years = pd.read_csv("donated_vehicles_years.csv")
     donated_vehicles = donated_vehicles.merge(right=years, on="vehicle_name", how="left")
     donated_vehicles.to_csv("donated_vehicles.csv", index=False)
@@ -64,8 +54,8 @@ def merge_production_years():
     """
     #ru_uniques = pd.read_csv("ru_unique_vehicles_years.csv")
     ua_uniques = pd.read_csv("ua_unique_vehicles.csv")
-    #ru_losses = pd.read_csv("ru_losses.csv")
-    ua_losses = pd.read_csv("ua_losses.csv")
+    #ru_losses = load_losses("ru_losses.csv")
+    ua_losses = load_losses("ua_losses.csv")
     
     ua_losses = ua_losses.merge(right=ua_uniques,
                                 on="name",
@@ -80,110 +70,94 @@ def merge_production_years():
     #                             how="left")
     #ru_losses.update(ua_uniques)
     
-    #ru_losses.to_csv("ru_losses.csv", index=False)
-    ua_losses.to_csv("ua_losses.csv", index=False)
+    #save_losses(ru_losses, "ru_losses.csv")
+    save_losses(ua_losses, "ua_losses.csv")
 
 def remove_extra_cols():
     """
     Removes extra colums that crop up from running merge_production_years repeatedly.
+    load_losses drops the "Unnamed: 0.x" index columns and save_losses never writes
+    the index, so a load and save is all that is left to do.
     """
-    ru_losses = pd.read_csv("ru_losses.csv")
-    ua_losses = pd.read_csv("ua_losses.csv")
+    ru_losses = load_losses("ru_losses.csv")
+    ua_losses = load_losses("ua_losses.csv")
 
     #ua_losses.drop(["year_first_produced_x", "year_first_produced_y"],axis=1, inplace=True)
     #ru_losses.drop(["year_first_produced_x", "year_first_produced_y"],axis=1, inplace=True)
-    ua_losses.drop(["Unnamed: 0.2", "Unnamed: 0.1", "Unnamed: 0", "Unnamed: 0.3"],axis=1, inplace=True)
-    ru_losses.drop(["Unnamed: 0.2", "Unnamed: 0.1", "Unnamed: 0", "Unnamed: 0.3"],axis=1, inplace=True)
     print(ua_losses.head(5))
-    ru_losses.to_csv("ru_losses.csv", index=False)
-    ua_losses.to_csv("ua_losses.csv", index=False)
-
-def make_datetime(row):
-    """
-    Convert day, month, year ints into a datetime value.
-    """
-    #print(row)
-    if pd.isna(row["year"]): return None
-    dt_string = "" + str(int(row["year"] + 2000)) + "-" + str(int(row["month"])) + "-" + str(int(row["day"]))
-    #print(dt_string)
-    return pd.to_datetime(dt_string)
+    save_losses(ru_losses, "ru_losses.csv")
+    save_losses(ua_losses, "ua_losses.csv")
 
 def add_fix_datetime():
     """
     Turns DDMMYY into datetime and also highlights badly formatted datetime values.
     """
-    ru_losses = pd.read_csv('ru_losses.csv')
-    ua_losses = pd.read_csv('ua_losses.csv')
+    ru_losses = load_losses("ru_losses.csv")
+    ua_losses = load_losses("ua_losses.csv")
 
-    ru_losses["date_lost"] = ru_losses[["day", "month", "year"]].apply(lambda row: make_datetime(row), axis=1)
-    print(ru_losses["date_lost"])
-    ru_losses.to_csv('ru_losses.csv')
+    bad_dates = add_date_lost(ru_losses)
+    print(f"{bad_dates} RU rows have a day, month, year that is not a real date")
+    save_losses(ru_losses, "ru_losses.csv")
 
-    ua_losses["date_lost"] = ua_losses[["day", "month", "year"]].apply(lambda row: make_datetime(row), axis=1)
-    print(ua_losses["date_lost"])
-    ua_losses.to_csv('ua_losses.csv')
+    bad_dates = add_date_lost(ua_losses)
+    print(f"{bad_dates} UA rows have a day, month, year that is not a real date")
+    save_losses(ua_losses, "ua_losses.csv")
 
 def main():
-    global direct_links_found
-    direct_links_found = 0
+    clean_links()
     prepare_list()
     get_direct_links()
 
-def fix_postimg(link: str):
-    if "postimg" in link:
-        link = link.replace("postimg", "postlmg")
-        return link
-    else: return link
-
-def clean_links():
-    ru_losses = pd.read_csv("ru_losses.csv")
-    ua_losses = pd.read_csv("ua_losses.csv")
-    ru_losses["proof"] = ru_losses["proof"].apply(fix_postimg)
-    ua_losses["proof"] = ua_losses["proof"].apply(fix_postimg)
-    ru_losses.to_csv("ru_losses.csv", index=False)
-    ua_losses.to_csv("ua_losses.csv", index=False)
-
-def find_direct_link(source: str):
-    r = requests.get(source)
-    soup = BeautifulSoup(r.content, 'html.parser')
-    link = soup.find(property='og:image')
-    if link is not None:
-        link = link["content"]
-    global direct_links_found
-    direct_links_found += 1
-    print(f"{direct_links_found}: Processed link {source}")
-    return link
-
-def get_direct_links():
-    total_losses = pd.read_csv("total_losses_postimg_links.csv")
-    total_losses["direct link"] = total_losses["proof"].apply(find_direct_link)
-    total_losses.to_csv("total_losses_postimg_links.csv", index=False)
-
-def prepare_list():
-    clean_links()
-    ru_losses = pd.read_csv("ru_losses.csv")
-    ua_losses = pd.read_csv("ua_losses.csv")
-    ru_links = ru_losses[ru_losses["proof"].apply(lambda proof: "postlmg" in proof)]
-    ua_links = ua_losses[ua_losses["proof"].apply(lambda proof: "postlmg" in proof)]
-    total_links = pd.concat([ru_links["proof"], ua_links["proof"]]).to_frame()
-    total_links.drop_duplicates(inplace=True)
-    total_links.to_csv("total_losses_postimg_links.csv", index=False)
-
-def main1():
-    """
-    Main.
-    """
-    ru_losses = pd.read_csv("ru_losses.csv")
-    ua_losses = pd.read_csv("ua_losses.csv")
-    ru_links = ru_losses[ru_losses["proof"].apply(lambda proof: "twitter" in proof)]
-    ua_links = ua_losses[ua_losses["proof"].apply(lambda proof: "twitter" in proof)]
-    total_links = pd.concat([ru_links["proof"], ua_links["proof"]]).to_frame()
+def clean_links(ru_path: str = "ru_losses.csv", ua_path: str = "ua_losses.csv"):
+    """
+    Rewrites the proofs of the RU and UA losses tables in their canonical form, in place.
+    """
+    ru_losses = load_losses(ru_path)
+    ua_losses = load_losses(ua_path)
+    # one spelling per proof; see proof_index.canonical_proof
+    ru_losses["proof"] = canonical_proofs(ru_losses["proof"])
+    ua_losses["proof"] = canonical_proofs(ua_losses["proof"])
+    save_losses(ru_losses, ru_path)
+    save_losses(ua_losses, ua_path)
+
+def get_direct_links(path: str = "total_losses_postimg_links.csv"):
+    """
+    Adds a direct link column to the list of postimg proofs made by prepare_list, in place.
+    """
+    total_losses = pd.read_csv(path)
+    # the images are kept in the image store, so the OCR stage does not download them again
+    stored = get_default_image_store().fetch_all(total_losses["proof"])
+    total_losses["direct link"] = total_losses["proof"].map(lambda proof: stored.get(proof, (None, None))[0])
+    total_losses.to_csv(path, index=False)
+
+def losses_index(ru_path: str, ua_path: str) -> ProofIndex:
+    """
+    Returns a proof_index.ProofIndex of the proofs of the RU and UA losses tables.
+    """
+    index = ProofIndex()
+    index.add_rows("ru_losses", load_losses(ru_path))
+    index.add_rows("ua_losses", load_losses(ua_path))
+    return index
+
+def prepare_list(ru_path: str = "ru_losses.csv", ua_path: str = "ua_losses.csv",
+                 output: str = "total_losses_postimg_links.csv"):
+    """
+    Writes the distinct postimg proofs of the RU and UA losses tables to output.
+    """
+    total_links = pd.DataFrame({"proof": losses_index(ru_path, ua_path).proofs(POSTIMG)})
+    total_links.to_csv(output, index=False)
+
+def main1(ru_path: str = "ru_losses.csv", ua_path: str = "ua_losses.csv",
+          output: str = "total_losses_twitter_links.csv"):
+    """
+    Writes the distinct tweets of the RU and UA losses tables to output,
+    with the day each was posted on.
+    """
+    total_links = pd.DataFrame({"proof": losses_index(ru_path, ua_path).proofs(TWITTER)})
     print(total_links)
-    total_links["day"] = pd.Series([None for x in range(len(total_links.index))])
-    total_links["month"] = pd.Series([None for x in range(len(total_links.index))])
-    total_links["year"] = pd.Series([None for x in range(len(total_links.index))])
+    total_links = total_links.join(twitter_dates(total_links["proof"]))
     print(total_links)
-    total_links.to_csv("total_losses_twitter_links.csv", index=False)
+    total_links.to_csv(output, index=False)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""
+This file contains the parser for the Oryx page of vehicles supplied to Ukraine
+(global_vars.ua_supplies), and the diff of a new scrape against the previous dataset.
+
+parse_oryx_donations used to live in oryx_parser.py. It cleaned every item character
+by character, ran three uncompiled regexes for every link and always wrote
+donated_vehicles.csv. oryx_parser.main then read that file back to drop "Ringtausch"
+and renumber it, and df_cleaner.merge_donation_years read it back once more for the
+production years. Here every item is cleaned in one str.translate pass and matched
+with compiled patterns, straight from the raw HTML of the article instead of a
+BeautifulSoup tree. The filtering, production years and is_soviet are all done
+in memory, and ids come from record_store.stable_ids. diff_donations then keeps only
+the pledges that are new or changed since the previous dataset.
+
+Usage: python donations_parser.py
+"""
+
+import os
+import re
+from html import unescape
+
+import pandas as pd
+
+import global_vars
+from article_parser import article_html, flag_country, ANY_TAG_PATTERN
+from proof_index import canonical_proof, canonical_proofs
+from record_store import stable_ids, DONATION_ID_COLUMNS
+from snapshot_store import read_article
+from storage import write_csv
+
+DONATIONS_PATH = "donated_vehicles.csv"
+# New and changed pledges of the last scrape, written next to the dataset.
+CHANGES_PATH = "data/donated_vehicles_changes.csv"
+YEARS_PATH = "reference_data/donated_vehicles_years.csv"
+# Loss tables whose flags tell which vehicles were made in a former country.
+MANUFACTURER_SOURCES = ["data/ru_losses.csv", "data/ua_losses.csv"]
+
+DONATION_COLUMNS = global_vars.df_donations_colnames + ["year_first_produced"]
+"""
+Columns of the donations dataset: global_vars.df_donations_colnames plus the year the vehicle
+was first produced.
+"""
+
+EXCLUDED_NAMES = {"Ringtausch"}
+"""
+Link texts of the page that are not vehicles ("Ringtausch" is the German exchange programme).
+"""
+
+# Every item of the article. Items of the donations page are never nested.
+ITEM_PATTERN = re.compile(r"<li(?:\s[^>]*)?>.*?</li\s*>", re.IGNORECASE | re.DOTALL)
+# The src of the first image of an item, which is the supplier's flag.
+FLAG_PATTERN = re.compile(r"""<img\s[^>]*?src\s*=\s*["']?([^"'\s>]*)""", re.IGNORECASE)
+# A count, then a link to the proof with the vehicle name as its text: 14 <a href="...">Su-25s</a>
+DONATION_PATTERN = re.compile(r"[0-9\s+]*<a href=(?P<href>[a-zA-Z0-9/\:\"\.\-]+)>"
+                              r"(?P<name>[a-zA-Z0-9\-\s/\'\(\)\*]+)</a>")
+# The count at the start of a match; "3+" counts as 3.
+COUNT_PATTERN = re.compile(r"([0-9]+)[+]*\s")
+# Item texts of vehicles that were only promised so far.
+PLEDGED_PATTERN = re.compile(r"\[to be delivered\]|pledged")
+
+class _AsciiTable(dict):
+    """
+    str.translate table keeping ASCII characters and turning every other character
+    into a space. Each character outside ASCII is only looked up once.
+    """
+    def __missing__(self, key: int) -> str:
+        self[key] = " "
+        return " "
+
+ASCII_TABLE = _AsciiTable((code, code) for code in range(128))
+"""
+Shared translate table; some items hold invisible characters that break the patterns.
+"""
+
+def sanitize(text: str) -> str:
+    """
+    Replaces every character outside ASCII with a space, in one pass.
+
+    Example input: 14 <a href="...">Su-25s</a>
+    Example output: 14 <a href="...">Su-25s</a>
+    """
+    return text.translate(ASCII_TABLE)
+
+def load_donation_years(path: str = YEARS_PATH) -> dict:
+    """
+    Returns a dict of {vehicle name: year of first production} for donated vehicles.
+    """
+    years = pd.read_csv(path).drop_duplicates("vehicle_name")
+    return years.set_index("vehicle_name")["year_first_produced"].to_dict()
+
+def load_manufacturers(paths: list[str] = MANUFACTURER_SOURCES) -> dict:
+    """
+    Returns a dict of {vehicle name: manufacturer} from the loss tables that exist.
+    """
+    manufacturers = {}
+    for path in paths:
+        if os.path.exists(path):
+            losses = pd.read_csv(path, usecols=["name", "manufacturer"]).dropna()
+            manufacturers.update(losses.drop_duplicates("name").set_index("name")["manufacturer"].to_dict())
+    return manufacturers
+
+def parse_item(item_html: str, item_text: str) -> list[tuple[str, int, str, bool]]:
+    """
+    Returns (vehicle name, count, proof, is_delivered) for every donation link of one <li>.
+
+    Example input: <li><img ...> 14 <a href="https://i.postimg.cc/RF9WvybT/547.png">Su-25s</a></li>
+    Example output: [("Su-25", 14, "https://postimg.cc/RF9WvybT", True)]
+
+    ## Parameters
+    item_html: the HTML of the <li>, with its entities decoded.
+    item_text: its text, which says whether the vehicles were delivered yet.
+    """
+    is_delivered = PLEDGED_PATTERN.search(item_text) is None
+    donations = []
+    for match in DONATION_PATTERN.finditer(sanitize(item_html)):
+        count = COUNT_PATTERN.search(match.group(0))
+        count = int(count.group(1)) if count is not None else 0 # no count given
+        name = match.group("name").lstrip(" ")
+        if name.endswith("s"): # "Su-25s"
+            name = name[:-1]
+        donations.append((name, count, canonical_proof(match.group("href").strip("\"")), is_delivered))
+    return donations
+
+def parse_oryx_donations(link: str, user: str, vehicle_types: dict, output: str | None = None,
+                         years: dict | None = None, manufacturers: dict | None = None) -> pd.DataFrame:
+    """
+    Parses the Oryx page of vehicles supplied to a country into a DataFrame with the
+    DONATION_COLUMNS columns, writes it to output (unless output is None) and returns it.
+
+    Self reference: this is how a line in the output CSV should look
+    3294193735857735319,Su-25,Aircraft,North Atlantic Treaty Organization,NATO,Ukraine,UA,14,True,True,https://postimg.cc/RF9WvybT,1978.0
+
+    ## Parameters
+    link: a link to the Oryx page, or a saved copy of one (see snapshot_store.read_article).
+    user: the country receiving the vehicles.
+    vehicle_types: a dictionary of the first entries of vehicle names and their types.
+    output: where to write the table, or None.
+    years: {vehicle name: year first produced}; defaults to load_donation_years().
+    manufacturers: {vehicle name: manufacturer}; defaults to load_manufacturers().
+    A vehicle is marked is_soviet if its manufacturer or supplier is in
+    global_vars.former_countries_list.
+    """
+    years = load_donation_years() if years is None else years
+    manufacturers = load_manufacturers() if manufacturers is None else manufacturers
+    former_countries = set(global_vars.former_countries_list)
+    article = article_html(read_article(link))
+    rows = []
+    vehicle_type = ""
+    for item in ITEM_PATTERN.finditer(article):
+        item_html = unescape(item.group(0))
+        donations = parse_item(item_html, ANY_TAG_PATTERN.sub("", item_html))
+        if not donations:
+            continue
+        # Identify the supplier using the flag image link.
+        supplier, supplier_abbr = None, None
+        flag = FLAG_PATTERN.search(item.group(0))
+        if flag is not None:
+            supplier, supplier_abbr = flag_country(unescape(flag.group(1)))
+        for name, count, proof, is_delivered in donations:
+            if name in vehicle_types:
+                vehicle_type = vehicle_types[name]
+            if name in EXCLUDED_NAMES:
+                continue
+            is_soviet = (manufacturers.get(name) in former_countries or supplier in former_countries
+                         or supplier_abbr in former_countries)
+            rows.append([None, name, vehicle_type, supplier, supplier_abbr, user,
+                         global_vars.manufacturer_dict[user], count, is_delivered, is_soviet,
+                         proof, years.get(name)])
+
+    df = pd.DataFrame(rows, columns=DONATION_COLUMNS)
+    df["id"] = stable_ids(df, DONATION_ID_COLUMNS)
+    if output is not None:
+        write_csv(df, output)
+    return df
+
+def diff_donations(df: pd.DataFrame, previous: pd.DataFrame | None) -> pd.DataFrame:
+    """
+    Returns the pledges of df that are not in previous, or whose values changed,
+    with a "change" column of "new" or "changed". Rows are matched by stable id,
+    so previous datasets with counted ids are matched too.
+
+    ## Parameters
+    df: a freshly parsed donations table.
+    previous: the donations dataset it replaces, or None.
+    """
+    if previous is None or len(previous.index) == 0:
+        return df.assign(change="new")
+    previous = previous.assign(proof=canonical_proofs(previous["proof"]))
+    previous["id"] = stable_ids(previous, DONATION_ID_COLUMNS)
+    columns = [col for col in DONATION_COLUMNS if col != "id" and col in previous.columns]
+    # compared as text, so 1978 and 1978.0 or True and "True" are the same value
+    new_values = df.set_index("id")[columns].astype("string").fillna("")
+    old_values = previous.drop_duplicates("id").set_index("id")[columns].astype("string").fillna("")
+    old_values = old_values.reindex(new_values.index)
+    is_new = old_values.isna().all(axis=1).to_numpy()
+    changed = ~is_new & (new_values != old_values.fillna("")).any(axis=1).to_numpy()
+    removed = len(previous.index) - int((~is_new).sum())
+    print(f"Donations: {int(is_new.sum())} new, {int(changed.sum())} changed, "
+          f"{max(removed, 0)} no longer listed")
+    return df[is_new | changed].assign(change=["new" if new else "changed" for new in is_new[is_new | changed]])
+
+def update_donations(link: str = global_vars.ua_supplies, user: str = "Ukraine",
+                     vehicle_types: dict = global_vars.donated_vehicle_types,
+                     output: str = DONATIONS_PATH, changes_output: str = CHANGES_PATH) -> pd.DataFrame:
+    """
+    Scrapes the donations page, writes the new and changed pledges to changes_output
+    and the whole table to output. Returns the new and changed pledges.
+    """
+    previous = pd.read_csv(output) if os.path.exists(output) else None
+    df = parse_oryx_donations(link, user, vehicle_types)
+    changes = diff_donations(df, previous)
+    write_csv(changes, changes_output)
+    write_csv(df, output)
+    return changes
+
+if __name__ == "__main__":
+    update_donations()
@@ -148,6 +148,48 @@ A dictionary of the first entries of vehicle types and their corresponding types
 in the Ukraine losses page.
 """
 
+section_heading_types = {"Tanks": "Tanks",
+                         "Armoured Fighting Vehicles": "Armored Fighting Vehicles",
+                         "Armored Fighting Vehicles": "Armored Fighting Vehicles",
+                         "Infantry Fighting Vehicles": "Infantry Fighting Vehicles",
+                         "Armoured Personnel Carriers": "Armoured Personnel Carriers",
+                         "Mine-Resistant Ambush Protected (MRAP) Vehicles": "Mine-Resistant Ambush Protected (MRAP) Vehicles",
+                         "Infantry Mobility Vehicles": "Infantry Mobility Vehicles",
+                         "Communications Stations": "Command Posts and Communications Stations",
+                         "Command Posts and Communications Stations": "Command Posts and Communications Stations",
+                         "Engineering Vehicles and Equipment": "Engineering Vehicles and Equipment",
+                         "Unmanned Ground Vehicles": "Unmanned Ground Vehicles",
+                         "Self-Propelled Anti-Tank Missile Systems": "Self-Propelled Anti-Tank Missile Systems",
+                         "Artillery Support Vehicles and Equipment": "Artillery Support Vehicles and Equipment",
+                         "Towed Artillery": "Towed Artillery",
+                         "Self-Propelled Artillery": "Self Propelled Artillery",
+                         "Self Propelled Artillery": "Self Propelled Artillery",
+                         "Multiple Rocket Launchers": "Rocket and Missile Artillery",
+                         "Rocket and Missile Artillery": "Rocket and Missile Artillery",
+                         "Anti-Aircraft Guns": "Anti-Aircraft Guns",
+                         "Self-Propelled Anti-Aircraft Guns": "Self-Propelled Anti-Aircraft Guns",
+                         "Surface-To-Air Missile Systems": "Surface-To-Air Missile Systems",
+                         "Radars": "Radars",
+                         "Radars and Communications Equipment": "Radars and Communications Equipment",
+                         "Jammers and Deception Systems": "Jammers and Deception Systems",
+                         "Aircraft": "Aircraft",
+                         "Helicopters": "Helicopters",
+                         "Unmanned Combat Aerial Vehicles": "Unmanned Combat Aerial Vehicles",
+                         "Reconnaissance Unmanned Aerial Vehicles": "Reconnaissance Unmanned Aerial Vehicles",
+                         "Naval Ships": "Naval Ships",
+                         "Naval Ships and Submarines": "Naval Ships and Submarines",
+                         "Logistics Trains": "Logistics Trains",
+                         "Trucks, Vehicles and Jeeps": "Trucks, Vehicles, and Jeeps",
+                         "Trucks, Vehicles, and Jeeps": "Trucks, Vehicles, and Jeeps"}
+"""
+A dictionary of the <h3> section headings of the losses pages (without their loss counts)
+and the vehicle types the rest of the repo uses for them, the same names as the
+values of ru_vehicle_types and ua_vehicle_types.
+Headings are matched without regard to case ("Engineering Vehicles And Equipment").
+article_parser.heading_category raises on a heading missing from here, so that a
+category Oryx adds or renames is noticed instead of becoming a new type silently.
+"""
+
 df_colnames = ["id", "name", "type", "status", 
                 "day", "month", "year", 
                 "manufacturer", "manufacturer_abbr", 
@@ -174,4 +216,23 @@ proof: postimg or twitter link that shows the loss.
 
 ru_losses = "https://www.oryxspioenkop.com/2022/02/attack-on-europe-documenting-equipment.html"
 ua_losses = "https://www.oryxspioenkop.com/2022/02/attack-on-europe-documenting-ukrainian.html"
-ua_supplies = "https://www.oryxspioenkop.com/2022/04/answering-call-heavy-weaponry-supplied.html"
\ No newline at end of file
+ua_supplies = "https://www.oryxspioenkop.com/2022/04/answering-call-heavy-weaponry-supplied.html"
+
+oryx_pages = [{"name": "ru_losses", "kind": "losses", "link": ru_losses, "user": "Russia",
+               "vehicle_types": ru_vehicle_types, "output": "data/ru_losses.csv"},
+              {"name": "ua_losses", "kind": "losses", "link": ua_losses, "user": "Ukraine",
+               "vehicle_types": ua_vehicle_types, "output": "data/ua_losses.csv"},
+              {"name": "ua_supplies", "kind": "donations", "link": ua_supplies, "user": "Ukraine",
+               "vehicle_types": donated_vehicle_types, "output": "donated_vehicles.csv"}]
+"""
+The Oryx pages scraped together by scrape_pages.py.
+
+name: label used in logs and as the key of the results.
+kind: losses (parsed by parse_oryx) or donations (parsed by parse_oryx_donations).
+link: the Oryx blog page.
+user: country whose losses or supplies the page lists.
+vehicle_types: dict of first entries and their vehicle types in the page.
+output: CSV the results are written to.
+
+Another page with the same layout (such as another conflict) only needs a new entry here.
+"""
@@ -0,0 +1,121 @@
+"""
+This file contains a lightweight extractor for the <title> and Open Graph tags of a page.
+
+postimg pages only hold two things the pipeline needs: the <title> (which often
+contains the date) and the og:image meta tag (the direct link to the image).
+Both live in <head>, so instead of downloading the whole page and building a full
+BeautifulSoup tree, the response is streamed through a small tokenizer that stops
+as soon as </head> (or <body>) is reached.
+"""
+
+import codecs
+from collections import namedtuple
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from http_client import FetchClient, get_default_client
+
+# Bytes read from the network at a time.
+CHUNK_SIZE = 4096
+# After </head>, a body shorter than this is read to the end so that the connection
+# can go back to the keep-alive pool; a longer one is dropped instead.
+DRAIN_LIMIT = 64 * 1024
+
+PageHead = namedtuple("PageHead", ["status", "title", "og"])
+"""
+status: HTTP status code.
+title: text of the <title> tag, or None.
+og: dict of Open Graph properties, such as {"og:image": "https://i.postimg.cc/..."}.
+"""
+
+class _HeadEnded(Exception):
+    pass
+
+class HeadParser(HTMLParser):
+    """
+    Collects the <title> text and og:* meta tags, and raises _HeadEnded
+    once the <head> of the page is over.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.og = {}
+        self.in_title = False
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and self.title is None:
+            self.in_title = True
+            self.title = ""
+        elif tag == "meta":
+            attrs = dict(attrs)
+            prop = attrs.get("property") or ""
+            if prop.startswith("og:") and prop not in self.og:
+                self.og[prop] = attrs.get("content")
+        elif tag == "body":
+            self.finish()
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+        elif tag == "head":
+            self.finish()
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+
+    def finish(self):
+        self.done = True
+        raise _HeadEnded()
+
+def parse_head(chunks) -> tuple[str | None, dict]:
+    """
+    Feeds chunks of HTML (bytes) into a HeadParser until the <head> ends.
+    Returns the title and the dict of og:* properties.
+    Chunks after the end of <head> are not consumed.
+
+    ## Parameters
+    chunks: an iterable of bytes, such as Response.iter_content().
+    """
+    parser = HeadParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        for chunk in chunks:
+            parser.feed(decoder.decode(chunk))
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+    except _HeadEnded:
+        pass
+    return parser.title, parser.og
+
+def fetch_head(url: str, client: FetchClient | None = None) -> PageHead:
+    """
+    Downloads only as much of a page as needed to read its <title> and og:* tags.
+    Network errors are left to the caller.
+
+    ## Parameters
+    url: link to a page, usually a postimg post.
+    client: the HTTP client to use; defaults to get_default_client().
+    """
+    client = client or get_default_client()
+    r = client.get(url, stream=True)
+    read = 0
+    def counted_chunks():
+        nonlocal read
+        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+            read += len(chunk)
+            yield chunk
+    # one iterator for both, since iter_content cannot be called again once
+    # parse_head has read a page without </head> to the end
+    chunks = counted_chunks()
+    try:
+        title, og = parse_head(chunks)
+        length = r.headers.get("Content-Length")
+        if length is not None and int(length) - read <= DRAIN_LIMIT:
+            for _ in chunks:
+                pass
+    finally:
+        r.close()
+        client.count(urlsplit(url).netloc, bytes=read)
+    return PageHead(r.status_code, title, og)
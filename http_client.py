@@ -0,0 +1,159 @@
+"""
+This file contains the HTTP client shared by every fetcher in the pipeline.
+
+One requests.Session owns a keep-alive connection pool, so the 13k+ postimg
+lookups reuse connections instead of opening a fresh TCP+TLS connection each.
+The client also applies the same timeouts and retry/backoff policy to every
+request, throttles each host with a token bucket, and keeps counters.
+"""
+
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import Metrics, get_default_metrics
+
+# Number of keep-alive connections kept open per host.
+POOL_SIZE = 64
+# Seconds to wait for a connection, and for the server to send data.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+# Retries on connection errors and 429/5xx answers, with exponential backoff.
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Requests per second allowed per host, and how many may be sent in a burst.
+HOST_RATE = 10.0
+HOST_BURST = 10
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire() blocks until a token is free.
+    A rate of 0 or None disables the limit.
+    """
+    def __init__(self, rate: float | None, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class FetchClient:
+    """
+    A pooled, rate-limited requests session.
+
+    ## Parameters
+    pool_size: keep-alive connections kept open per host.
+    timeout: (connect, read) timeout applied to every request that does not set its own.
+    retries: how many times a failed request is retried.
+    backoff: backoff factor between retries (0.5 -> 0.5s, 1s, 2s, ...).
+    host_rate: requests per second allowed per host.
+    host_burst: how many requests a host may receive in a burst.
+    metrics: where fetch latencies, bytes and errors are recorded; defaults to get_default_metrics().
+    """
+    def __init__(self, pool_size: int = POOL_SIZE,
+                 timeout: tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+                 retries: int = RETRY_TOTAL, backoff: float = RETRY_BACKOFF,
+                 host_rate: float | None = HOST_RATE, host_burst: int = HOST_BURST,
+                 metrics: Metrics | None = None):
+        self.timeout = timeout
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=("GET", "HEAD"), raise_on_status=False,
+                      respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.metrics = metrics or get_default_metrics()
+
+    def bucket(self, host: str) -> TokenBucket:
+        """
+        Returns the token bucket of a host, creating it on first use.
+        """
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.host_rate, self.host_burst)
+            return self.buckets[host]
+
+    def count(self, host: str | None = None, **amounts):
+        """
+        Adds to the client's counters. Downloaded bytes also go to the
+        fetch_bytes metric of the host.
+        """
+        with self.lock:
+            self.counters.update(amounts)
+        if amounts.get("bytes"):
+            self.metrics.inc("fetch_bytes", amounts["bytes"], host=host)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """
+        Sends a GET request through the pool. Takes the same keyword arguments
+        as requests.get; timeout defaults to the client's timeout.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlsplit(url).netloc
+        self.bucket(host).acquire()
+        start_time = time.perf_counter()
+        try:
+            r = self.session.get(url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            seconds = time.perf_counter() - start_time
+            self.count(requests=1, errors=1, seconds=seconds)
+            self.metrics.observe("fetch_seconds", seconds, host=host)
+            self.metrics.inc("fetch_errors", host=host, error=e.__class__.__name__)
+            raise
+        downloaded = 0 if kwargs.get("stream") else len(r.content)
+        seconds = time.perf_counter() - start_time
+        self.count(host, requests=1, bytes=downloaded, seconds=seconds,
+                   **{f"status_{r.status_code}": 1})
+        # for streamed responses this is the time to the headers; the body is read later
+        self.metrics.observe("fetch_seconds", seconds, host=host)
+        self.metrics.inc("fetch_requests", host=host, status=r.status_code)
+        return r
+
+    def stats(self) -> dict:
+        """
+        Returns a copy of the counters: requests, errors, bytes, seconds and status_<code>.
+        """
+        with self.lock:
+            return dict(self.counters)
+
+    def close(self):
+        self.session.close()
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_default_client() -> FetchClient:
+    """
+    Returns the client shared by every fetcher in the pipeline, creating it on first use.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = FetchClient()
+        return _default_client
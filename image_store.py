@@ -0,0 +1,263 @@
+"""
+This file contains a local, content-addressed store of the images behind postimg proofs.
+
+df_cleaner.get_direct_links used to look up every og:image link one at a time and
+throw the image away, so the OCR stage had to download every image again, and the
+~400 proofs that appear more than once were downloaded more than once.
+Here every image is downloaded once and saved under the SHA-256 of its content
+(cache/images/ab/abcdef...), and a SQLite index maps each proof to its direct link
+and each direct link to the hash of its image. Proofs already in the index, and
+proofs whose direct link is already stored, are never downloaded again, and identical
+images reached through different links are only saved once.
+
+The store can also crop and downscale images as they come in, so repeated OCR runs
+read small files. Use a separate folder for every set of ingest settings.
+"""
+
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from http_client import FetchClient, get_default_client
+from response_cache import ResponseCache, fetch_page_info
+from proof_index import canonical_proof
+from metrics import get_default_metrics
+
+try:
+    from PIL import Image
+except ImportError: # only needed to crop or downscale images on ingest
+    Image = None
+
+IMAGE_DIR = "cache/images"
+# Images downloaded at once by fetch_all.
+FETCH_WORKERS = 16
+# Quality of the JPEG images re-encoded after a crop or downscale.
+JPEG_QUALITY = 90
+
+# File suffix of an image by the bytes it starts with. The store keeps images
+# without a suffix, under their hash only.
+IMAGE_SUFFIXES = {b"\xff\xd8\xff": ".jpg", b"\x89PNG": ".png", b"GIF8": ".gif", b"RIFF": ".webp", b"BM": ".bmp"}
+
+def image_suffix(data: bytes) -> str:
+    """
+    Returns the file suffix matching an image's content, or "" if it is not a known format.
+
+    Example input: b"\\x89PNG\\r\\n..."
+    Example output: .png
+    """
+    for magic, suffix in IMAGE_SUFFIXES.items():
+        if data.startswith(magic):
+            return suffix
+    return ""
+
+def image_path(folder: str, digest: str) -> str:
+    """
+    Returns where the image with a given hash is saved in a store folder.
+
+    Example input: cache/images, 3f2a9c...
+    Example output: cache/images/3f/3f2a9c...
+    """
+    return os.path.join(folder, digest[:2], digest)
+
+class ImageStore:
+    """
+    Content-addressed image files plus a proof -> direct link -> hash index,
+    safe to share between threads.
+
+    ## Parameters
+    folder: where the images and index.sqlite3 are kept. Created if needed.
+    max_size: if given, images are downscaled on ingest so that neither side
+    is longer than this many pixels. Needs Pillow.
+    crop_box: if given, images are cropped on ingest to this (left, top, right, bottom)
+    box, in fractions of their size (see ocr_dates.CROP_BOX). Needs Pillow.
+    """
+    def __init__(self, folder: str = IMAGE_DIR, max_size: int | None = None,
+                 crop_box: tuple | None = None):
+        if (max_size is not None or crop_box is not None) and Image is None:
+            raise ImportError("Cropping or downscaling images on ingest needs the Pillow package")
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.max_size = max_size
+        self.crop_box = crop_box
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.conn = sqlite3.connect(os.path.join(folder, "index.sqlite3"), check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS proofs (
+                                proof TEXT PRIMARY KEY,
+                                direct_link TEXT)""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS links (
+                                direct_link TEXT PRIMARY KEY,
+                                hash TEXT,
+                                size INTEGER,
+                                stored_at REAL)""")
+        self.conn.commit()
+
+    def path(self, digest: str) -> str:
+        return image_path(self.folder, digest)
+
+    def lookup(self, proof: str) -> tuple[str | None, str | None] | None:
+        """
+        Returns (direct link, hash) for a proof, or None if the proof was never looked up.
+        The direct link is None for pages without an image, and the hash is None
+        if the image was not stored yet.
+        """
+        with self.lock:
+            row = self.conn.execute("""SELECT proofs.direct_link, links.hash FROM proofs
+                                       LEFT JOIN links ON proofs.direct_link = links.direct_link
+                                       WHERE proofs.proof = ?""", (canonical_proof(proof),)).fetchone()
+        return None if row is None else (row[0], row[1])
+
+    def link_hash(self, direct_link: str) -> str | None:
+        """
+        Returns the hash of the image stored for a direct link, or None.
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT hash FROM links WHERE direct_link = ?", (direct_link,)).fetchone()
+        return None if row is None else row[0]
+
+    def read(self, digest: str) -> bytes:
+        with open(self.path(digest), "rb") as f:
+            return f.read()
+
+    def get(self, proof: str) -> bytes | None:
+        """
+        Returns the stored image of a proof, or None if it has none.
+        """
+        found = self.lookup(proof)
+        if found is None or found[1] is None or not os.path.exists(self.path(found[1])):
+            return None
+        return self.read(found[1])
+
+    def ingest(self, data: bytes) -> bytes:
+        """
+        Applies the store's crop and downscale to an image. Bytes that are
+        not an image, or a store without either setting, are returned as they are.
+        """
+        if self.max_size is None and self.crop_box is None:
+            return data
+        try:
+            picture = Image.open(io.BytesIO(data))
+            picture.load()
+        except OSError:
+            return data
+        image_format = picture.format or "PNG"
+        if self.crop_box is not None:
+            width, height = picture.size
+            left, top, right, bottom = self.crop_box
+            picture = picture.crop((round(left * width), round(top * height),
+                                    round(right * width), round(bottom * height)))
+        if self.max_size is not None:
+            picture.thumbnail((self.max_size, self.max_size))
+        out = io.BytesIO()
+        if image_format == "JPEG":
+            picture.convert("RGB").save(out, format="JPEG", quality=JPEG_QUALITY)
+        else:
+            picture.save(out, format=image_format)
+        return out.getvalue()
+
+    def put(self, proof: str, direct_link: str | None, data: bytes | None = None) -> str | None:
+        """
+        Records a proof's direct link and, if data is given, stores the image
+        (after ingest) under its hash. Returns the hash, or None without data.
+        Identical images are only written once.
+        """
+        digest = None
+        if data is not None:
+            data = self.ingest(data)
+            digest = hashlib.sha256(data).hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                self.count("deduplicated")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + f".{threading.get_ident()}.tmp", "wb") as f:
+                    f.write(data)
+                os.replace(path + f".{threading.get_ident()}.tmp", path)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO proofs VALUES (?, ?)", (canonical_proof(proof), direct_link))
+            if digest is not None:
+                self.conn.execute("INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?)",
+                                  (direct_link, digest, len(data), time.time()))
+            self.conn.commit()
+        return digest
+
+    def count(self, result: str):
+        with self.lock:
+            self.counters[result] += 1
+        get_default_metrics().inc("image_store", result=result)
+
+    def fetch(self, proof: str, cache: ResponseCache | None = None,
+              client: FetchClient | None = None) -> tuple[str | None, str | None]:
+        """
+        Makes sure the image of a proof is stored and returns (direct link, hash).
+        The og:image link is looked up through the response cache, and the image
+        is only downloaded if neither the proof nor its direct link is stored yet.
+        Returns (None, None) for pages without an image. Network errors are left to the caller.
+        """
+        found = self.lookup(proof)
+        if found is not None and (found[0] is None or
+                                  (found[1] is not None and os.path.exists(self.path(found[1])))):
+            self.count("already stored" if found[0] is not None else "no image")
+            return found
+        client = client or get_default_client()
+        direct_link = found[0] if found is not None else fetch_page_info(proof, cache, client).og_image
+        if direct_link is None:
+            self.put(proof, None)
+            self.count("no image")
+            return None, None
+        digest = self.link_hash(direct_link)
+        if digest is not None and os.path.exists(self.path(digest)):
+            # another proof already led to the same image
+            self.put(proof, direct_link)
+            self.count("already stored")
+            return direct_link, digest
+        r = client.get(direct_link)
+        r.raise_for_status()
+        self.count("downloaded")
+        return direct_link, self.put(proof, direct_link, r.content)
+
+    def fetch_all(self, proofs, workers: int = FETCH_WORKERS, cache: ResponseCache | None = None,
+                  client: FetchClient | None = None) -> dict:
+        """
+        Stores the images of many proofs concurrently.
+        Returns a dict of {proof: (direct link, hash)}; proofs whose page or image
+        failed to download are left out, so calling fetch_all again retries them.
+
+        ## Parameters
+        proofs: an iterable of postimg proofs. Duplicates are only looked up once.
+        workers: the number of images downloaded at once.
+        """
+        proofs = list(dict.fromkeys(proofs))
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self.fetch, proof, cache, client) for proof in proofs]
+            for proof, future in zip(proofs, futures):
+                try:
+                    results[proof] = future.result()
+                except Exception as e: # retried on the next call
+                    print(f"Failed to store the image of {proof}: {e.__class__.__name__}")
+                    self.count("failed")
+        print(f"Image store: {dict(self.counters)}")
+        return results
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+def get_default_image_store() -> ImageStore:
+    """
+    Returns the image store shared by the pipeline, opening it on first use.
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ImageStore()
+        return _default_store
@@ -1,63 +1,229 @@
 """
 This file seeks to speed up the "determine date of photo taken" process
 through the use of webbrowser and Firefox.
+
+The undated postimg proofs are asked one at a time, the proofs cited by the most
+rows first, so every answer dates as many losses as possible. While one image is on
+screen, the next PREFETCH images and titles are downloaded in the background (into
+the image store), so the next one opens at once. The date in the postimg title, if
+there is one, is offered as a guess that only needs Enter to confirm.
+
+Every answer is appended to an append-only journal (JOURNAL_PATH) as soon as it is
+given, so a crash loses at most the answer being typed. Skipped proofs are journaled
+too, and asked again in the next session after the proofs never shown. The journal is merged into
+the losses table in one step at the end (merge_manual_dates), and every row that
+shares a proof gets its date.
 """
 
+import csv
+import os
+import shutil
+import tempfile
+import time
 import webbrowser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
-import numpy as np
+from date_normalization import normalize_dates, HEURISTICS
+from image_store import ImageStore, get_default_image_store, image_suffix
+from parser_helpers import title_date_parsing
+from proof_index import ProofIndex, canonical_proof, canonical_proofs, is_postimg
+from response_cache import fetch_page_info
+from storage import load_losses, save_losses
+
+JOURNAL_PATH = "cache/manual_dates.csv"
+JOURNAL_COLUMNS = ["proof", "day", "month", "year", "entered_at", "answer"]
+# Values of the journal's answer column. Journals written before the column
+# existed only hold dates and "none" answers.
+DATE, NO_DATE, SKIPPED = "date", "none", "skipped"
+# Number of upcoming proofs downloaded in the background.
+PREFETCH = 8
+# Answers that end the session.
+EXIT_ANSWERS = ("EXIT", "q")
+
+def guess_date(title: str | None) -> tuple[int, int, int] | None:
+    """
+    Returns the date in a postimg title, cleaned up like the scraped dates
+    (see date_normalization.normalize_dates), or None. Every heuristic is applied,
+    as the guess is only shown to the user to confirm.
+
+    Example input: 1027 t55 dam 08 05 2023 - Postimages
+    Example output: (5, 8, 23)
+    """
+    day, month, year = title_date_parsing(title)
+    if day is None:
+        return None
+    row = pd.DataFrame({"day": [day], "month": [month], "year": [year]})
+    normalize_dates(row, heuristics=HEURISTICS)
+    return int(row.at[0, "day"]), int(row.at[0, "month"]), int(row.at[0, "year"])
+
+def parse_answer(answer: str, guess: tuple | None) -> tuple | None | str:
+    """
+    Turns what the user typed into a (day, month, year) tuple with a two digit year.
+    Returns "skip" to leave the proof for later, "none" if the image has no date,
+    and None if the answer could not be read.
+
+    Example input: 5 8 2023
+    Example output: (5, 8, 23)
+    """
+    answer = answer.strip()
+    if answer == "":
+        return guess if guess is not None else None
+    if answer in ("s", "skip"):
+        return "skip"
+    if answer in ("n", "none"):
+        return "none"
+    dmy = answer.replace("/", " ").replace(".", " ").split()
+    if len(dmy) != 3 or not all(part.isdigit() for part in dmy):
+        return None
+    day, month, year = (int(part) for part in dmy)
+    if year > 2000:
+        year -= 2000
+    if not (1 <= day <= 31 and 1 <= month <= 12):
+        return None
+    return day, month, year
+
+def read_journal(path: str = JOURNAL_PATH) -> pd.DataFrame:
+    """
+    Returns the latest answer for every proof of the journal, keyed by canonical proof.
+    Proofs answered "none" or skipped have an empty day, month, year.
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=JOURNAL_COLUMNS)
+    journal = pd.read_csv(path, names=JOURNAL_COLUMNS, skiprows=1)
+    journal["proof"] = canonical_proofs(journal["proof"])
+    dated = journal[["day", "month", "year"]].notna().all(axis=1)
+    journal["answer"] = journal["answer"].fillna(dated.map({True: DATE, False: NO_DATE}))
+    return journal.drop_duplicates("proof", keep="last")
+
+def append_answer(f, proof: str, date: tuple | str | None):
+    """
+    Appends one answer to the open journal file and forces it to disk.
+    date is a (day, month, year) tuple, None for an image without a date, or "skip".
+    """
+    day, month, year = date if isinstance(date, tuple) else ("", "", "")
+    answer = DATE if isinstance(date, tuple) else SKIPPED if date == "skip" else NO_DATE
+    csv.writer(f).writerow([canonical_proof(proof), day, month, year,
+                            time.strftime("%Y-%m-%d %H:%M:%S"), answer])
+    f.flush()
+    os.fsync(f.fileno())
+
+def undated_proofs(df: pd.DataFrame, answered=(), skipped=()) -> list[str]:
+    """
+    Returns the canonical postimg proofs of a losses table that have rows without
+    a day, month, year and no answer yet, the proofs cited by the most rows first.
+    Skipped proofs come after all the others.
+    """
+    undated = df[df[["day", "month", "year"]].isna().any(axis=1)]
+    counts = canonical_proofs(undated["proof"]).value_counts(sort=True)
+    answered, skipped = set(answered), set(skipped)
+    proofs = [proof for proof in counts.index if proof not in answered and is_postimg(proof)]
+    return [proof for proof in proofs if proof not in skipped] + [proof for proof in proofs if proof in skipped]
 
-#url = "https://en.wikipedia.org/"
+def viewable_copy(image: str, folder: str) -> str:
+    """
+    Returns a link (or, across file systems, a copy) of a stored image in folder,
+    named with the suffix of its format. Store files have no suffix, and browsers
+    opening them through file:// guess at the content and often offer a download.
+    """
+    with open(image, "rb") as f:
+        suffix = image_suffix(f.read(16))
+    path = os.path.join(folder, os.path.basename(image) + suffix)
+    if not os.path.exists(path):
+        try:
+            os.link(image, path)
+        except OSError:
+            shutil.copyfile(image, path)
+    return path
 
-#webbrowser.open(url, new=2, autoraise=True)
+def prefetch(proof: str, store: ImageStore, folder: str) -> tuple[str | None, str | None]:
+    """
+    Downloads a proof's title and image ahead of time.
+    Returns (path of a viewable copy of the image in folder or None, title or None). Runs in a
+    background thread, so failures are not printed over the prompt; a proof
+    whose image could not be stored is opened in the browser instead.
+    """
+    title, image = None, None
+    try:
+        title = fetch_page_info(proof).title
+        direct_link, digest = store.fetch(proof)
+        if digest is not None:
+            image = viewable_copy(store.path(digest), folder)
+    except Exception: # whatever was fetched before the error is still used
+        pass
+    return image, title
 
-def fancy_print(df_list: list):
+def merge_manual_dates(df: pd.DataFrame, path: str = JOURNAL_PATH) -> int:
     """
-    Prints each element in a new line.
+    Fills the missing day, month, year of a losses table (in place) with the
+    journal's answers, for every row sharing an answered proof, in one join.
+    Returns the number of rows filled.
     """
-    for row in df_list:
-        print(row, ',')
+    journal = read_journal(path)
+    journal = journal[journal["answer"] == DATE]
+    index = ProofIndex()
+    index.add_dates(journal["proof"], journal["day"], journal["month"], journal["year"], "manual")
+    return index.fill_dates(df)
 
-def determine_date(df_name: str):
+def determine_date(df_name: str, journal_path: str = JOURNAL_PATH, prefetch_count: int = PREFETCH):
     """
-    This function takes in one input:
+    This function takes in these inputs:
     df_name: name of a .csv file to read.
+    journal_path: the append-only journal of answers.
+    prefetch_count: how many upcoming proofs are downloaded in the background.
 
-    Loads the UA or RU losses csv and turns it into a list.
-
-    For every row that has empty date month year values:
-    If it is a postimg link: open it via webbrowser.
-    Ask the user to view the image and input day, month, year.
-    Clean the dmy data and insert it back into the list.
-    If the user enters EXIT, save work and move on.
-
-    Once all undated postimg links are dated or EXIT received,
-    update the df produced by reading the losses csv
-    using the updated list converted into a df.
-    Save the updated dataframe into the UA or RU losses csv.
-    """
-    df = pd.read_csv(df_name)
-    df_list = df[["id", "day", "month", "year", "proof"]].values.tolist() # easier to work with this way
-    fancy_print(df_list[:20])
-    for row in df_list:
-        if np.isnan(row[1]) and "twitter" not in row[4]:
-            url = row[4]
-            print(url)
-            webbrowser.open(url, new=2, autoraise=False)
-            block_of_text = input('Enter date, month, year: ')
-            if block_of_text == "EXIT":
+    Shows the image of every undated postimg proof not answered yet, and asks for
+    its day, month, year (Enter accepts the guess from the title, "n" means the image
+    has no date, "s" skips it until the next session, EXIT stops). Each answer is
+    written to the journal straight away. Then every answer in the journal is merged into the losses table,
+    which is saved.
+    """
+    df = load_losses(df_name)
+    journal = read_journal(journal_path)
+    skipped = journal["answer"] == SKIPPED
+    queue = deque(undated_proofs(df, journal.loc[~skipped, "proof"], journal.loc[skipped, "proof"]))
+    print(f"{len(queue)} undated postimg proofs to go")
+    store = get_default_image_store()
+    if os.path.dirname(journal_path):
+        os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+    new_file = not os.path.exists(journal_path)
+    answered = 0
+    start_time = time.perf_counter()
+
+    with open(journal_path, "a", newline="") as f, tempfile.TemporaryDirectory() as viewing, \
+            ThreadPoolExecutor(max_workers=prefetch_count) as pool:
+        if new_file:
+            csv.writer(f).writerow(JOURNAL_COLUMNS)
+            f.flush()
+        pending = deque()
+        while queue or pending:
+            while queue and len(pending) < prefetch_count:
+                proof = queue.popleft()
+                pending.append((proof, pool.submit(prefetch, proof, store, viewing)))
+            proof, future = pending.popleft()
+            image, title = future.result()
+            guess = guess_date(title)
+            print(f"{proof}  title: {title}  guess: {guess}" + ("" if image else "  (image not prefetched)"))
+            webbrowser.open("file://" + os.path.abspath(image) if image is not None else proof,
+                            new=2, autoraise=False)
+            date = None
+            while date is None:
+                answer = input('Enter date, month, year (Enter = guess, n = no date, s = skip): ')
+                if answer.strip() in EXIT_ANSWERS:
+                    break
+                date = parse_answer(answer, guess)
+            if date is None:
                 break
-            dmy = block_of_text.split()
-            print(len(dmy))
-            for index in range(len(dmy)):
-                dmy[index] = float(dmy[index])
-            if dmy[2] > 2000: dmy[2] -= 2000
-            row[1:4] = dmy
-    print("="*30)
-    fancy_print(df_list[:20])
-    df.update(pd.DataFrame(df_list, columns=["id", "day", "month", "year", "proof"]))
-    print(df[["id", "day", "month", "year", "proof"]].head(20))
-    df.to_csv(df_name)
+            append_answer(f, proof, None if date == "none" else date)
+            answered += date != "skip"
+        for _, future in pending: # do not wait for prefetches nobody will look at
+            future.cancel()
+
+    hours = (time.perf_counter() - start_time) / 3600
+    print(f"{answered} answers ({answered / hours if hours else 0:.0f} per hour)")
+    print(f"Filled {merge_manual_dates(df, journal_path)} rows from the journal")
+    save_losses(df, df_name)
 
 def main():
     """
@@ -9,88 +9,75 @@ Notebook 2.0 (using a new OCR model):
 https://colab.research.google.com/drive/1GEgXRAkQ8ceYAxAlHOrlmo4sSrEXGKmE?usp=sharing
 """
 
-import requests
-from bs4 import BeautifulSoup
 import re
 import pandas as pd
+from proof_index import ProofIndex, canonical_proofs
+from storage import load_losses, save_losses
 
-def convert_to_datetime(raw_date: str):
-    """
-    Apply function to be used on dates_df.
-    Converts strings to datetime if applicable.
-    If the string cannot be made into a datetime due to bad formatting,
-    return None instead.
+# The OCR dates are only trusted between the start of the war and the last day of collection.
+WAR_START = "2022-02-24"
+LAST_COLLECTION_DAY = "2023-10-18"
+
+def rearrange_year_middle(dates: pd.Series) -> pd.Series:
     """
-    try:
-        # handles cases where the str looks like "01/2023/14"
-        if raw_date[2] == '/' and raw_date[7] == '/':
-            raw_date = raw_date[:3] + raw_date[8:] + raw_date[2:7]
-        
-        date = pd.to_datetime(raw_date, format="%d/%m/%Y")
-
-        # the OCR I used tends to read 2022 as 2020.
-        # this is a quick and dirty "fix" to the issue.
-        if date.year <= 2021:
-            date.year = 2022
-        
-        return date
-    except:
-        try:
-            # for dates in the form "01/14/23" and not "01/14/2023"
-            date = pd.to_datetime(raw_date, format=f"%d/%m/%y")
-            return date
-        except:
-            return None
-
-def insert_dates_back_into_df():
+    Moves the year of dates that look like "01/2023/14" to the end ("01/14/2023").
     """
-    Apply function to be used on ru_losses and ua_losses.
+    return dates.str.replace(r"^(.{2})/(.{4})/(.*)$", r"\1/\3/\2", regex=True, flags=re.DOTALL)
 
-    If the link already has an associated datetime, return it.
-    Otherwise, return a value from dates_df.
-    If dates_df does not have that link: return None.
+def replace_bad_separators(dates: pd.Series) -> pd.Series:
     """
+    Turns raw OCR dates ("05.08.2023", "05-08 2023") into "dd/mm/yyyy" strings,
+    all at once. Values that are not strings become NaN.
+    """
+    dates = dates.where(dates.map(lambda date: isinstance(date, str)))
+    dates = dates.str.replace(r"[_:.\- ,]", "/", regex=True)
+    return rearrange_year_middle(dates)
 
-def replace_bad_separators(date: str):
+def convert_to_datetime(dates: pd.Series) -> pd.Series:
     """
+    Converts "dd/mm/yyyy" or "dd/mm/yy" strings to datetimes with a single
+    pd.to_datetime call. Strings that are not dates become NaT.
     """
-    try:
-        for char in "_:.- ,":
-            date = date.replace(char, "/")
-        
-        # handles cases where the str looks like "01/2023/14"
-        # copied over from convert_to_datetime since it should have been run here first.
-        if date[2] == '/' and date[7] == '/':
-            date = date[:3] + date[8:] + date[2:7]
-        return date
-    except:
-        #print(date)
-        return None
-
-def main1():
+    # older raw date files were not rearranged by replace_bad_separators
+    dates = rearrange_year_middle(dates)
+    # for dates in the form "01/14/23" and not "01/14/2023"
+    dates = dates.str.replace(r"^(\d{1,2}/\d{1,2}/)(\d{2})$", r"\g<1>20\2", regex=True)
+    converted = pd.to_datetime(dates, format="%d/%m/%Y", errors="coerce")
+
+    # the OCR I used tends to read 2022 as 2020.
+    # this is a quick and dirty "fix" to the issue; other years are left alone.
+    misread = converted.dt.year == 2020
+    fixed = pd.to_datetime(pd.DataFrame({"year": 2022, "month": converted.dt.month,
+                                         "day": converted.dt.day}), errors="coerce")
+    return converted.where(~misread, fixed)
+
+def main1(raw_dates_path: str = "links_and_dates_from_hgface.csv",
+          links_path: str = "total_losses_postimg_links.csv",
+          output: str = "total_losses_with_raw_dates.csv"):
     # load and combine the proof + direct link and direct link + raw date files
-    dates_df = pd.read_csv("links_and_dates_from_hgface.csv")
-    dates_df.drop(columns=["Unnamed: 0"], inplace=True)
-    old_proof = pd.read_csv("total_losses_postimg_links.csv")
-    old_proof.drop(columns=["Unnamed: 0"], inplace=True)
-    dates_df_modded = dates_df.merge(old_proof, how="left", on="direct link")
+    dates_df = pd.read_csv(raw_dates_path)
+    dates_df.drop(columns=["Unnamed: 0"], inplace=True, errors="ignore")
+    if "proof" in dates_df.columns:
+        # output of ocr_dates.py, which already holds the proofs
+        dates_df_modded = dates_df
+    else:
+        old_proof = pd.read_csv(links_path)
+        old_proof.drop(columns=["Unnamed: 0"], inplace=True, errors="ignore")
+        dates_df_modded = dates_df.merge(old_proof, how="left", on="direct link")
     dates_df_modded = dates_df_modded[["proof", "direct link", "raw_date"]]
     print(dates_df_modded)
 
     # try to turn some raw dates into processed datetime values
-    dates_df_modded["rearranged_date"] = \
-        dates_df_modded["raw_date"].apply(replace_bad_separators)
-    dates_df_modded.to_csv("total_losses_with_raw_dates.csv", index=False)
-    #dates_df_modded["datetime"] = pd.to_datetime(dates_df_modded["rearranged_date"], format="mixed")
-    #print(dates_df_modded)
-    print(pd.to_datetime("16/09/2023", format="%d/%m/%Y"))
-
-def main2():
-    dates_df = pd.read_csv("total_losses_with_raw_dates.csv")
-    dates_df["datetime"] = dates_df["rearranged_date"].apply(convert_to_datetime)
+    dates_df_modded["rearranged_date"] = replace_bad_separators(dates_df_modded["raw_date"])
+    dates_df_modded.to_csv(output, index=False)
+
+def main2(raw_dates_path: str = "total_losses_with_raw_dates.csv",
+          output: str = "total_losses_with_processed_dates.csv"):
+    dates_df = pd.read_csv(raw_dates_path)
+    dates_df["datetime"] = convert_to_datetime(dates_df["rearranged_date"])
     print(dates_df.head(25))
     print(dates_df.tail(25))
-    dates_df.to_csv("total_losses_with_processed_dates.csv", index=False)
+    dates_df.to_csv(output, index=False)
 
 def main3():
     dates_df = pd.read_csv("total_losses_with_processed_dates.csv")
@@ -101,54 +88,46 @@ def main3():
     print(len(dates_df[dates_df["datetime"] > "2023-10-18"])) # 43 bad entries (after last day of collection)
     # 3.6 roentgen: not great, not terrible.
 
-link_dates_dict = {}
-
-def put_dates_into_dict(row):
-    """
-    Input: a row from a DataFrame containing a processed datetime and a proof link.
-    Populate a dictionary with {proof: datetime} entries.
-    """
-    #print(row)
-    link_dates_dict[row["proof"]] = row["datetime"]
-
-def pick_dates_from_list(row):
+def merge_ocr_dates(losses: pd.DataFrame, dates_df: pd.DataFrame) -> dict:
     """
-    Input: a row from a DataFrame containing a datetime (None or timestamp) and a proof link.
-
-    If the row already has a legal datetime, return the row as is.
-    If it does not have a legal datetime, check if the dict has one.
-    If the dict has one, insert the dict datetime and return.
-    If the dict does not, return the row as is.
+    Fills the empty date_lost values of a losses DataFrame (in place) with the
+    OCR dates of the same proof, through a single join against a proof_index.ProofIndex.
+    Returns a dict counting where each row's date came from:
+    {"already dated": n, "ocr": n, "undated": n}.
+
+    ## Parameters
+    losses: a losses DataFrame with proof and date_lost columns.
+    dates_df: the processed OCR dates, with proof and datetime columns.
     """
-    #print(row)
-    if pd.notna(row["date_lost"]):
-        return pd.Series([row["proof"], row["date_lost"]])
-    elif row["proof"] in link_dates_dict:
-        return pd.Series([row["proof"], link_dates_dict[row["proof"]]])
-    else:
-        return pd.Series([row["proof"], row["date_lost"]])
+    dates_df = dates_df[["proof", "datetime"]].dropna()
+    dates = pd.to_datetime(dates_df["datetime"], errors="coerce")
+    # remove out of bound dates (before start of war or after last collection date)
+    in_window = ((dates > WAR_START) & (dates < LAST_COLLECTION_DAY)).to_numpy()
+    dates = dates[in_window]
+    # one date per proof; like the old dict, the last one read wins
+    index = ProofIndex()
+    index.add_dates(canonical_proofs(dates_df["proof"][in_window]), dates.dt.day, dates.dt.month,
+                    dates.dt.year % 100, "ocr")
+
+    known = index.join(losses["proof"], ["day", "month", "year"]).astype(float)
+    ocr_dates = pd.to_datetime(pd.DataFrame({"year": known["year"] + 2000, "month": known["month"],
+                                             "day": known["day"]}), errors="coerce")
+    date_lost = pd.to_datetime(losses["date_lost"], errors="coerce")
+
+    counts = {"already dated": int(date_lost.notna().sum()),
+              "ocr": int((date_lost.isna() & ocr_dates.notna()).sum())}
+    losses["date_lost"] = date_lost.combine_first(ocr_dates)
+    counts["undated"] = int(losses["date_lost"].isna().sum())
+    return counts
 
 def main4():
-    ru_losses = pd.read_csv("ru_losses.csv")
-    ua_losses = pd.read_csv("ua_losses.csv")
-    ru_losses.drop(columns=["Unnamed: 0"], inplace=True)
-    ua_losses.drop(columns=["Unnamed: 0"], inplace=True)
+    ru_losses = load_losses("ru_losses.csv")
+    ua_losses = load_losses("ua_losses.csv")
     dates_df = pd.read_csv("total_losses_with_processed_dates.csv")
-    # remove duplicates and nulls
-    dates_df.drop_duplicates(inplace=True)
-    dates_df.dropna(inplace=True)
-    # remove out of bound dates (before start of war or after last collection date)
-    dates_df = dates_df[dates_df["datetime"] > "2022-02-24"]
-    dates_df = dates_df[dates_df["datetime"] < "2023-10-18"]
-    # populate a dictionary of proof and corresponding datetime values
-    dates_df[["proof", "datetime"]].apply(lambda row: put_dates_into_dict(row), axis=1)
-    #print(link_dates_dict)
-
-    ru_losses[["proof", "date_lost"]] = ru_losses[["proof", "date_lost"]].apply(
-        lambda row: pick_dates_from_list(row), axis=1)
-    ua_losses[["proof", "date_lost"]] = ua_losses[["proof", "date_lost"]].apply(
-        lambda row: pick_dates_from_list(row), axis=1)
-    ru_losses.to_csv("ru_losses.csv", index=False)
-    ua_losses.to_csv("ua_losses.csv", index=False)
-
-main4()
\ No newline at end of file
+    print(f"RU date sources: {merge_ocr_dates(ru_losses, dates_df)}")
+    print(f"UA date sources: {merge_ocr_dates(ua_losses, dates_df)}")
+    save_losses(ru_losses, "ru_losses.csv")
+    save_losses(ua_losses, "ua_losses.csv")
+
+if __name__ == "__main__":
+    main4()
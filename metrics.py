@@ -0,0 +1,195 @@
+"""
+This file contains the counters, timers and histograms the scraper records about itself.
+
+Instead of printing the time of every postimg fetch and every parsed row, the hot
+paths (HTTP client, response cache, article parser, parse_oryx) record into a shared
+Metrics object, which is written out once at the end of a run, either as JSON or as
+a Prometheus-style text dump. That shows where a slow run actually spent its time:
+fetch latency per host, bytes downloaded, cache hits and misses, parse time per <li>
+and rows emitted per status.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+METRICS_PATH = "cache/metrics.json"
+# Upper bounds (seconds) of the histogram buckets for network latencies.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Upper bounds (seconds) of the histogram buckets for in-process work, such as parsing one <li>.
+PARSE_BUCKETS = (1e-6, 5e-6, 1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 1e-2, 0.1, 1)
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+class Metrics:
+    """
+    Thread-safe store of labelled counters and histograms.
+
+    Example use:
+    metrics.inc("fetch_bytes", 5120, host="postimg.cc")
+    with metrics.timer("fetch_seconds", host="postimg.cc"):
+        ...
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter() # {(name, labels): value}
+        self.histograms = {} # {(name, labels): [bucket bounds, bucket counts, sum, count]}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """
+        Adds amount to a counter.
+        """
+        with self.lock:
+            self.counters[_key(name, labels)] += amount
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS, **labels):
+        """
+        Records one value into a histogram. The buckets of a histogram are fixed
+        by its first observation.
+        """
+        key = _key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(histogram[0]):
+                if value <= bound:
+                    histogram[1][i] += 1
+                    break
+            histogram[2] += value
+            histogram[3] += 1
+
+    @contextmanager
+    def timer(self, name: str, buckets: tuple = LATENCY_BUCKETS, **labels):
+        """
+        Records the wall time of a with block into a histogram, even if the block raises.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start_time, buckets, **labels)
+
+    def counter(self, name: str, **labels) -> float:
+        """
+        Returns the value of a counter, or the sum over all its labels if none are given.
+        """
+        with self.lock:
+            if labels:
+                return self.counters[_key(name, labels)]
+            return sum(value for (counter_name, _), value in self.counters.items() if counter_name == name)
+
+    def snapshot(self) -> dict:
+        """
+        Returns every counter and histogram as plain JSON-ready data.
+        Histogram buckets hold the count of values up to each bound (not cumulative).
+        """
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [{"name": name, "labels": dict(labels),
+                           "buckets": {str(bound): count for bound, count in zip(bounds, counts)},
+                           "sum": total, "count": count_all}
+                          for (name, labels), (bounds, counts, total, count_all) in sorted(self.histograms.items())]
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        def label_text(labels: dict, extra: str = "") -> str:
+            parts = [f'{label}="{value}"' for label, value in labels.items()]
+            if extra:
+                parts.append(extra)
+            return "{" + ",".join(parts) + "}" if parts else ""
+        snapshot = self.snapshot()
+        lines = []
+        for counter in snapshot["counters"]:
+            lines.append(f"{counter['name']}{label_text(counter['labels'])} {counter['value']}")
+        for histogram in snapshot["histograms"]:
+            name, labels = histogram["name"], histogram["labels"]
+            cumulative = 0
+            for bound, count in list(histogram["buckets"].items()) + [("+Inf", 0)]:
+                cumulative += count
+                bound_label = 'le="' + bound + '"'
+                lines.append(f"{name}_bucket{label_text(labels, bound_label)} {cumulative}")
+            lines.append(f"{name}_sum{label_text(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{label_text(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str = METRICS_PATH):
+        """
+        Writes the metrics to a file: Prometheus text if it ends in .prom or .txt,
+        JSON otherwise.
+        """
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    def summary(self) -> str:
+        """
+        Returns a one line overview of a run for the console.
+        """
+        hits, misses = self.counter("cache_lookups", result="hit"), self.counter("cache_lookups", result="miss")
+        lookups = hits + misses
+        with self.lock:
+            fetches = sum(histogram[3] for (name, _), histogram in self.histograms.items()
+                          if name == "fetch_seconds")
+            fetch_seconds = sum(histogram[2] for (name, _), histogram in self.histograms.items()
+                                if name == "fetch_seconds")
+        return (f"{fetches} fetches ({fetch_seconds:.1f} s), {self.counter('fetch_bytes') / 1e6:.1f} MB, "
+                f"cache hit rate {hits / lookups if lookups else 0:.0%}, "
+                f"{self.counter('rows_emitted'):.0f} rows")
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def take(self) -> tuple[dict, dict]:
+        """
+        Returns the raw counters and histograms recorded so far and clears them,
+        so that a worker process can send them back to be merged into its parent's.
+        """
+        with self.lock:
+            taken = dict(self.counters), self.histograms
+            self.counters, self.histograms = Counter(), {}
+        return taken
+
+    def merge(self, taken: tuple[dict, dict]):
+        """
+        Adds counters and histograms returned by take(), such as by a worker process.
+        """
+        counters, histograms = taken
+        with self.lock:
+            self.counters.update(counters)
+            for key, (bounds, counts, total, count_all) in histograms.items():
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = [bounds, list(counts), total, count_all]
+                    continue
+                histogram[1] = [mine + theirs for mine, theirs in zip(histogram[1], counts)]
+                histogram[2] += total
+                histogram[3] += count_all
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+def get_default_metrics() -> Metrics:
+    """
+    Returns the metrics shared by every part of the pipeline, creating them on first use.
+    """
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
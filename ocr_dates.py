@@ -0,0 +1,292 @@
+"""
+This file contains the OCR stage that reads dates off the images of undated postimg proofs.
+
+Until now the images were sent through PaddleOCR in Kaggle/Colab notebooks and the
+results came back as reference_data/links_and_dates_from_hgface.csv. Here the same
+work runs locally, next to the scraper:
+1. pick the postimg proofs that have no day, month, year (select_undated_proofs),
+2. download their images into the image store on a thread pool (see image_store.py;
+images already stored are not downloaded again),
+3. crop each image to the part the date is usually written on,
+4. read the text of the images in batches on a process pool, one model per process,
+5. append a raw date for every image to the output as soon as its batch is done.
+
+The output has the columns of the notebook output plus the proof
+(proof, direct link, raw_date), so insert_dates_into_df.main1 can read it directly.
+Proofs already in the output are skipped, so an interrupted run picks up where it stopped.
+
+The OCR model is chosen by name from BACKENDS. "stub" needs no model and is meant
+for tests and benchmarks; "paddle" needs the paddleocr and Pillow packages.
+
+Usage: python ocr_dates.py [backend name]
+"""
+
+import csv
+import io
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+import pandas as pd
+from http_client import FetchClient
+from image_store import ImageStore, get_default_image_store, image_path
+from response_cache import ResponseCache
+from proof_index import canonical_proof, canonical_proofs, is_postimg
+from storage import load_losses
+from metrics import get_default_metrics
+
+try:
+    from PIL import Image
+except ImportError: # cropping is skipped without Pillow
+    Image = None
+
+try:
+    from paddleocr import PaddleOCR
+except ImportError: # only needed by PaddleBackend
+    PaddleOCR = None
+
+OUTPUT_PATH = "data/ocr_raw_dates.csv"
+OUTPUT_COLUMNS = ["proof", "direct link", "raw_date"]
+# Images handed to an OCR process at once.
+BATCH_SIZE = 16
+# Images downloaded at once.
+DOWNLOAD_WORKERS = 16
+# Part of the image kept before OCR, as (left, top, right, bottom) fractions of its size.
+# Oryx writes the date under the picture, so by default only the bottom third is read.
+CROP_BOX = (0.0, 2 / 3, 1.0, 1.0)
+# A date as OCR reads it: "05.08.2023", "05-08 23", "01.2023 11". The first separator
+# is never a space, so that numbers in vehicle names ("T-72 08.09.2023") are left out.
+RAW_DATE_PATTERN = re.compile(r"(?<![\d.])\d{1,2}[./\-]\d{1,4}[./\- ]\d{2,4}(?![\d.])")
+
+class StubBackend:
+    """
+    OCR backend without a model: the text of an image is its bytes decoded as UTF-8.
+    Fixture images can then be plain text such as b"05.08.2023".
+    """
+    def read_batch(self, images: list[bytes]) -> list[str]:
+        return [image.decode("utf-8", errors="ignore") for image in images]
+
+class PaddleBackend:
+    """
+    OCR backend running PaddleOCR on the CPU. Loaded once per process.
+    """
+    def __init__(self):
+        if PaddleOCR is None or Image is None:
+            raise ImportError("The paddle OCR backend needs the paddleocr and Pillow packages")
+        self.model = PaddleOCR(use_angle_cls=False, lang="en", use_gpu=False, show_log=False)
+
+    def read_batch(self, images: list[bytes]) -> list[str]:
+        texts = []
+        for image in images:
+            pixels = np.asarray(Image.open(io.BytesIO(image)).convert("RGB"))
+            result = self.model.ocr(pixels, cls=False) or []
+            texts.append(" ".join(line[1][0] for page in result if page for line in page))
+        return texts
+
+BACKENDS = {"stub": StubBackend, "paddle": PaddleBackend}
+"""
+OCR backends by name. A backend is a class built with no arguments whose
+read_batch(images) returns the text found in each image (given as encoded bytes).
+"""
+
+DEFAULT_BACKEND = "paddle"
+
+def extract_raw_date(text: str | None) -> str | None:
+    """
+    Returns the first date-like part of the text OCR read from an image, or None.
+
+    Example input: 1027 T-55 damaged 05.08.2023 Robotyne
+    Example output: 05.08.2023
+
+    ## Parameters
+    text: the OCR output for one image.
+    """
+    if not text:
+        return None
+    raw_date = RAW_DATE_PATTERN.search(text)
+    return raw_date.group(0) if raw_date is not None else None
+
+def crop_image(image: bytes, box: tuple | None = CROP_BOX) -> bytes:
+    """
+    Returns the image cut down to box (see CROP_BOX), encoded as PNG.
+    Returns the image as it is if box is None, Pillow is missing or the bytes are not an image.
+    """
+    if box is None or Image is None:
+        return image
+    try:
+        picture = Image.open(io.BytesIO(image))
+        picture.load()
+    except OSError: # not an image, such as the stub backend's fixtures
+        return image
+    width, height = picture.size
+    picture = picture.crop((round(box[0] * width), round(box[1] * height),
+                            round(box[2] * width), round(box[3] * height)))
+    out = io.BytesIO()
+    picture.save(out, format="PNG")
+    return out.getvalue()
+
+def select_undated_proofs(losses_paths: list[str]) -> list[str]:
+    """
+    Returns the unique postimg proofs of the losses tables that have no day, month, year
+    (or no date_lost, if the table has one), in the order they appear.
+
+    ## Parameters
+    losses_paths: losses tables readable by storage.load_losses.
+    """
+    proofs = []
+    for path in losses_paths:
+        losses = load_losses(path)
+        undated = losses[["day", "month", "year"]].isna().any(axis=1)
+        if "date_lost" in losses.columns:
+            undated &= losses["date_lost"].isna()
+        proof = losses["proof"].astype("string")
+        postimg = proof.map(is_postimg, na_action="ignore").fillna(False).astype(bool)
+        proofs.extend(proof[undated & postimg])
+    return list(dict.fromkeys(proofs))
+
+def read_done_proofs(output: str) -> set[str]:
+    """
+    Returns the normalized proofs already in an OCR output file.
+    """
+    if not os.path.exists(output):
+        return set()
+    return set(pd.read_csv(output, usecols=["proof"])["proof"].dropna().pipe(canonical_proofs))
+
+_backend = None
+_crop_box = None
+_image_folder = None
+
+def _start_worker(backend_name: str, crop_box: tuple | None, image_folder: str):
+    """
+    Loads the OCR backend once in every worker process.
+    """
+    global _backend, _crop_box, _image_folder
+    _backend = BACKENDS[backend_name]()
+    _crop_box = crop_box
+    _image_folder = image_folder
+
+def _read_image(digest: str) -> bytes:
+    with open(image_path(_image_folder, digest), "rb") as f:
+        return f.read()
+
+def _read_batch(batch: list[tuple[str, str, str]]) -> tuple[list[tuple[str, str, str | None]], list[tuple[str, str]]]:
+    """
+    Crops and reads one batch of (proof, direct link, image hash) in a worker process.
+    The images are read from the image store, so only their hashes cross between processes.
+    Returns (proof, direct link, raw date) for each image read, and (proof, error name)
+    for each image that could not be opened or read. If the backend fails on the
+    batch, its images are read again one at a time, so one bad image only fails itself.
+    """
+    images, failed = [], []
+    for proof, direct_link, digest in batch:
+        try:
+            images.append((proof, direct_link, crop_image(_read_image(digest), _crop_box)))
+        except Exception as e: # such as an image missing from the store
+            failed.append((proof, e.__class__.__name__))
+    try:
+        texts = _backend.read_batch([image for _, _, image in images])
+        read = [(proof, direct_link, text) for (proof, direct_link, _), text in zip(images, texts)]
+    except Exception:
+        read = []
+        for proof, direct_link, image in images:
+            try:
+                read.append((proof, direct_link, _backend.read_batch([image])[0]))
+            except Exception as e:
+                failed.append((proof, e.__class__.__name__))
+    return [(proof, direct_link, extract_raw_date(text)) for proof, direct_link, text in read], failed
+
+def run_ocr(proofs: list[str], output: str = OUTPUT_PATH, backend: str = DEFAULT_BACKEND,
+            workers: int | None = None, batch_size: int = BATCH_SIZE,
+            download_workers: int = DOWNLOAD_WORKERS, crop_box: tuple | None = CROP_BOX,
+            store: ImageStore | None = None, cache: ResponseCache | None = None,
+            client: FetchClient | None = None) -> dict:
+    """
+    Stores, crops and reads the images of the given proofs, appending one
+    (proof, direct link, raw_date) row per image to output as each batch finishes.
+    Proofs already in output are skipped. Images without a readable date get an
+    empty raw_date, so they are not read again; failed downloads, and images that could
+    not be opened or read, are counted as failed and left for the next run.
+    Returns a dict of counts: {"skipped", "images", "dated", "no image", "failed"}.
+
+    ## Parameters
+    proofs: postimg proofs, such as the output of select_undated_proofs.
+    output: CSV the raw dates are appended to.
+    backend: name of the OCR backend in BACKENDS.
+    workers: OCR processes; defaults to the number of CPUs.
+    batch_size: images read by a process at once.
+    download_workers: images downloaded at once.
+    crop_box: see CROP_BOX; None reads the whole image (such as when the store
+    already crops images on ingest).
+    store: the image store to read and save images in; defaults to get_default_image_store().
+    cache: the response cache to use; defaults to get_default_cache().
+    client: the HTTP client to use; defaults to get_default_client().
+    """
+    if backend not in BACKENDS:
+        raise KeyError(f"No OCR backend named {backend}; pick one of {list(BACKENDS)}")
+    metrics = get_default_metrics()
+    store = store or get_default_image_store()
+    done = read_done_proofs(output)
+    todo = [proof for proof in dict.fromkeys(proofs) if canonical_proof(proof) not in done]
+    counts = {"skipped": len(proofs) - len(todo), "images": 0, "dated": 0, "no image": 0, "failed": 0}
+    workers = workers or os.cpu_count() or 1
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    new_file = not os.path.exists(output)
+    start_time = time.perf_counter()
+
+    with open(output, "a", newline="") as f, \
+            ThreadPoolExecutor(max_workers=download_workers) as downloads, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_start_worker,
+                                initargs=(backend, crop_box, store.folder)) as ocr:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(OUTPUT_COLUMNS)
+
+        def write_results(finished):
+            for future in finished:
+                rows, failed = future.result()
+                for proof, error in failed: # left out of the output so that the next run retries it
+                    print(f"Failed to read the image of {proof}: {error}")
+                counts["failed"] += len(failed)
+                writer.writerows((proof, direct_link, raw_date or "") for proof, direct_link, raw_date in rows)
+                counts["dated"] += sum(1 for row in rows if row[2] is not None)
+                metrics.inc("ocr_images", len(rows))
+            f.flush()
+
+        pending_downloads = [downloads.submit(store.fetch, proof, cache, client) for proof in todo]
+        batch, reading = [], set()
+        for proof, future in zip(todo, pending_downloads):
+            try:
+                direct_link, digest = future.result()
+            except Exception as e: # left out of the output so that the next run retries it
+                print(f"Failed to download the image of {proof}: {e.__class__.__name__}")
+                counts["failed"] += 1
+                continue
+            if digest is None:
+                counts["no image"] += 1
+                continue
+            counts["images"] += 1
+            batch.append((proof, direct_link, digest))
+            if len(batch) == batch_size:
+                reading.add(ocr.submit(_read_batch, batch))
+                batch = []
+            # keep at most two batches per process waiting
+            if len(reading) >= 2 * workers:
+                finished, reading = wait(reading, return_when=FIRST_COMPLETED)
+                write_results(finished)
+        if batch:
+            reading.add(ocr.submit(_read_batch, batch))
+        write_results(wait(reading).done)
+
+    seconds = time.perf_counter() - start_time
+    metrics.observe("ocr_stage_seconds", seconds)
+    print(f"OCR read {counts['images']} images in {seconds:.1f} s: {counts}")
+    return counts
+
+if __name__ == "__main__":
+    backend_name = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_BACKEND
+    run_ocr(select_undated_proofs(["data/ru_losses.csv", "data/ua_losses.csv"]), backend=backend_name)
+    get_default_metrics().dump()
@@ -1,15 +1,29 @@
 """
 This file seeks to scrape data from the Oryx blog on RU and UA losses
 and store the scraped data in one or more CSV files.
+
+Usage: python oryx_parser.py [--incremental]
+Without a flag, both CSVs are rebuilt from scratch (main_old); --incremental
+only appends the new losses to them (main_incremental).
 """
 
-import requests
+import os
+import sys
+from collections import Counter
+from datetime import datetime
 import pandas as pd
-from bs4 import BeautifulSoup
-import re
 import global_vars
 from parser_helpers import *
-from df_cleaner import swap_ddmmyy
+from date_normalization import normalize_dates
+from async_fetcher import resolve_dates, drain_failed, MAX_IN_FLIGHT
+from proof_index import ProofIndex, canonical_proofs, is_postimg, is_twitter, twitter_dates
+from article_parser import iter_entries, load_year_first_produced
+from snapshot_store import read_article
+from crawl_journal import get_default_journal
+from storage import load_losses, save_losses, parquet_path
+from record_store import LossRecords, stable_ids
+from metrics import get_default_metrics
+from donations_parser import update_donations
 
 """
 Su-25,1978.0
@@ -18,247 +32,257 @@ MiG-29As/UB,1983.0
 MiG-29,1983.0
 """
 
-TIMEOUT_LIMIT = 100
-
-def parse_oryx_donations(link: str, user: str, vehicle_types: dict) -> []:
-    """
-    Text.
-
-    Self reference: this is how a line in the output CSV should look
-    0,Su-25,North Atlantic Treaty Organization,NATO,Ukraine,UA,14,True,True,1978.0,https://postlmg.cc/RF9WvybT/547.png
+def parse_oryx(link: str, user: str, vehicle_types: dict, fetch_dates: bool = True,
+               verbose: bool = False, workers: int | None = None) -> tuple:
     """
-    #df_year_made = pd.read_csv("donated_vehicles_years.csv")
-    df_list = [] # list to be converted into a df and stored in a csv later
-    r = requests.get(link, timeout=TIMEOUT_LIMIT)
-    soup = BeautifulSoup(r.content, 'html.parser')
-    article = soup.find('article') # main article of the Oryx page
-    lists = article.find_all('ul')
-    oryxid = 0
-    vehicle_type = ""
-
-    for vehicle_name_group in lists:
-        donated_vehicles = vehicle_name_group.find_all('li')
-        for vehicle in donated_vehicles:
-            vehicle_str = str(vehicle)
-
-            for index in enumerate(vehicle_str):
-                if not vehicle_str[index].isascii(): # some of the entries have invisible ascii characters breaking regex
-                    vehicle_str = vehicle_str[:index] + " " + vehicle_str[index+1:]
-            #print(vehicle_str)
-            vehicle_name_counts = re.findall(r"[0-9\s+]*<a href=[a-zA-Z0-9/\:\"\.\-]+>[a-zA-Z0-9\-\s/\'\(\)\*]+</a>", 
-                                            vehicle_str)
-
-            #print(vehicle_name_counts)
-            # Identify a country and abbreviation using a flag image link.
-            flag = vehicle.find('img')
-            flag_country = None # Manufacturer ("Soviet Union")
-            flag_country_abbr = None #Manufacturer abbr ("USSR")
-
-            if flag is not None:
-                flag_found = False
-                for target in global_vars.manufacturer_dict.items():
-                    target = target[0]
-                    if target in flag.get('src'):
-                        flag_found = True
-                        flag_country = target.replace("_", " ")
-                        flag_country_abbr = global_vars.manufacturer_dict[target]
-                        break
-                if not flag_found:
-                    flag_country = "NONE"
-                    flag_country_abbr = "NONE"
-
-            for vehicle_name_count in vehicle_name_counts:
-                #print(flag)
-                #print(vehicle_name_count)
-
-                count = re.search(r"[0-9]+[+]*\s", vehicle_name_count)
-                #print(count)
-                if count is None:
-                    count = 0
-                else: count = count.group(0)
-                #print(count)
-                if not isinstance(count, int):
-                    if count == '':
-                        count = 0 # when it doesn't specify how many donated, default to 0
-                    if '+' in count:
-                        count = count[:len(count)-2]
-                #print(count)
-                count = int(count)
-
-                name = re.search(r">[a-zA-Z0-9\-\s/\'\(\)\*]+<", vehicle_name_count).group(0)
-                name = name[1:]
-                name = name[:len(name)-1] # drops the < and >
-                if name[len(name)-1] == 's':
-                    name = name[:len(name)-1]
-                while name[0] == ' ':
-                    name = name[1:]
-                
-                proof = re.search(r"href=\"[a-zA-Z0-9/\:\"\.]+", vehicle_name_count).group(0)
-                proof = proof[6:]
-                if proof[len(proof)-1] == "\"":
-                    proof = proof[:len(proof)-1] # gets rid of trailing quotation marks
-
-                #print([count, name, proof, flag_country, flag_country_abbr])
-                #print("-"*50)
-
-                if name in global_vars.donated_vehicle_types:
-                    vehicle_type = global_vars.donated_vehicle_types[name]
-                is_delivered = not ("[to be delivered]" in vehicle.text or "pledged" in vehicle.text)
-                is_soviet = False
-
-                line = [oryxid, name, vehicle_type, flag_country, flag_country_abbr, 
-                        "Ukraine", "UA", count, is_delivered, is_soviet, proof]
-                df_list.append(line)
-                oryxid += 1
-                #if oryxid > 10: return []
-
-    df = pd.DataFrame(df_list, columns=global_vars.df_donations_colnames)
-    df.to_csv("donated_vehicles.csv", index=False)
-
-def parse_oryx(link: str, user: str, vehicle_types: dict) -> []:
-    """
-    This function takes in three inputs:
-    link: a link to an Oryx blog page.
+    This function takes in these inputs:
+    link: a link to an Oryx blog page, or a saved copy of one \
+    (raw bytes, a file or a snapshot folder; see snapshot_store.read_article).
     user: RU or UA
     vehicle_types: a dictionary of the first entries of vehicle names \
     and their corresponding types in the linked page.
+    fetch_dates: if False, skip the per-link date lookups and leave \
+    day, month, year empty (see parse_oryx_concurrent). Dates written in \
+    the file name of a link are always filled in, since they need no download.
+    verbose: print every record as it is parsed.
+    workers: if above 1, the sections of the page are parsed on a pool of this \
+    many processes; None decides from the size of the page and the number of CPUs \
+    (see article_parser.iter_entries).
 
     Parses an Oryx page for useful data.
-    The code is a mess. 
+    Returns the losses as a LossRecords store (see record_store.py; call
+    to_dataframe() for one row per loss), the number of Twitter links and
+    the list of Twitter links.
     """
-    # load a df of known vehicle names and their years of first production.
-    df_year_made = None
-    if user == "Russia":
-        df_year_made = pd.read_csv("reference_data/ru_unique_vehicles_years.csv", index_col="name")
-    else:
-        df_year_made = pd.read_csv("reference_data/ua_unique_vehicles.csv", index_col="name")
+    # load a dict of known vehicle names and their years of first production.
+    year_first_produced = load_year_first_produced(user)
 
     twitter_link_count = 0
-    df_list = [] # list to be converted into a df and stored in a csv later
+    records = LossRecords(user) # converted into a df and stored in a csv later
+    metrics = get_default_metrics()
     twitter_links_list = [] # list of twitter links to be scraped another time
-    oryxid = 1 # generic id number, incremented with each loss counted
-    user_abbr = global_vars.manufacturer_dict[user] # abbrv. of country operating the lost vehicle ("Russia")
-
-    # Get the raw HTML from the provided Oryx blog page and process it using bs4.
-    r = requests.get(link, timeout=TIMEOUT_LIMIT)
-    soup = BeautifulSoup(r.content, 'html.parser')
-
-    # The Oryx webpage has the main article contents stored under an <article> tag.
-    # The <ul> <li> lists for each major vehicle type are not classed or id'd in any special way.
-    # Thus it is necessary to do this inefficient setup.
-    article = soup.find('article') # main article of the Oryx page
-    lists = article.find_all('ul')
-    vehicle_type = "" # Type of the vehicle ("Tanks")
-
-    for vehicle_name_group in lists:
-        # Each element in the list is an HTML list containing a unique vehicle type
-        # and many images of individual losses. Each unique vehicle 
-        # and accompanying images/losses gets its own <li> tag.
-
-        vehicles = vehicle_name_group.find_all('li')
-
-        for vehicle in vehicles:
-            # Search for the name of the vehicle.
-            vehicle_name = re.search(r"\S[\w\s\(\)\-\"\'\,\.\/]*", vehicle.text).group(0)
-            # The Unknown T-54/55 entry in the Oryx blog once broke the regex
-            # it used to not have a colon that ends the regex
-            # Oryx fixed this so this code is unnecessary
-            # if "Unknown T-54/55" in vehicle.text:
-            #     vehicle_name = "1 Unknown T-54/55"
-            vehicle_name = name_parsing(vehicle_name) # Name of the vehicle ("T-72B3")
-            #print(vehicle_name)
-
-            # Search for a vehicle type corresponding to this name.
-            if vehicle_name in vehicle_types:
-                vehicle_type = vehicle_types[vehicle_name]
-
-            # The oryx website shows a little country flag next to each vehicle name.
-            # This identififes the country name and abbreviation using the flag img.
-            flag = vehicle.find('img', class_='thumbborder')
-            flag_country = None # Manufacturer ("Soviet Union")
-            flag_country_abbr = None #Manufacturer abbr ("USSR")
-
-            if flag is not None:
-                flag_found = False
-                for country in global_vars.manufacturer_dict.items():
-                    country_name, abbr = country[0], country[1]
-                    if country_name in flag.get('src'):
-                        flag_found = True
-                        flag_country = country_name.replace("_", " ")
-                        flag_country_abbr = abbr
-                        break
-                if not flag_found:
-                    flag_country = "NONE"
-                    flag_country_abbr = "NONE"
-            
-            # For every ([numbers], [status]) link: extract status, date, and number of vehicles
-            # described in that link.
-            # Example: (18, destroyed) yields a status of destroyed and a number of 1
-            # Example: (5,6,7,8, captured) yields status captured and number 4
-            # date depends on the postimg link embedded
-            raw_links = vehicle.find_all('a') # a collection of (number, status) links
-            for raw_link in raw_links:
-                day, month, year = None, None, None
-                status = raw_link.text
-                status, status_count = status_parsing(status) # Status and number of vehicles under it
-                proof = postimg_link_processing(raw_link.get('href')) # Proof as a postimg or twitter link
-
-                day, month, year = link_date_parsing(proof)
-
-                # Collecting a list of Twitter posts
-                # to scrape for datetime data later
-                if "twitter" in proof or "x.com" in proof:
-                    twitter_links_list.append([proof, None, None, None])
-                    twitter_link_count += 1
-
-                year_made = None
-                if vehicle_name in df_year_made.index:
-                    year_made = df_year_made.loc[vehicle_name, "year_first_produced"] # a year number or None
-                # add data to the df
-                # since each proof can have multiple numbers e.g. (30, 31 and 32: destroyed)
-                # those multiple-number proofs will result in adding multiple lines into the df.
-                for i in range(status_count):
-                    #if proof not in existing_proofs: # add only losses not already in the db
-                    df_list.append([oryxid, vehicle_name, vehicle_type, status,
-                                    day, month, year, flag_country,
-                                    flag_country_abbr, user, user_abbr, proof, year_made])
-                    oryxid += 1
-                    print(df_list[len(df_list)-1])
-                    
-                #print(df_list[len(df_list)-1])
-    return df_list, twitter_link_count, twitter_links_list
+
+    # Get the raw HTML from the provided Oryx blog page or saved copy.
+    # The page is only downloaded again if Oryx changed it since the cached copy.
+    html = read_article(link)
+
+    # For every ([numbers], [status]) link: extract status, date, and number of vehicles
+    # described in that link. See article_parser.py for how the page is walked.
+    # Example: (18, destroyed) yields a status of destroyed and a number of 1
+    # Example: (5,6,7,8, captured) yields status captured and number 4
+    # date depends on the postimg link embedded
+    for entry in iter_entries(html, vehicle_types, workers):
+        proof = entry.proof # Proof as a postimg or twitter link
+        # direct image links often carry the date in the file name
+        day, month, year = filename_date_parsing(entry.href)
+        if fetch_dates and day is None:
+            day, month, year = link_date_parsing(proof)
+
+        # Collecting a list of Twitter posts
+        # to scrape for datetime data later
+        if is_twitter(proof):
+            twitter_links_list.append([proof, None, None, None])
+            twitter_link_count += 1
+
+        year_made = year_first_produced.get(entry.name) # a year number or None
+        # add data to the df
+        # since each proof can have multiple numbers e.g. (30, 31 and 32: destroyed)
+        # those multiple-number proofs become one record counting every loss;
+        # to_dataframe() adds one line per loss into the df.
+        records.append(entry.name, entry.type, entry.status, entry.manufacturer,
+                       entry.manufacturer_abbr, proof, year_made,
+                       count=entry.status_count, date=(day, month, year))
+        metrics.inc("rows_emitted", entry.status_count, status=entry.status)
+        if verbose:
+            print(entry.status_count, entry.name, entry.status, day, month, year, proof)
+    return records, twitter_link_count, twitter_links_list
+
+def proofs_to_fetch(records: LossRecords) -> list:
+    """
+    Returns the postimg proofs of the records that their file names could not date,
+    and prints how many proofs were dated from their file names alone.
+    """
+    postimg = [proof for proof in dict.fromkeys(records.proofs) if is_postimg(proof)]
+    undated = [proof for proof in records.undated_proofs() if is_postimg(proof)]
+    dated = len(postimg) - len(undated)
+    get_default_metrics().inc("filename_dates", dated)
+    print(f"Dated {dated} of {len(postimg)} postimg proofs from their file names "
+          f"({dated / len(postimg) if postimg else 0:.0%}); {len(undated)} left to fetch")
+    return undated
+
+def decode_tweet_dates(records: LossRecords) -> dict:
+    """
+    Returns {proof: (day, month, year)} for the undated tweets of the records,
+    decoded from their status IDs all at once (see proof_index.twitter_dates).
+    """
+    tweets = pd.Series([proof for proof in records.undated_proofs() if is_twitter(proof)], dtype=object)
+    dates = twitter_dates(tweets).dropna()
+    print(f"Dated {len(dates.index)} of {len(tweets.index)} tweets from their status IDs")
+    return dict(zip(tweets[dates.index], dates.itertuples(index=False, name=None)))
+
+def parse_oryx_concurrent(link: str, user: str, vehicle_types: dict,
+                          max_in_flight: int = MAX_IN_FLIGHT) -> []:
+    """
+    Two-phase version of parse_oryx.
+    First walks the Oryx page and collects every unique postimg proof,
+    then resolves the dates of those not dated by their file names concurrently
+    and joins them back into the rows. Tweets are dated from their status IDs.
+    Takes the same inputs and returns the same outputs as parse_oryx.
+
+    ## Parameters
+    max_in_flight: the maximum number of postimg requests waiting on the network at once.
+    """
+    records, twitter_link_count, twitter_links_list = parse_oryx(link, user, vehicle_types,
+                                                                 fetch_dates=False)
+    # Tweets need no download, so only postimg proofs are fetched.
+    proofs = proofs_to_fetch(records)
+    dates = resolve_dates(proofs, max_in_flight=max_in_flight)
+    dates.update(drain_failed(links=proofs, max_in_flight=max_in_flight))
+    dates.update(decode_tweet_dates(records))
+    records.set_dates(dates)
+    return records, twitter_link_count, twitter_links_list
+
+def incremental_update(csv_path: str, link: str, user: str, vehicle_types: dict,
+                       max_in_flight: int = MAX_IN_FLIGHT,
+                       save: bool = True) -> pd.DataFrame:
+    """
+    Updates an existing losses CSV with only the losses Oryx added since it was written.
+
+    Loads the CSV into a proof_index.ProofIndex (the rows citing each proof and its date), parses the Oryx page
+    without looking up any dates, and keeps only the rows whose proof appears more
+    times on the page than in the CSV. Dates are then looked up for those rows alone,
+    so the work done scales with the number of new losses, not the total.
+    Existing rows (and any manual date corrections) are left untouched. Ids come from
+    record_store.stable_ids over the whole table, so existing rows keep theirs, new rows
+    get the ids a full scrape would give them, and tables written with counted ids
+    are moved over to content ids.
+    If the CSV does not exist yet this is the same as a full scrape.
+
+    ## Parameters
+    csv_path: path to data/ru_losses.csv or data/ua_losses.csv.
+    link, user, vehicle_types: passed on to parse_oryx.
+    save: if False, return the updated DataFrame without writing it.
+    """
+    if os.path.exists(csv_path) or os.path.exists(parquet_path(csv_path)):
+        existing = load_losses(csv_path)
+    else:
+        existing = pd.DataFrame(columns=global_vars.df_colnames)
+    # the dates already known for a proof are reused when Oryx adds another loss to the same proof
+    index = ProofIndex()
+    index.add_rows("existing", existing, date_source="existing")
+
+    records, twitter_link_count, twitter_links_list = parse_oryx(link, user, vehicle_types,
+                                                                 fetch_dates=False)
+    proofs = pd.Series(records.proofs, dtype=object)
+    existing_rows = index.join(proofs, ["rows"])["rows"].fillna("").str.split().str.len()
+    seen_proofs = Counter()
+    new_indices, new_counts = [], []
+    for i, (proof, count, existing_count) in enumerate(zip(canonical_proofs(proofs), records.counts,
+                                                           existing_rows)):
+        # add only losses not already in the db
+        new_count = min(count, seen_proofs[proof] + count - existing_count)
+        seen_proofs[proof] += count
+        if new_count > 0:
+            new_indices.append(i)
+            new_counts.append(new_count)
+    new_records = records.take(new_indices, new_counts)
+    print(f"{new_records.total()} new losses out of {records.total()} on the page")
+
+    def known_dates(proofs) -> pd.DataFrame:
+        return index.join(pd.Series(list(proofs), dtype=object), ["day", "month", "year"]).dropna()
+
+    to_fetch = proofs_to_fetch(new_records)
+    known_to_fetch = known_dates(to_fetch).index
+    unknown = [proof for i, proof in enumerate(to_fetch) if i not in known_to_fetch]
+    dates = resolve_dates(unknown, max_in_flight=max_in_flight)
+    dates.update(drain_failed(links=unknown, max_in_flight=max_in_flight))
+    tweet_dates = decode_tweet_dates(new_records)
+    known_tweets = known_dates(tweet_dates).index
+    dates.update(date for i, date in enumerate(tweet_dates.items()) if i not in known_tweets)
+    new_dates, reused = {}, set()
+    known = known_dates(new_records.proofs)
+    for i, proof in enumerate(new_records.proofs):
+        if proof in dates:
+            new_dates[proof] = dates[proof]
+        elif i in known.index:
+            new_dates[proof] = tuple(int(value) for value in known.loc[i])
+            reused.add(proof)
+    new_records.set_dates(new_dates)
+    df_new = new_records.to_dataframe()
+    # titles and file names need the same DMY clean up as a full scrape; known dates already had it
+    print(f"Date fixes: {normalize_dates(df_new, rows=~df_new['proof'].isin(reused))}")
+
+    if len(existing.index) == 0:
+        df = df_new
+    elif len(df_new.index) == 0:
+        df = existing
+    else:
+        df = pd.concat([existing, df_new], ignore_index=True)
+    df["id"] = stable_ids(df)
+    return save_losses(df, csv_path) if save else df
+
+def main_incremental():
+    """
+    Daily refresh: appends only the new RU and UA losses to the existing CSVs.
+    """
+    incremental_update("data/ru_losses.csv", global_vars.ru_losses, "Russia", global_vars.ru_vehicle_types)
+    incremental_update("data/ua_losses.csv", global_vars.ua_losses, "Ukraine", global_vars.ua_vehicle_types)
+    print(get_default_metrics().summary())
+    get_default_metrics().dump()
+
+def replay_snapshot(source, user: str, vehicle_types: dict, csv_path: str,
+                    at: datetime | None = None) -> pd.DataFrame:
+    """
+    Rebuilds a losses CSV from an archived Oryx article without touching the network.
+    Dates come from the file names of the links, the status IDs of tweets and
+    from links the crawl journal already resolved; the rest stay empty.
+
+    ## Parameters
+    source: a saved page, raw bytes or a snapshot folder (see snapshot_store.read_article).
+    user, vehicle_types: passed on to parse_oryx.
+    csv_path: where to write the rebuilt CSV.
+    at: when source is a snapshot folder, replay the page as it was at this time.
+    """
+    html = read_article(source, at=at)
+    records, twitter_link_count, twitter_links_list = parse_oryx(html, user, vehicle_types,
+                                                                 fetch_dates=False)
+    journal = get_default_journal()
+    records.set_dates({proof: journal.result(proof) for proof in records.undated_proofs()
+                       if is_postimg(proof)})
+    records.set_dates(decode_tweet_dates(records))
+    df = records.to_dataframe()
+    print(f"Date fixes: {normalize_dates(df)}")
+    return save_losses(df, csv_path)
 
 def main():
     """
     Second main function.
     """
-    # parse_oryx_donations(ua_supplies, "Ukraine", donated_vehicle_types)
-    donations = pd.read_csv("donated_vehicles.csv")
-    donations = donations[donations["vehicle_name"] != "Ringtausch"]
-    donations["oryxid"] = donations.index
-    donations = donations.to_csv("donated_vehicles.csv", index=False)
+    # the donations page has its own parser, which filters, adds the
+    # production years and numbers the rows in memory
+    update_donations(global_vars.ua_supplies, "Ukraine", global_vars.donated_vehicle_types)
     #donations["vehicle_name"].to_csv("donated_vehicles_years.csv", index=False)
 
 def main_old():
     """
     Main function.
     """
-    df_list, twitter_link_count, twitter_links_list = parse_oryx(global_vars.ru_losses, "Russia", global_vars.ru_vehicle_types)
+    records, twitter_link_count, twitter_links_list = parse_oryx_concurrent(global_vars.ru_losses, "Russia", global_vars.ru_vehicle_types)
     # print(twitter_link_count)
-    df_ru = pd.DataFrame(df_list, columns=global_vars.df_colnames)
-    df_ru[["day", "month", "year"]] = df_ru[["day", "month", "year"]].apply(swap_ddmmyy, axis=1)
+    df_ru = records.to_dataframe()
+    print(f"RU date fixes: {normalize_dates(df_ru)}")
     # print(df.head())
-    df_ru.to_csv("data/ru_losses.csv", index=False)
+    save_losses(df_ru, "data/ru_losses.csv")
 
     # df_twitter_ru = pd.DataFrame(twitter_links_list, columns=["link", "day", "month", "year"])
     # print(df_twitter_ru.head())
     # df_twitter_ru.to_csv("ru_losses_twitter_links.csv", index=False)
 
-    df_list, twitter_link_count, twitter_links_list = parse_oryx(global_vars.ua_losses, "Ukraine", global_vars.ua_vehicle_types)
-    df_ua = pd.DataFrame(df_list, columns=global_vars.df_colnames)
-    df_ua[["day", "month", "year"]] = df_ua[["day", "month", "year"]].apply(swap_ddmmyy, axis=1)
+    records, twitter_link_count, twitter_links_list = parse_oryx_concurrent(global_vars.ua_losses, "Ukraine", global_vars.ua_vehicle_types)
+    df_ua = records.to_dataframe()
+    print(f"UA date fixes: {normalize_dates(df_ua)}")
     # print(df.head())
-    df_ua.to_csv("data/ua_losses.csv", index=False)
+    save_losses(df_ua, "data/ua_losses.csv")
 
     # df_twitter_ua = pd.DataFrame(twitter_links_list, columns=["link", "day", "month", "year"])
     # print(df_twitter_ua.head())
@@ -273,4 +297,7 @@ def main_old():
 
 
 if __name__ == "__main__":
-    main_old()
+    if "--incremental" in sys.argv[1:]:
+        main_incremental()
+    else:
+        main_old()
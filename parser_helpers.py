@@ -5,14 +5,38 @@ This file contains a number of parser functions used in oryx_parser.py.
 import requests
 import re
 import time
-from bs4 import BeautifulSoup
+from datetime import datetime
+from urllib.parse import unquote, urlsplit
 #import twitter_api_tokens # user-side file with twitter api tokens
 #import tweepy
 import pandas as pd
+from response_cache import fetch_page_info
+from proof_index import canonical_proof, is_postimg, twitter_dates
+from crawl_journal import get_default_journal
+from metrics import get_default_metrics
 
 # How long requests can spend querying a link before stopping.
 TIMEOUT_LIMIT = 60
-CURRENT_YR = 25
+# Two-digit year the war started in; no loss can be dated earlier.
+FIRST_YR = 22
+
+def current_yr() -> int:
+    """
+    Returns the two-digit current year, the latest year a loss can be dated.
+
+    Example output: 26
+    """
+    return datetime.now().year % 100
+
+# Patterns used on every Oryx entry, compiled once.
+NAME_PATTERN = re.compile(r".[0-9]*.(.*)", re.DOTALL)
+STATUS_PATTERN = re.compile(r"[A-Za-z0-9\s]+\)")
+NUMBER_PATTERN = re.compile(r"[0-9]+")
+TITLE_DATE_PATTERN = re.compile(r"\W([0-9]{2} [0-9]{2} [0-9]{2,4})\W")
+# Three numbers split by the separators replace_bad_separators knows, such as "05-08-23",
+# "2022-05-21" or "11_16_2022". Matched inside a lookahead, so that
+# overlapping candidates ("72-05-08-23" holds "72-05-08" and "05-08-23") are all tried.
+FILENAME_DATE_PATTERN = re.compile(r"(?=(?<!\d)(\d{1,4})[_:.\- ,](\d{1,4})[_:.\- ,](\d{2,4})(?!\d))")
 
 def name_parsing(input_name: str) -> str:
     """
@@ -26,14 +50,11 @@ def name_parsing(input_name: str) -> str:
     input_name: a partially parsed string containing the name of a type of vehicle.
     They usually take the form of " [number] [name]".
     """
-    output = ""
-    startreading = False
-    for index in range(1,len(input_name)):
-        if input_name[index] < '0' or input_name[index] > '9': # skip initial numbers
-            startreading = True
-        if startreading:
-            output += input_name[index]
-    return output[1:]
+    # skip the first character and any numbers after it, then the separator after those
+    parsed_name = NAME_PATTERN.match(input_name)
+    if parsed_name is None:
+        return ""
+    return parsed_name.group(1)
 
 def status_parsing(status: str) -> tuple[str, int]:
     """
@@ -49,40 +70,24 @@ def status_parsing(status: str) -> tuple[str, int]:
     status: a partially parsed string containing the status of a lost vehicle.
     They usually take the form of " ([1 or more numbers]: [status])".
     """
-    parsed_status = re.search(r"[A-Za-z0-9\s]+\)", status)
+    parsed_status = STATUS_PATTERN.search(status)
     if parsed_status is not None: parsed_status = parsed_status.group(0).strip(" )")
     else: return "Unknown", 1
-    status_count = len(re.findall(r"[0-9]+", status))
+    status_count = len(NUMBER_PATTERN.findall(status))
     return parsed_status, status_count
 
 def postimg_link_processing(link: str) -> str:
     """
     Turns the link into a usable format. See the docstring for postimg_date_parsing
-    for additional context.
+    for additional context, and proof_index.canonical_proof for the format.
 
     Example input: https://i.postimg.cc/jdFBJdQb/1027-t55-dam-05-08-23.jpg
-    Example output: https://postlmg.cc/jdFBJdQb
+    Example output: https://postimg.cc/jdFBJdQb
 
     ## Parameters
-    postimg: a link to a postimg image post.
+    postimg: a link to a postimg image post (or any other proof link).
     """
-    if "postimg" in link:
-        # Line below used to be necessary; I think postimg changed the way links work recently
-        link = link.replace("i.postimg", "postimg")
-        placeholder = ""
-        slash_counter = 0
-        # Postimg links take the form of:
-        # https://i.postimg.cc/idhere/imagename.extension
-        # this for loop truncates the link (after replacement) to:
-        # https://postlmg.cc/idhere
-        for char in link:
-            if char == '/':
-                slash_counter += 1
-            if slash_counter == 4:
-                break
-            placeholder += char
-        return placeholder
-    return link
+    return canonical_proof(link)
 
 def postimg_date_parsing(postimg: str) -> tuple[int, int, int] | tuple[None, None, None]:
 
@@ -112,41 +117,95 @@ def postimg_date_parsing(postimg: str) -> tuple[int, int, int] | tuple[None, Non
     # we can proceed to parsing normally.
     start_time = time.perf_counter()
     try: # in case the get call expires even after 100 seconds
-        r = requests.get(postimg, timeout=TIMEOUT_LIMIT)
-        soup = BeautifulSoup(r.content, 'html.parser')
-        title = soup.find("title")
-
-        # Oryx image titling is extremely inconsistent so this only sort of works
-        # Clean up the dates manually later
-        # See docstring for what an optimal title looks like
-        parsed_date = re.search(r"\W([0-9]{2} [0-9]{2} [0-9]{2,4})\W", title.text)
-        if parsed_date is None:
-            end_time = time.perf_counter()
-            print(f"Parsing link {postimg} took {end_time - start_time} seconds to run")
-            return None, None, None
-
-        parsed_date = parsed_date.group(0).strip()
-        parsed_date = parsed_date.split()
-        # sometimes parsed_date only has 1 or 2 numbers. In that case, return None.
-        if len(parsed_date) < 3:
-            end_time = time.perf_counter()
-            print(f"Parsing link {postimg} took {end_time - start_time} seconds to run")
-            return None, None, None
-        day = int(parsed_date[0])
-        month = int(parsed_date[1])
-        year = int(parsed_date[2])
-        end_time = time.perf_counter()
-        print(f"Parsing link {postimg} took {end_time - start_time} seconds to run")
+        # postimg posts never change, so the title is only downloaded once per link
+        title = fetch_page_info(postimg).title
+        day, month, year = title_date_parsing(title)
+        get_default_metrics().observe("postimg_date_seconds", time.perf_counter() - start_time)
         return day, month, year
-    except requests.exceptions.ReadTimeout:
-        # record all link that timed out so that I can manually update them later
-        # use 'a' instead of 'w' to prevent overwriting of previous links
+    except requests.exceptions.RequestException as e:
+        # record all links that failed so that drain_failed in async_fetcher.py can retry them
         end_time = time.perf_counter()
         print(f"Failed to parse {postimg}; took {end_time - start_time} seconds to run")
-        with open(file="unscanned_links.txt", mode='a', encoding='utf-8') as f:
-            f.write(postimg)
-            f.write('\n')
+        journal = get_default_journal()
+        journal.add_links([postimg])
+        journal.record_failed(postimg, e)
+        journal.checkpoint()
+        return None, None, None
+
+def title_date_parsing(title: str) -> tuple[int, int, int] | tuple[None, None, None]:
+    """
+    Extracts a day, month, year triple from the title of a postimg page.
+
+    Example input: 1027 t55 dam 05 08 23 - Postimages
+    Example output: 5, 8, 23
+
+    ## Parameters
+    title: the text of the <title> tag of a postimg page, or None.
+    """
+    if title is None:
+        return None, None, None
+    # Oryx image titling is extremely inconsistent so this only sort of works
+    # Clean up the dates manually later
+    # See docstring for postimg_date_parsing for what an optimal title looks like
+    parsed_date = TITLE_DATE_PATTERN.search(title)
+    if parsed_date is None:
+        return None, None, None
+
+    parsed_date = parsed_date.group(0).strip()
+    parsed_date = parsed_date.split()
+    # sometimes parsed_date only has 1 or 2 numbers. In that case, return None.
+    if len(parsed_date) < 3:
         return None, None, None
+    return int(parsed_date[0]), int(parsed_date[1]), int(parsed_date[2])
+
+def _valid_date(day: int, month: int) -> bool:
+    """
+    True if day and month can be a day and a month in either order.
+    """
+    return 1 <= day <= 31 and 1 <= month <= 31 and min(day, month) <= 12
+
+def filename_date_parsing(link: str | None) -> tuple[int, int, int] | tuple[None, None, None]:
+    """
+    Extracts a day, month, year triple from the file name of a direct postimg
+    image link, without downloading anything. Oryx uploads are usually named
+    after the same text the page title is made from, so the date found here
+    is the one postimg_date_parsing would have downloaded the page for.
+
+    The date is returned in the order it is written, like title_date_parsing,
+    so that date_normalization.normalize_dates cleans up both alike
+    ("11-16-2022" stays month first). Year-first names ("2022-05-21-t-64bv.jpg")
+    and years in the middle ("01-2023-14", see insert_dates_into_df.rearrange_year_middle)
+    are reordered here, since no title is written that way.
+    Links without a file name (https://postimg.cc/jdFBJdQb) return None values.
+
+    Example input: https://i.postimg.cc/jdFBJdQb/1027-t55-dam-05-08-23.jpg
+    Example output: 5, 8, 23
+
+    ## Parameters
+    link: a proof link exactly as it appears in the Oryx article, or None.
+    """
+    if not link:
+        return None, None, None
+    path = urlsplit(link).path.strip("/").split("/")
+    if len(path) < 2: # postimg.cc/<id> pages and twitter.com links carry no file name
+        return None, None, None
+    filename = unquote(path[-1]).rsplit(".", 1)[0]
+    last_yr = current_yr()
+    for match in FILENAME_DATE_PATTERN.finditer(filename):
+        first, second, third = (int(number) for number in match.groups())
+        widths = tuple(len(number) for number in match.groups())
+        if widths[0] == 4: # year first: 2022-05-21
+            if FIRST_YR <= first - 2000 <= last_yr and 1 <= second <= 12 and 1 <= third <= 31:
+                return third, second, first - 2000
+        elif widths[1] == 4: # year in the middle: 01-2023-14
+            if FIRST_YR <= second - 2000 <= last_yr and _valid_date(first, third):
+                return first, third, second
+        elif widths[2] == 4: # 05-08-2023 or 11-16-2022
+            if FIRST_YR <= third - 2000 <= last_yr and _valid_date(first, second):
+                return first, second, third
+        elif widths[2] == 2 and FIRST_YR <= third <= last_yr and _valid_date(first, second):
+            return first, second, third
+    return None, None, None
 
 # def parse_all_twitter_links(twitter_list: list) -> list:
 #     """
@@ -194,17 +253,18 @@ def postimg_date_parsing(postimg: str) -> tuple[int, int, int] | tuple[None, Non
 
 def twitter_date_parsing(link: str) -> tuple[int, int, int] | tuple[None, None, None]:
     """
-    Takes in a Twitter link.
-    Returns either its DDMMYY data or (if the API refuses to accept more requests) None.
-
-    Reference:
-    https://www.geeksforgeeks.org/python-tweepy-getting-the-date-and-time-when-a-tweet-was-tweeted/
+    Takes in a Twitter or X link.
+    Returns the day, month, year it was posted on, decoded from the status ID
+    without calling the Twitter API (see proof_index.twitter_dates, which does
+    the same for a whole column at once), or None values if it is not a tweet.
 
-    Twitter API tokens are taken from a private file.
-    You might want to create your own version if you are cloning this repo.
+    Example input: https://twitter.com/UAWeapons/status/1670510694838546436
+    Example output: 18, 6, 23
     """
-    #PLACEHOLDER
-    return None, None, None
+    date = twitter_dates(pd.Series([link], dtype=object)).iloc[0]
+    if date.isna().any():
+        return None, None, None
+    return int(date["day"]), int(date["month"]), int(date["year"])
 
 def link_date_parsing(link: str):
     """
@@ -213,7 +273,7 @@ def link_date_parsing(link: str):
 
     Derives the date of sighting of this loss through more website parsing.
     """
-    if "postimg" in link or "postlmg" in link:
+    if is_postimg(link):
         return postimg_date_parsing(link)
     return twitter_date_parsing(link)
     # All links are postimg or postlmg or twitter (I checked)
@@ -0,0 +1,305 @@
+"""
+This file contains a small pipeline runner for the whole scrape -> clean -> date flow.
+
+The flow used to be a set of main functions spread over oryx_parser.py, df_cleaner.py,
+ocr_dates.py and insert_dates_into_df.py that had to be run by hand, in the right order.
+Here each Stage declares the files it reads and writes. The runner works out the
+order from those files, runs stages that do not depend on each other at the same
+time, and skips a stage when the content of its inputs and outputs is the same as
+after its last run. So re-running after a small change only redoes the stages
+downstream of that change.
+Every stage logs its wall time and the number of rows in its outputs.
+
+Usage: python pipeline.py [--force] [--legacy] [stage name ...]
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+from date_normalization import add_date_lost
+from df_cleaner import clean_links, prepare_list, get_direct_links, main1 as twitter_links
+from insert_dates_into_df import main1 as combine_raw_dates, main2 as process_raw_dates, merge_ocr_dates
+from scrape_pages import scrape_pages
+from donations_parser import CHANGES_PATH
+from storage import load_losses, save_losses
+from metrics import get_default_metrics
+from ocr_dates import run_ocr, select_undated_proofs, OUTPUT_PATH as OCR_OUTPUT_PATH
+from proof_index import main as build_proof_index, PROOF_SOURCES, OCR_DATES_PATH, DIRECT_LINKS_PATH, \
+    INDEX_PATH
+
+STATE_PATH = "cache/pipeline_state.json"
+# Lists of the proofs of the current losses tables, made by df_cleaner.
+POSTIMG_LINKS_PATH = "data/total_losses_postimg_links.csv"
+TWITTER_LINKS_PATH = "data/total_losses_twitter_links.csv"
+# Bytes hashed at a time.
+HASH_CHUNK_SIZE = 1024 * 1024
+
+Stage = namedtuple("Stage", ["name", "function", "inputs", "outputs"])
+"""
+name: unique name of the stage.
+function: called with no arguments to run the stage.
+inputs: files the stage reads. A stage without inputs (such as a scrape of
+the live site) runs every time.
+outputs: files the stage writes. A file in both inputs and outputs is rewritten in
+place; the stage then runs after the stage listed before it that writes the file,
+and stages reading the file run after it.
+"""
+
+_hash_memo = {}
+_hash_memo_lock = threading.Lock()
+
+def file_hash(path: str) -> str | None:
+    """
+    Returns the SHA-256 of a file's content, or None if it does not exist.
+    Hashes are remembered for as long as the file's size and mtime stay the same.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hash_memo_lock:
+        if key in _hash_memo:
+            return _hash_memo[key]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    with _hash_memo_lock:
+        _hash_memo[key] = digest.hexdigest()
+    return _hash_memo[key]
+
+def count_rows(path: str) -> int | None:
+    """
+    Returns the number of data rows of a CSV (lines minus the header),
+    or None for other files.
+    """
+    if not path.endswith(".csv") or not os.path.exists(path):
+        return None
+    lines = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            lines += chunk.count(b"\n")
+    return max(lines - 1, 0)
+
+class Pipeline:
+    """
+    Runs a list of stages in dependency order, in parallel where possible.
+
+    ## Parameters
+    stages: the stages; each file may be the output of at most one stage, apart
+    from the stages rewriting it in place, listed after it.
+    state_path: JSON file holding the input and output hashes of each stage's last run.
+    """
+    def __init__(self, stages: list[Stage], state_path: str = STATE_PATH):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.state_lock = threading.Lock()
+        writers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in writers and output not in stage.inputs:
+                    raise ValueError(f"{output} is written by both {writers[output][0]} and {stage.name}")
+                writers.setdefault(output, []).append(stage.name)
+        def producer(path, name):
+            # the writer before an in-place stage, or the last writer for anyone else
+            chain = writers.get(path, [])
+            if name in chain:
+                return chain[chain.index(name) - 1] if chain.index(name) > 0 else None
+            return chain[-1] if chain else None
+        self.upstream = {stage.name: {producer(path, stage.name) for path in stage.inputs} - {None}
+                         for stage in stages}
+        self.order() # raises on cycles
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+
+    def order(self) -> list[str]:
+        """
+        Returns the stage names sorted so that every stage comes after the stages it depends on.
+        """
+        ordered, visiting = [], set()
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage {name} depends on itself")
+            visiting.add(name)
+            for upstream in sorted(self.upstream[name]):
+                visit(upstream)
+            visiting.discard(name)
+            ordered.append(name)
+        for name in self.stages:
+            visit(name)
+        return ordered
+
+    def with_upstream(self, names: list[str]) -> set[str]:
+        """
+        Returns the named stages and every stage they depend on.
+        """
+        selected = set()
+        pending = list(names)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise KeyError(f"No stage named {name}")
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.upstream[name])
+        return selected
+
+    def is_fresh(self, stage: Stage) -> bool:
+        """
+        Whether a stage's inputs and outputs are unchanged since its last successful run.
+        """
+        if not stage.inputs:
+            return False
+        last_run = self.state.get(stage.name)
+        if last_run is None:
+            return False
+        return last_run["inputs"] == {path: file_hash(path) for path in stage.inputs} and \
+            last_run["outputs"] == {path: file_hash(path) for path in stage.outputs} and \
+            None not in last_run["outputs"].values()
+
+    def run_stage(self, stage: Stage, force: bool = False) -> dict:
+        """
+        Runs one stage unless it is fresh, records its hashes and returns a log entry.
+        """
+        if not force and self.is_fresh(stage):
+            print(f"[{stage.name}] up to date, skipped")
+            return {"stage": stage.name, "skipped": True}
+        start_time = time.perf_counter()
+        stage.function()
+        seconds = time.perf_counter() - start_time
+        rows = {path: count_rows(path) for path in stage.outputs}
+        get_default_metrics().observe("stage_seconds", seconds, stage=stage.name)
+        with self.state_lock:
+            self.state[stage.name] = {"inputs": {path: file_hash(path) for path in stage.inputs},
+                                      "outputs": {path: file_hash(path) for path in stage.outputs}}
+            self.save_state()
+        print(f"[{stage.name}] {seconds:.2f} s, rows: {rows}")
+        return {"stage": stage.name, "skipped": False, "seconds": seconds, "rows": rows}
+
+    def save_state(self):
+        if os.path.dirname(self.state_path):
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path + ".tmp", "w") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    def run(self, names: list[str] | None = None, force: bool = False,
+            max_workers: int | None = None) -> list[dict]:
+        """
+        Runs the named stages (all of them if names is None) and the stages they
+        depend on. A stage starts as soon as every stage it depends on is done.
+        Returns the log entries of the stages in the order they finished, and
+        writes the run's metrics (including stage_seconds) to metrics.METRICS_PATH.
+        If a stage raises, the stages already running finish, no new ones start
+        and the error is raised.
+
+        ## Parameters
+        names: stages to run, with their dependencies.
+        force: run every selected stage even if it is fresh.
+        max_workers: the number of stages run at once; defaults to all that are ready.
+        """
+        selected = set(self.stages) if names is None else self.with_upstream(names)
+        pending = [name for name in self.order() if name in selected]
+        done, log = set(), []
+        with ThreadPoolExecutor(max_workers=max_workers or len(pending) or 1) as pool:
+            running = {}
+            while pending or running:
+                for name in [name for name in pending if self.upstream[name] & selected <= done]:
+                    pending.remove(name)
+                    running[pool.submit(self.run_stage, self.stages[name], force)] = name
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        wait(running)
+                        raise future.exception()
+                    done.add(name)
+                    log.append(future.result())
+        get_default_metrics().dump()
+        return log
+
+def add_dates(losses_path: str, ocr_dates_path: str, output: str):
+    """
+    Stage function: builds date_lost from day, month, year, then fills the
+    remaining gaps with the OCR dates (see insert_dates_into_df.merge_ocr_dates).
+    """
+    losses = load_losses(losses_path)
+    print(f"{losses_path}: {add_date_lost(losses)} invalid dates")
+    print(f"{losses_path} date sources: {merge_ocr_dates(losses, pd.read_csv(ocr_dates_path))}")
+    save_losses(losses, output)
+
+STAGES = [Stage("scrape", lambda: scrape_pages(incremental=True), [],
+                ["data/ru_losses.csv", "data/ua_losses.csv", "donated_vehicles.csv", CHANGES_PATH]),
+          Stage("clean_links", lambda: clean_links("data/ru_losses.csv", "data/ua_losses.csv"),
+                ["data/ru_losses.csv", "data/ua_losses.csv"],
+                ["data/ru_losses.csv", "data/ua_losses.csv"]),
+          Stage("postimg_links", lambda: prepare_list("data/ru_losses.csv", "data/ua_losses.csv", POSTIMG_LINKS_PATH),
+                ["data/ru_losses.csv", "data/ua_losses.csv"],
+                [POSTIMG_LINKS_PATH]),
+          Stage("direct_links", lambda: get_direct_links(POSTIMG_LINKS_PATH),
+                [POSTIMG_LINKS_PATH],
+                [POSTIMG_LINKS_PATH]),
+          Stage("twitter_links", lambda: twitter_links("data/ru_losses.csv", "data/ua_losses.csv", TWITTER_LINKS_PATH),
+                ["data/ru_losses.csv", "data/ua_losses.csv"],
+                [TWITTER_LINKS_PATH]),
+          Stage("ocr",
+                lambda: run_ocr(select_undated_proofs(["data/ru_losses.csv", "data/ua_losses.csv"]),
+                                output=OCR_OUTPUT_PATH),
+                ["data/ru_losses.csv", "data/ua_losses.csv", POSTIMG_LINKS_PATH],
+                [OCR_OUTPUT_PATH]),
+          Stage("ru_dates",
+                lambda: add_dates("data/ru_losses.csv", "data_legacy/total_losses_with_processed_dates.csv",
+                                  "data/ru_losses_dated.csv"),
+                ["data/ru_losses.csv", "data_legacy/total_losses_with_processed_dates.csv"],
+                ["data/ru_losses_dated.csv"]),
+          Stage("ua_dates",
+                lambda: add_dates("data/ua_losses.csv", "data_legacy/total_losses_with_processed_dates.csv",
+                                  "data/ua_losses_dated.csv"),
+                ["data/ua_losses.csv", "data_legacy/total_losses_with_processed_dates.csv"],
+                ["data/ua_losses_dated.csv"]),
+          Stage("proof_index", build_proof_index,
+                [path for _, path in PROOF_SOURCES] + [OCR_DATES_PATH, DIRECT_LINKS_PATH],
+                [INDEX_PATH])]
+"""
+The stages of the full refresh: scrape the Oryx pages, canonicalize their proofs, list
+the postimg proofs (with their direct links, storing their images) and the tweets (with
+the day they were posted), read the dates of the undated images with OCR, add a
+date_lost column to each losses table from the committed OCR dates, and index every proof.
+The OCR stage runs after direct_links so it finds the images already stored.
+"""
+
+LEGACY_STAGES = [Stage("combine_raw_dates",
+                       lambda: combine_raw_dates("reference_data/links_and_dates_from_hgface.csv",
+                                                 "data_legacy/total_losses_postimg_links.csv",
+                                                 "data_legacy/total_losses_with_raw_dates.csv"),
+                       ["reference_data/links_and_dates_from_hgface.csv", "data_legacy/total_losses_postimg_links.csv"],
+                       ["data_legacy/total_losses_with_raw_dates.csv"]),
+                 Stage("process_raw_dates",
+                       lambda: process_raw_dates("data_legacy/total_losses_with_raw_dates.csv",
+                                                 "data_legacy/total_losses_with_processed_dates.csv"),
+                       ["data_legacy/total_losses_with_raw_dates.csv"],
+                       ["data_legacy/total_losses_with_processed_dates.csv"])]
+"""
+Stages that rebuild the committed OCR dates in data_legacy from the notebook output.
+They overwrite tracked files, so they only run with --legacy; the stages reading
+total_losses_with_processed_dates.csv then run after them.
+"""
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    force = "--force" in args
+    stages = STAGES + LEGACY_STAGES if "--legacy" in args else STAGES
+    names = [arg for arg in args if arg not in ("--force", "--legacy")]
+    Pipeline(stages).run(names or None, force=force)
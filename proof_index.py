@@ -0,0 +1,314 @@
+"""
+This file contains the one canonical form of a proof link, and a persistent index of every proof.
+
+Proof links reach the pipeline in many spellings: postimg posts as i.postimg.cc image
+links, postimg.cc or postlmg.cc pages, tweets on twitter.com or x.com, with or without
+/photo/1, query strings or trailing spaces. Every stage used to clean them its own way
+(postimg_link_processing, df_cleaner.fix_postimg, "twitter" in proof checks), so the
+same proof did not always match itself across files. canonical_proof is now the only
+normalizer, and every lookup, join and dedup goes through it.
+
+ProofIndex keeps one row per canonical proof across the RU, UA, donations and legacy
+tables: the rows that cite it, its direct image link, and its date with where that date
+came from. It is built once per run (see build_proof_index) and saved to INDEX_PATH.
+The stages build the same index over the tables they work on and look proofs up
+through it instead of keeping their own dicts: oryx_parser.incremental_update
+(rows and dates already known), insert_dates_into_df.merge_ocr_dates and
+import_dates_using_web.merge_manual_dates (date backfills), and df_cleaner.prepare_list
+and main1 (the distinct postimg proofs and tweets).
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from storage import write_csv
+
+INDEX_PATH = "cache/proof_index.csv"
+INDEX_COLUMNS = ["kind", "rows", "direct_link", "day", "month", "year", "date_source"]
+POSTIMG = "postimg"
+TWITTER = "twitter"
+OTHER = "other"
+
+POSTIMG_PATTERN = re.compile(r"https?://(?:i\.)?post[il]mg\.cc/([A-Za-z0-9]+)", re.IGNORECASE)
+# Tweets without their user ("twitter.com/i/web/status/<id>") match with "i" as the user.
+TWITTER_PATTERN = re.compile(r"https?://(?:www\.|mobile\.)?(?:twitter|x)\.com/(\w+)/(?:web/)?status(?:es)?/(\d+)",
+                             re.IGNORECASE)
+# Twitter status IDs are snowflakes: the bits above the lowest 22 count milliseconds
+# since this epoch (2010-11-04 01:42:54.657 UTC).
+TWITTER_EPOCH_MS = 1288834974657
+# Smallest snowflake status ID; older IDs were sequential and hold no time.
+FIRST_SNOWFLAKE_ID = 29700859247
+
+PROOF_SOURCES = [("ru_losses", "data/ru_losses.csv"),
+                 ("ua_losses", "data/ua_losses.csv"),
+                 ("donations", "donated_vehicles.csv"),
+                 ("legacy_ru_losses", "data_legacy/ru_losses.csv"),
+                 ("legacy_ua_losses", "data_legacy/ua_losses.csv")]
+"""
+(name, path) of every table whose proofs go into the index. Missing files are skipped.
+"""
+
+# Legacy OCR output with a proof, direct link and datetime per image.
+OCR_DATES_PATH = "data_legacy/total_losses_with_processed_dates.csv"
+# Legacy proof and direct link pairs.
+DIRECT_LINKS_PATH = "data_legacy/total_losses_postimg_links.csv"
+
+def canonical_proof(url: str) -> str:
+    """
+    Returns the canonical form of a proof link: postimg posts as https://postimg.cc/<id>,
+    tweets as https://twitter.com/<user>/status/<id>, anything else stripped of
+    whitespace, its #fragment and trailing slashes.
+
+    Example input: https://i.postimg.cc/jdFBJdQb/1027-t55-dam-05-08-23.jpg
+    Example output: https://postimg.cc/jdFBJdQb
+    Example input: https://x.com/UAWeapons/status/1506224014498357252/photo/1?s=20
+    Example output: https://twitter.com/UAWeapons/status/1506224014498357252
+    Example input: https://twitter.com/i/web/status/1506224014498357252
+    Example output: https://twitter.com/i/status/1506224014498357252
+
+    ## Parameters
+    url: any proof link.
+    """
+    url = url.strip().split("#")[0]
+    postimg = POSTIMG_PATTERN.match(url)
+    if postimg is not None:
+        return "https://postimg.cc/" + postimg.group(1)
+    tweet = TWITTER_PATTERN.match(url)
+    if tweet is not None:
+        return f"https://twitter.com/{tweet.group(1)}/status/{tweet.group(2)}"
+    return url.rstrip("/")
+
+def proof_kind(url: str) -> str:
+    """
+    Returns POSTIMG, TWITTER or OTHER for a proof link (canonical or not).
+    """
+    if POSTIMG_PATTERN.match(url.strip()):
+        return POSTIMG
+    if TWITTER_PATTERN.match(url.strip()):
+        return TWITTER
+    return OTHER
+
+def is_postimg(url: str) -> bool:
+    return proof_kind(url) == POSTIMG
+
+def is_twitter(url: str) -> bool:
+    return proof_kind(url) == TWITTER
+
+def canonical_proofs(proofs: pd.Series) -> pd.Series:
+    """
+    canonical_proof for a whole column. Each distinct link is only normalized once,
+    which matters as most proofs are cited by several rows. Missing values stay missing.
+    """
+    codes, uniques = pd.factorize(proofs)
+    canonical = np.array([canonical_proof(str(url)) for url in uniques] + [None], dtype=object)
+    return pd.Series(canonical[codes], index=proofs.index, dtype=object) # code -1 picks the None
+
+def twitter_dates(proofs: pd.Series) -> pd.DataFrame:
+    """
+    Returns the day, month, two-digit year (UTC) each tweet of a proof column was
+    posted on, decoded from the status IDs with NumPy integer operations over the whole
+    column, without calling the Twitter API. The result is aligned with proofs;
+    links that are not tweets (or tweets older than snowflake IDs) get missing values.
+
+    Example input: https://x.com/UAWeapons/status/1670510694838546436/photo/1
+    Example output: 18, 6, 23
+    """
+    ids = pd.to_numeric(proofs.astype("string").str.strip().str.extract(TWITTER_PATTERN)[1],
+                        errors="coerce").astype("UInt64")
+    valid = (ids >= FIRST_SNOWFLAKE_ID).fillna(False).to_numpy(dtype=bool)
+    millis = (ids.to_numpy(dtype=np.uint64, na_value=0) >> np.uint64(22)) + np.uint64(TWITTER_EPOCH_MS)
+    posted = pd.DatetimeIndex(millis.astype("datetime64[ms]"))
+    dates = pd.DataFrame({"day": posted.day, "month": posted.month, "year": posted.year % 100},
+                         index=proofs.index, dtype="Int16")
+    return dates.where(pd.Series(valid, index=proofs.index), pd.NA)
+
+class ProofIndex:
+    """
+    One row per canonical proof (the table's index), with the columns:
+    kind: POSTIMG, TWITTER or OTHER.
+    rows: the rows citing the proof, as space separated table:id pairs ("ru_losses:12 ua_losses:40").
+    direct_link: the og:image link of a postimg post, if known.
+    day, month, year: the proof's date, with two digit years as in the losses tables.
+    date_source: where the date came from, such as "title" or "ocr".
+
+    ## Parameters
+    table: an index table, such as one loaded by ProofIndex.load; defaults to an empty one.
+    """
+    def __init__(self, table: pd.DataFrame | None = None):
+        if table is None:
+            table = pd.DataFrame(columns=INDEX_COLUMNS, index=pd.Index([], name="proof", dtype=object))
+        self.table = table
+
+    def __len__(self) -> int:
+        return len(self.table.index)
+
+    def __contains__(self, proof: str) -> bool:
+        return canonical_proof(proof) in self.table.index
+
+    @classmethod
+    def load(cls, path: str = INDEX_PATH) -> "ProofIndex":
+        table = pd.read_csv(path, index_col="proof", dtype={"kind": "string", "rows": "string",
+                                                            "direct_link": "string", "date_source": "string"})
+        for col in ("day", "month", "year"):
+            table[col] = table[col].astype("Int16")
+        return cls(table)
+
+    def save(self, path: str = INDEX_PATH):
+        write_csv(self.table.reset_index(), path)
+
+    def _ensure(self, keys: pd.Index):
+        """
+        Adds empty rows for the canonical proofs not in the index yet.
+        """
+        missing = keys.difference(self.table.index)
+        if len(missing) == 0:
+            return
+        added = pd.DataFrame({"kind": [proof_kind(key) for key in missing]},
+                             index=pd.Index(missing, name="proof"))
+        self.table = pd.concat([self.table, added.reindex(columns=INDEX_COLUMNS)])
+
+    def add_rows(self, name: str, df: pd.DataFrame, date_source: str | None = None):
+        """
+        Adds the proofs of a table and the rows citing them. If date_source is given,
+        the table's day, month, year fill the dates the index does not have yet.
+
+        ## Parameters
+        name: label of the table in the rows column, such as ru_losses.
+        df: a table with a proof column, and an id column (otherwise row numbers are used).
+        date_source: the date_source recorded for dates taken from this table.
+        """
+        keys = canonical_proofs(df["proof"])
+        has_proof = keys.notna().to_numpy()
+        keys = keys[has_proof]
+        ids = df["id"] if "id" in df.columns else pd.Series(np.arange(len(df.index)), index=df.index)
+        cited = (name + ":" + ids[has_proof].astype(str)).groupby(keys.to_numpy(), sort=False).agg(" ".join)
+        self._ensure(pd.Index(cited.index))
+        rows = self.table.loc[cited.index, "rows"]
+        self.table.loc[cited.index, "rows"] = rows.where(rows.isna(), rows + " ").fillna("") + cited
+        if date_source is not None and {"day", "month", "year"} <= set(df.columns):
+            dated = df[has_proof].assign(proof=keys.to_numpy()).dropna(subset=["day", "month", "year"])
+            dated = dated.drop_duplicates("proof").set_index("proof")
+            self.add_dates(dated.index, dated["day"], dated["month"], dated["year"], date_source)
+
+    def add_dates(self, proofs, day, month, year, source: str, overwrite: bool = False) -> int:
+        """
+        Sets the dates of the given canonical proofs, all at once.
+        Without overwrite, only proofs with no date yet are set.
+        Returns the number of proofs whose date was set.
+        """
+        proofs = pd.Index(proofs)
+        self._ensure(proofs)
+        new = pd.DataFrame({"day": np.asarray(day, dtype=float), "month": np.asarray(month, dtype=float),
+                            "year": np.asarray(year, dtype=float)}, index=proofs)
+        new = new[~new.index.duplicated(keep="last")]
+        if not overwrite:
+            new = new[self.table.loc[new.index, "year"].isna().to_numpy()]
+        for col in ("day", "month", "year"):
+            self.table[col] = self.table[col].astype("Int16")
+            self.table.loc[new.index, col] = new[col].astype("Int16")
+        self.table["date_source"] = self.table["date_source"].astype("string")
+        self.table.loc[new.index, "date_source"] = source
+        return len(new.index)
+
+    def add_direct_links(self, proofs, links):
+        """
+        Sets the direct image links of the given canonical proofs.
+        """
+        proofs = pd.Index(proofs)
+        self._ensure(proofs)
+        links = pd.Series(np.asarray(links, dtype=object), index=proofs).dropna()
+        links = links[~links.index.duplicated(keep="last")]
+        self.table["direct_link"] = self.table["direct_link"].astype("string")
+        self.table.loc[links.index, "direct_link"] = links
+
+    def get(self, proof: str) -> dict | None:
+        """
+        Returns the index row of a proof as a dict, or None. A hash lookup, not a scan.
+        """
+        key = canonical_proof(proof)
+        if key not in self.table.index:
+            return None
+        return {"proof": key, **self.table.loc[key].to_dict()}
+
+    def join(self, proofs: pd.Series, columns: list[str] | None = None) -> pd.DataFrame:
+        """
+        Returns the index columns for every link of a column, aligned with it
+        (all missing for proofs not in the index).
+        """
+        joined = self.table.reindex(canonical_proofs(proofs).to_numpy(), columns=columns or INDEX_COLUMNS)
+        joined.index = proofs.index
+        return joined
+
+    def fill_dates(self, df: pd.DataFrame) -> int:
+        """
+        Fills the missing day, month, year of a losses table (in place) with the
+        dates the index holds for the same proofs. Returns the number of rows filled.
+        """
+        known = self.join(df["proof"], ["day", "month", "year"])
+        rows = (df[["day", "month", "year"]].isna().any(axis=1) & known["year"].notna()).to_numpy()
+        for col in ("day", "month", "year"):
+            values = pd.to_numeric(df[col], errors="coerce").astype("Int16")
+            values[rows] = known[col][rows]
+            df[col] = values
+        return int(rows.sum())
+
+    def proofs(self, kind: str | None = None) -> list[str]:
+        """
+        Returns the canonical proofs in the index, optionally only those of one kind.
+        """
+        if kind is None:
+            return self.table.index.tolist()
+        return self.table.index[(self.table["kind"] == kind).to_numpy()].tolist()
+
+def build_proof_index(sources: list[tuple[str, str]] = PROOF_SOURCES,
+                      ocr_dates_path: str | None = OCR_DATES_PATH,
+                      direct_links_path: str | None = DIRECT_LINKS_PATH) -> ProofIndex:
+    """
+    Builds the index from every table of sources. Dates come first from the tables'
+    own day, month, year ("title"), then from the legacy date_lost column ("legacy"),
+    then from the OCR output ("ocr"). Tweets still without a date get the day they
+    were posted on ("twitter_id"; see twitter_dates).
+
+    ## Parameters
+    sources: (name, path) of the tables; see PROOF_SOURCES.
+    ocr_dates_path: processed OCR dates (see insert_dates_into_df.main2), or None.
+    direct_links_path: a CSV of proof and direct link columns, or None.
+    """
+    index = ProofIndex()
+    for name, path in sources:
+        if not os.path.exists(path):
+            continue
+        df = pd.read_csv(path)
+        index.add_rows(name, df, date_source="title")
+        if "date_lost" in df.columns:
+            dates = pd.to_datetime(df["date_lost"], errors="coerce")
+            dated = dates.notna().to_numpy()
+            keys = canonical_proofs(df["proof"][dated])
+            index.add_dates(keys, dates[dated].dt.day, dates[dated].dt.month, dates[dated].dt.year % 100, "legacy")
+    if direct_links_path is not None and os.path.exists(direct_links_path):
+        links = pd.read_csv(direct_links_path).dropna(subset=["proof"])
+        index.add_direct_links(canonical_proofs(links["proof"]), links["direct link"])
+    if ocr_dates_path is not None and os.path.exists(ocr_dates_path):
+        # imported here, as insert_dates_into_df itself uses this module
+        from insert_dates_into_df import WAR_START, LAST_COLLECTION_DAY
+        ocr = pd.read_csv(ocr_dates_path).dropna(subset=["proof"])
+        dates = pd.to_datetime(ocr["datetime"], errors="coerce")
+        dated = ((dates > WAR_START) & (dates < LAST_COLLECTION_DAY)).to_numpy()
+        keys = canonical_proofs(ocr["proof"][dated])
+        index.add_dates(keys, dates[dated].dt.day, dates[dated].dt.month, dates[dated].dt.year % 100, "ocr")
+        index.add_direct_links(canonical_proofs(ocr["proof"]), ocr["direct link"])
+    tweets = pd.Series(index.proofs(TWITTER), dtype=object)
+    dates = twitter_dates(tweets).dropna()
+    index.add_dates(tweets[dates.index], dates["day"], dates["month"], dates["year"], "twitter_id")
+    return index
+
+def main(output: str = INDEX_PATH):
+    index = build_proof_index()
+    index.save(output)
+    print(f"{len(index)} proofs: {index.table['kind'].value_counts().to_dict()}, "
+          f"dates by source: {index.table['date_source'].value_counts().to_dict()}")
+
+if __name__ == "__main__":
+    main()
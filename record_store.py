@@ -0,0 +1,186 @@
+"""
+This file contains a compact in-memory store for the losses parsed from an Oryx page.
+
+parse_oryx used to build one 13 element Python list per loss, repeating the same
+type, manufacturer, user and production year strings on every row, and a link such as
+(1, 2, ..., 40, destroyed) added 40 identical rows. LossRecords instead keeps one record
+per link with a count of the losses it stands for, stores every repeated string once
+as an integer code and keeps the numbers in typed arrays.
+Rows are only expanded when the records are exported to a DataFrame.
+
+Row ids are derived from the content of each row (see stable_ids) rather than counted
+from 1, so a loss keeps its id when Oryx inserts entries above it, and rows parsed by
+separate workers or runs line up without a shared counter.
+"""
+
+from array import array
+
+import numpy as np
+import pandas as pd
+import global_vars
+from proof_index import canonical_proofs
+
+CODED_COLUMNS = ["name", "type", "status", "manufacturer", "manufacturer_abbr"]
+"""
+Columns stored as codes into a table of their distinct values.
+"""
+
+NUMBER_COLUMNS = ["day", "month", "year", "year_first_produced"]
+"""
+Columns stored as 16 bit integers, with MISSING standing for no value.
+"""
+
+# Stored in place of a missing number.
+MISSING = -1
+
+LOSS_ID_COLUMNS = ["user", "proof", "name", "status"]
+"""
+Columns that identify a loss, together with its position among the losses sharing them.
+"""
+
+DONATION_ID_COLUMNS = ["recipient", "proof", "vehicle_name", "supplier"]
+"""
+Columns that identify a donation, together with its position among the donations sharing them.
+is_delivered is left out, so a pledge keeps its id once it is delivered.
+"""
+
+def _number(value) -> int:
+    """
+    Turns a day, month, year or production year into its stored form.
+
+    Example input: 1978.0
+    Example output: 1978
+    """
+    if value is None or pd.isna(value):
+        return MISSING
+    return int(value)
+
+def stable_ids(df: pd.DataFrame, columns: list[str] = LOSS_ID_COLUMNS) -> np.ndarray:
+    """
+    Returns a 63 bit id for every row of a table, hashed from the row's columns
+    (the proof in its canonical form) and its position among the earlier rows with the
+    same values. The n-th destroyed T-72B3 of a proof gets the same id in every run,
+    whatever comes before it on the page. Hashed with pandas' vectorized SipHash.
+
+    Example input: the rows (Russia, https://postimg.cc/jdFBJdQb, T-55, damaged) twice
+    Example output: two different ids, the same ones every time
+
+    ## Parameters
+    df: a losses table, or a donations table with columns=DONATION_ID_COLUMNS.
+    columns: the columns identifying a row; must include proof.
+    """
+    keys = pd.DataFrame({col: df[col].astype("string").to_numpy(dtype=object, na_value=None)
+                         for col in columns})
+    keys["proof"] = canonical_proofs(keys["proof"]).to_numpy()
+    keys["position"] = keys.groupby(columns, sort=False, dropna=False).cumcount().to_numpy()
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return (hashes >> np.uint64(1)).astype(np.int64)
+
+class LossRecords:
+    """
+    Column store of the (number, status) links of one Oryx page.
+    Every record stands for `count` losses that share a name, type, status,
+    manufacturer, proof, date and production year.
+
+    ## Parameters
+    user: Russia or Ukraine; the same for every record of a page.
+    """
+    def __init__(self, user: str):
+        self.user = user
+        self.user_abbr = global_vars.manufacturer_dict[user]
+        self.categories = {col: [] for col in CODED_COLUMNS} # distinct values, in order seen
+        self.lookup = {col: {} for col in CODED_COLUMNS} # {value: code}
+        self.codes = {col: array("i") for col in CODED_COLUMNS}
+        self.numbers = {col: array("h") for col in NUMBER_COLUMNS}
+        self.counts = array("I")
+        self.proofs = []
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def total(self) -> int:
+        """
+        Returns the number of losses (rows once exported) the records stand for.
+        """
+        return sum(self.counts)
+
+    def _code(self, col: str, value) -> int:
+        if value is None:
+            return MISSING
+        lookup = self.lookup[col]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.categories[col])
+            self.categories[col].append(value)
+        return code
+
+    def append(self, name: str, vehicle_type: str, status: str, manufacturer: str | None,
+               manufacturer_abbr: str | None, proof: str, year_first_produced=None,
+               count: int = 1, date: tuple = (None, None, None)):
+        """
+        Adds a record standing for `count` losses. date is (day, month, year).
+        """
+        for col, value in zip(CODED_COLUMNS, (name, vehicle_type, status, manufacturer, manufacturer_abbr)):
+            self.codes[col].append(self._code(col, value))
+        for col, value in zip(NUMBER_COLUMNS, (*date, year_first_produced)):
+            self.numbers[col].append(_number(value))
+        self.counts.append(count)
+        self.proofs.append(proof)
+
+    def take(self, indices: list[int], counts: list[int]) -> "LossRecords":
+        """
+        Returns a new store holding the records at `indices`, with new counts.
+        """
+        taken = LossRecords(self.user)
+        for col in CODED_COLUMNS:
+            taken.categories[col] = list(self.categories[col])
+            taken.lookup[col] = dict(self.lookup[col])
+            taken.codes[col] = array("i", (self.codes[col][i] for i in indices))
+        for col in NUMBER_COLUMNS:
+            taken.numbers[col] = array("h", (self.numbers[col][i] for i in indices))
+        taken.counts = array("I", counts)
+        taken.proofs = [self.proofs[i] for i in indices]
+        return taken
+
+    def undated_proofs(self) -> list:
+        """
+        Returns the distinct proofs of the records that have no year, in the order seen.
+        """
+        year = self.numbers["year"]
+        return list(dict.fromkeys(proof for i, proof in enumerate(self.proofs) if year[i] == MISSING))
+
+    def set_dates(self, dates: dict):
+        """
+        Sets the day, month, year of every record whose proof is a key of
+        dates ({proof: (day, month, year)}).
+        """
+        day, month, year = (self.numbers[col] for col in ("day", "month", "year"))
+        for i, proof in enumerate(self.proofs):
+            date = dates.get(proof)
+            if date is not None:
+                day[i], month[i], year[i] = (_number(value) for value in date)
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Expands the records into one row per loss, with the global_vars.df_colnames
+        columns and ids from stable_ids. Text columns become categoricals
+        built straight from the stored codes.
+        """
+        counts = np.frombuffer(self.counts, dtype=np.uint32) if len(self) else np.zeros(0, dtype=np.uint32)
+        def expand(values: array, dtype) -> np.ndarray:
+            values = np.frombuffer(values, dtype=dtype) if len(values) else np.zeros(0, dtype=dtype)
+            return np.repeat(values, counts)
+        total = int(counts.sum())
+        columns = {}
+        for col in CODED_COLUMNS:
+            columns[col] = pd.Categorical.from_codes(expand(self.codes[col], np.int32),
+                                                     categories=pd.Index(self.categories[col], dtype=object))
+        for col in NUMBER_COLUMNS:
+            values = expand(self.numbers[col], np.int16)
+            columns[col] = pd.arrays.IntegerArray(values, values == MISSING)
+        for col, value in (("user", self.user), ("user_abbr", self.user_abbr)):
+            columns[col] = pd.Categorical.from_codes(np.zeros(total, dtype=np.int8), categories=[value])
+        columns["proof"] = np.repeat(np.array(self.proofs, dtype=object), counts)
+        df = pd.DataFrame(columns)
+        df["id"] = stable_ids(df)
+        return df[global_vars.df_colnames]
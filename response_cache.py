@@ -0,0 +1,260 @@
+"""
+This file contains a persistent on-disk cache for the pages the pipeline downloads.
+
+A postimg post never changes once published, so the parsed parts of each page
+(title, og:image, status code) are stored once per normalized link and reused
+on every later run. The Oryx articles do change, so they are stored in full
+and revalidated with ETag/Last-Modified once their TTL runs out.
+The cache is a single SQLite file with size-based LRU eviction.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+import requests
+
+from head_extractor import fetch_head
+from http_client import FetchClient, get_default_client
+from metrics import get_default_metrics
+from proof_index import canonical_proof
+
+CACHE_PATH = "cache/responses.sqlite3"
+# Once the cache grows past this many bytes, least recently used entries are dropped.
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+# How many seconds a cached Oryx article is trusted before it is revalidated.
+ARTICLE_TTL = 60 * 60
+# Statuses of deleted posts. They are cached like a page without a title or image,
+# so that a deleted post is not asked for again on every run.
+GONE_STATUSES = (404, 410)
+# Cache hits whose last access time is held in memory before being written in one commit.
+ACCESS_BATCH = 256
+
+CachedResponse = namedtuple("CachedResponse",
+                            ["url", "status", "title", "og_image", "etag", "last_modified",
+                             "body", "fetched_at", "expires_at"])
+"""
+One cache entry. expires_at is None for entries that never go stale (postimg posts).
+"""
+
+class ResponseCache:
+    """
+    SQLite-backed store of CachedResponse entries, safe to share between threads.
+
+    ## Parameters
+    path: location of the SQLite file. Its folder is created if needed.
+    max_bytes: size budget; see evict().
+    """
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = MAX_CACHE_BYTES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                url TEXT PRIMARY KEY,
+                                status INTEGER,
+                                title TEXT,
+                                og_image TEXT,
+                                etag TEXT,
+                                last_modified TEXT,
+                                body BLOB,
+                                fetched_at REAL,
+                                expires_at REAL,
+                                last_access REAL,
+                                size INTEGER)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.accessed = {} # url -> last access time not written yet
+
+    def _write_access(self):
+        """
+        Writes the buffered last access times in one commit. The lock must be held.
+        """
+        if self.accessed:
+            self.conn.executemany("UPDATE responses SET last_access = ? WHERE url = ?",
+                                  [(accessed, url) for url, accessed in self.accessed.items()])
+            self.conn.commit()
+            self.accessed = {}
+
+    def get(self, url: str) -> CachedResponse | None:
+        """
+        Returns the entry stored for a link (stale or not), or None.
+        The access time used for eviction is written in batches of ACCESS_BATCH.
+        """
+        key = canonical_proof(url)
+        with self.lock:
+            row = self.conn.execute("""SELECT url, status, title, og_image, etag, last_modified,
+                                       body, fetched_at, expires_at
+                                       FROM responses WHERE url = ?""", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                get_default_metrics().inc("cache_lookups", result="miss")
+                return None
+            self.hits += 1
+            get_default_metrics().inc("cache_lookups", result="hit")
+            self.accessed[key] = time.time()
+            if len(self.accessed) >= ACCESS_BATCH:
+                self._write_access()
+        return CachedResponse(*row)
+
+    def put(self, url: str, status: int, title: str | None = None, og_image: str | None = None,
+            body: bytes | None = None, etag: str | None = None, last_modified: str | None = None,
+            ttl: float | None = None):
+        """
+        Stores an entry for a link, replacing any older one.
+        ttl is the number of seconds before the entry is considered stale; None means never.
+        """
+        key = canonical_proof(url)
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        size = len(key) + len(title or "") + len(og_image or "") + len(body or b"")
+        with self.lock:
+            self.accessed.pop(key, None)
+            self.conn.execute("""INSERT OR REPLACE INTO responses
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                              (key, status, title, og_image, etag, last_modified,
+                               body, now, expires_at, now, size))
+            self.conn.commit()
+        self.evict()
+
+    def touch(self, url: str, ttl: float | None):
+        """
+        Marks an entry as fresh again after a 304 Not Modified answer.
+        """
+        now = time.time()
+        expires_at = None if ttl is None else now + ttl
+        key = canonical_proof(url)
+        with self.lock:
+            self.accessed.pop(key, None)
+            self.conn.execute("UPDATE responses SET fetched_at = ?, expires_at = ?, last_access = ? WHERE url = ?",
+                              (now, expires_at, now, key))
+            self.conn.commit()
+
+    def total_bytes(self) -> int:
+        """
+        Returns the combined size of all entries.
+        """
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def evict(self):
+        """
+        Drops the least recently used entries until the cache fits in max_bytes.
+        """
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return
+        with self.lock:
+            self._write_access()
+            rows = self.conn.execute("SELECT url, size FROM responses ORDER BY last_access").fetchall()
+            dropped = []
+            for url, size in rows:
+                if total <= self.max_bytes:
+                    break
+                dropped.append((url,))
+                total -= size
+            self.conn.executemany("DELETE FROM responses WHERE url = ?", dropped)
+            self.conn.commit()
+
+    def hit_rate(self) -> float:
+        """
+        Returns the fraction of get() calls that found an entry.
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def close(self):
+        with self.lock:
+            self._write_access()
+            self.conn.close()
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache() -> ResponseCache:
+    """
+    Returns the cache shared by every fetcher in the pipeline, opening it on first use.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+def fetch_page_info(url: str, cache: ResponseCache | None = None,
+                    client: FetchClient | None = None) -> CachedResponse:
+    """
+    Returns the title and og:image of a page, downloading it only if the cache
+    does not already hold it. Both come from one streamed read of the page's <head>.
+    2xx answers are cached, and so are GONE_STATUSES, with no title or og:image.
+    Any other status (such as 429, 403 or 5xx) raises requests.HTTPError, so that
+    the crawl journal records the link as failed and retries it later.
+    Network errors are left to the caller.
+
+    ## Parameters
+    url: a link to a postimg post (or any other page that never changes).
+    cache: the cache to use; defaults to get_default_cache().
+    client: the HTTP client to use; defaults to get_default_client().
+    """
+    cache = cache or get_default_cache()
+    client = client or get_default_client()
+    cached = cache.get(url)
+    # caches written before only these answers were kept may still hold a 429 or 403
+    if cached is not None and (200 <= cached.status < 300 or cached.status in GONE_STATUSES) and \
+            (cached.expires_at is None or cached.expires_at > time.time()):
+        return cached
+
+    head = fetch_head(url, client)
+    og_image = head.og.get("og:image")
+    if head.status in GONE_STATUSES:
+        cache.put(url, head.status)
+        return CachedResponse(canonical_proof(url), head.status, None, None,
+                              None, None, None, time.time(), None)
+    # 429, 403 or 5xx answers may go away on their own, so they are never remembered.
+    if not 200 <= head.status < 300:
+        raise requests.HTTPError(f"{head.status} Error for url: {url}")
+    cache.put(url, head.status, title=head.title, og_image=og_image)
+    return CachedResponse(canonical_proof(url), head.status, head.title, og_image,
+                          None, None, None, time.time(), None)
+
+def fetch_article(url: str, cache: ResponseCache | None = None, ttl: float = ARTICLE_TTL,
+                  client: FetchClient | None = None) -> bytes:
+    """
+    Returns the raw HTML of an Oryx article.
+    A cached copy younger than ttl seconds is returned as is; an older one is
+    revalidated with If-None-Match/If-Modified-Since and only re-downloaded
+    if Oryx has changed the page since.
+
+    ## Parameters
+    url: a link to an Oryx blog page.
+    cache: the cache to use; defaults to get_default_cache().
+    ttl: how many seconds a cached copy is trusted without asking the server.
+    client: the HTTP client to use; defaults to get_default_client().
+    """
+    cache = cache or get_default_cache()
+    client = client or get_default_client()
+    cached = cache.get(url)
+    if cached is not None and cached.body is not None:
+        if cached.expires_at is not None and cached.expires_at > time.time():
+            return cached.body
+
+    headers = {}
+    if cached is not None and cached.body is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+    r = client.get(url, headers=headers)
+    if r.status_code == 304:
+        cache.touch(url, ttl)
+        return cached.body
+    r.raise_for_status()
+    cache.put(url, r.status_code, body=r.content, etag=r.headers.get("ETag"),
+              last_modified=r.headers.get("Last-Modified"), ttl=ttl)
+    return r.content
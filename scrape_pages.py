@@ -0,0 +1,78 @@
+"""
+This file runs the scrapes of every Oryx page in global_vars.oryx_pages at the same time.
+
+main_old scraped the RU page and then the UA page, and the donations page had its own
+entry point. Here each page is scraped in its own thread. The threads share the HTTP
+client, response cache and crawl journal (and so the per-host rate limits), so a
+refresh takes about as long as the slowest page instead of the sum of all of them.
+No output is written until every page has been scraped, and each output is written
+through a temporary file, so a failed run leaves the previous outputs as they were.
+
+Usage: python scrape_pages.py (full scrape) or python scrape_pages.py --incremental
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import global_vars
+from oryx_parser import parse_oryx_concurrent, incremental_update
+from donations_parser import parse_oryx_donations, diff_donations, CHANGES_PATH
+from date_normalization import normalize_dates
+from storage import save_losses, write_csv
+from metrics import get_default_metrics
+
+def scrape_page(page: dict, incremental: bool = False) -> pd.DataFrame:
+    """
+    Scrapes one page of global_vars.oryx_pages and returns its DataFrame, unsaved.
+
+    ## Parameters
+    page: an entry of global_vars.oryx_pages.
+    incremental: for loss pages, only look up the losses missing from page["output"]
+    (see oryx_parser.incremental_update) instead of scraping everything again.
+    """
+    if page["kind"] == "donations":
+        return parse_oryx_donations(page["link"], page["user"], page["vehicle_types"], output=None)
+    if incremental:
+        return incremental_update(page["output"], page["link"], page["user"],
+                                  page["vehicle_types"], save=False)
+    records, twitter_link_count, twitter_links_list = parse_oryx_concurrent(page["link"], page["user"],
+                                                                            page["vehicle_types"])
+    df = records.to_dataframe()
+    print(f"{page['name']} date fixes: {normalize_dates(df)}")
+    return df
+
+def scrape_pages(pages: list[dict] | None = None, incremental: bool = False,
+                 max_workers: int | None = None) -> dict:
+    """
+    Scrapes every page concurrently, then writes every output.
+    Returns a dict of {page name: DataFrame}. If any page fails, its error is
+    raised and nothing is written. The run's metrics are written to metrics.METRICS_PATH.
+
+    ## Parameters
+    pages: entries like those of global_vars.oryx_pages; defaults to all of them.
+    incremental: passed on to scrape_page.
+    max_workers: the number of pages scraped at once; defaults to all of them.
+    """
+    pages = global_vars.oryx_pages if pages is None else pages
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or len(pages)) as pool:
+        futures = {page["name"]: pool.submit(scrape_page, page, incremental) for page in pages}
+        results = {name: future.result() for name, future in futures.items()}
+    print(f"Scraped {len(pages)} pages in {time.perf_counter() - start_time:.1f} s")
+
+    for page in pages:
+        if page["kind"] == "donations":
+            previous = pd.read_csv(page["output"]) if os.path.exists(page["output"]) else None
+            write_csv(diff_donations(results[page["name"]], previous), CHANGES_PATH)
+            write_csv(results[page["name"]], page["output"])
+        else:
+            results[page["name"]] = save_losses(results[page["name"]], page["output"])
+    print(get_default_metrics().summary())
+    get_default_metrics().dump()
+    return results
+
+if __name__ == "__main__":
+    scrape_pages(incremental="--incremental" in sys.argv[1:])
@@ -0,0 +1,119 @@
+"""
+This file contains a store of compressed Oryx article snapshots, so the parsers
+can run offline on archived pages instead of the live site.
+
+Every time an article is fetched and its content differs from the newest saved copy,
+it is saved as snapshots/<page name>/<fetch time>.html.gz. read_article turns any of
+a link, a saved file, raw bytes or a folder of snapshots into the article's HTML, which
+lets a historical CSV be rebuilt from the page as it was on a given date, and lets the
+parsing stage be profiled separately from the network.
+"""
+
+import gzip
+import hashlib
+import os
+import re
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from response_cache import fetch_article
+
+SNAPSHOT_DIR = "snapshots"
+# Format of the fetch time in snapshot file names (UTC).
+TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+SNAPSHOT_PATTERN = re.compile(r"^(\d{8}T\d{6}Z)\.html(\.gz)?$")
+
+def page_name(link: str) -> str:
+    """
+    Returns the folder name used for the snapshots of a page.
+
+    Example input: https://www.oryxspioenkop.com/2022/02/attack-on-europe-documenting-equipment.html
+    Example output: attack-on-europe-documenting-equipment
+    """
+    path = urlsplit(link).path.rstrip("/")
+    name = os.path.basename(path)
+    return os.path.splitext(name)[0] or urlsplit(link).netloc
+
+def list_snapshots(directory: str) -> list[tuple[datetime, str]]:
+    """
+    Returns the (fetch time, path) of every snapshot in a folder, oldest first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for file_name in os.listdir(directory):
+        match = SNAPSHOT_PATTERN.match(file_name)
+        if match is not None:
+            fetched_at = datetime.strptime(match.group(1), TIME_FORMAT).replace(tzinfo=timezone.utc)
+            snapshots.append((fetched_at, os.path.join(directory, file_name)))
+    return sorted(snapshots)
+
+def load_snapshot(path: str) -> bytes:
+    """
+    Returns the HTML stored in a snapshot or any other saved page (.gz or not).
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return f.read()
+
+def save_snapshot(html: bytes, link: str, fetched_at: datetime | None = None,
+                  root: str = SNAPSHOT_DIR) -> str:
+    """
+    Saves a compressed copy of an article unless the newest snapshot of that page
+    already holds the same content. Returns the path of the snapshot holding it.
+
+    ## Parameters
+    html: the raw HTML of the article.
+    link: the link the article was fetched from; decides the folder.
+    fetched_at: when the article was fetched; defaults to now.
+    root: the folder holding one subfolder per page.
+    """
+    directory = os.path.join(root, page_name(link))
+    snapshots = list_snapshots(directory)
+    if snapshots:
+        newest = snapshots[-1][1]
+        if hashlib.sha256(load_snapshot(newest)).digest() == hashlib.sha256(html).digest():
+            return newest
+    os.makedirs(directory, exist_ok=True)
+    fetched_at = fetched_at or datetime.now(timezone.utc)
+    path = os.path.join(directory, fetched_at.astimezone(timezone.utc).strftime(TIME_FORMAT) + ".html.gz")
+    # write to a temporary file first so a crash never leaves half a snapshot behind
+    with gzip.open(path + ".tmp", "wb") as f:
+        f.write(html)
+    os.replace(path + ".tmp", path)
+    return path
+
+def read_article(source: str | bytes | os.PathLike, at: datetime | None = None,
+                 root: str = SNAPSHOT_DIR) -> bytes:
+    """
+    Returns the raw HTML of an Oryx article from any of these sources:
+    - bytes: the HTML itself.
+    - a link: fetched through the response cache and saved as a snapshot.
+    - a file path: a saved page, gzipped or not.
+    - a folder of snapshots: the newest one fetched at or before `at`
+      (the newest overall if `at` is None).
+
+    ## Parameters
+    source: the article to read.
+    at: the point in time to replay when source is a snapshot folder.
+    root: the folder live fetches are saved into.
+    """
+    if isinstance(source, bytes):
+        return source
+    source = os.fspath(source)
+    if source.startswith(("http://", "https://")):
+        html = fetch_article(source)
+        save_snapshot(html, source, root=root)
+        return html
+    if os.path.isdir(source):
+        snapshots = list_snapshots(source)
+        if at is not None:
+            if at.tzinfo is None:
+                at = at.replace(tzinfo=timezone.utc)
+            snapshots = [snapshot for snapshot in snapshots if snapshot[0] <= at]
+        if not snapshots:
+            raise FileNotFoundError(f"No snapshot in {source} fetched at or before {at}")
+        return load_snapshot(snapshots[-1][1])
+    if os.path.isfile(source):
+        return load_snapshot(source)
+    raise FileNotFoundError(f"{source} is not a link, a saved page or a snapshot folder")
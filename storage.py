@@ -0,0 +1,121 @@
+"""
+This file contains the storage layer every stage uses to load and save the losses tables.
+
+Round-tripping the tables through plain CSV turned day, month and year back into
+float64, kept every name and status as a separate Python string and, whenever a stage
+forgot index=False, added another "Unnamed: 0.x" column. Here every table goes through
+one schema based on global_vars.df_colnames: categoricals for the repeated text columns,
+nullable small integers for the numbers and a real datetime column for date_lost.
+
+When pyarrow is installed, each table is saved as a Parquet file (data/ru_losses.parquet),
+which keeps those types and loads several times faster. The CSV next to it is still
+written for readers of the published dataset, and is the only format used without pyarrow.
+"""
+
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError: # Parquet support is optional; fall back to CSV only
+    pyarrow = None
+
+LOSSES_DTYPES = {"id": "Int64", # see record_store.stable_ids
+                 "name": "category",
+                 "type": "category",
+                 "status": "category",
+                 "day": "Int8",
+                 "month": "Int8",
+                 "year": "Int16", # Int16 as raw titles can still hold 4 digit years
+                 "manufacturer": "category",
+                 "manufacturer_abbr": "category",
+                 "user": "category",
+                 "user_abbr": "category",
+                 "proof": "string",
+                 "year_first_produced": "Int16"}
+"""
+The type of every column in global_vars.df_colnames, in the same order.
+"""
+
+DATE_COLUMN = "date_lost"
+# Also write a CSV next to every Parquet file.
+KEEP_CSV = True
+
+def parquet_path(path: str) -> str:
+    """
+    Returns the Parquet file kept next to a CSV.
+
+    Example input: data/ru_losses.csv
+    Example output: data/ru_losses.parquet
+    """
+    return os.path.splitext(path)[0] + ".parquet"
+
+def write_csv(df: pd.DataFrame, path: str):
+    """
+    Writes a DataFrame to a CSV without its index, through a temporary file
+    so that a crash never leaves half a table behind.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+def apply_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns a copy of a losses DataFrame with the LOSSES_DTYPES types, a datetime
+    date_lost column (if it has one) and no leftover "Unnamed: 0" index columns.
+    The df_colnames columns come first, in order; other columns are kept as they are.
+    """
+    columns = [col for col in df.columns if not str(col).startswith("Unnamed: ")]
+    df = df[[col for col in LOSSES_DTYPES if col in columns] +
+            [col for col in columns if col not in LOSSES_DTYPES]]
+    columns = {}
+    for col, dtype in LOSSES_DTYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype.startswith("Int"):
+            columns[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+        else:
+            columns[col] = df[col].astype(dtype)
+    if DATE_COLUMN in df.columns:
+        columns[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN], errors="coerce")
+    return df.assign(**columns)
+
+def load_losses(path: str) -> pd.DataFrame:
+    """
+    Loads a losses table saved by save_losses (or any losses CSV), typed with apply_schema.
+    The Parquet copy is read if pyarrow is installed and it is at least as new as the CSV.
+
+    ## Parameters
+    path: path to the CSV, such as data/ru_losses.csv.
+    """
+    parquet = parquet_path(path)
+    if pyarrow is not None and os.path.exists(parquet) and \
+            (not os.path.exists(path) or os.path.getmtime(parquet) >= os.path.getmtime(path)):
+        return pd.read_parquet(parquet)
+    dtypes = {col: dtype for col, dtype in LOSSES_DTYPES.items() if dtype == "category"}
+    return apply_schema(pd.read_csv(path, dtype=dtypes))
+
+def save_losses(df: pd.DataFrame, path: str, csv: bool = KEEP_CSV) -> pd.DataFrame:
+    """
+    Saves a losses table as Parquet (if pyarrow is installed) and CSV, without its index.
+    Each file is written to a temporary name first so that a crash never leaves
+    half a table behind. Returns the typed DataFrame that was saved.
+
+    ## Parameters
+    df: a losses DataFrame.
+    path: path to the CSV, such as data/ru_losses.csv.
+    csv: whether to write the CSV when the Parquet file is written too.
+    """
+    df = apply_schema(df)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if csv or pyarrow is None:
+        write_csv(df, path)
+    # written last so that load_losses sees it as at least as new as the CSV
+    if pyarrow is not None:
+        parquet = parquet_path(path)
+        df.to_parquet(parquet + ".tmp", index=False)
+        os.replace(parquet + ".tmp", parquet)
+    return df